@@ -20,31 +20,64 @@ found on the online at https://hallPy.fofandi.dev.
 Submodules
 ----------
 + experiments/
++ analysis
++ columnStore
++ instrumentRegistry
++ safety
++ resilience
++ archive
++ experimentQueue
++ scheduler
++ measurementProfiles
++ replay
++ trace
++ discovery
++ broadcast
++ experimentRegistry
++ background
++ oversampling
++ runCatalogue
++ reprocess
++ sweepPlan
++ simulation
++ soak
 
 """
-import re
+import importlib
+import threading
 
 import pyvisa
-from .experiments import curieWeiss, hallEffect
+from . import analysis, columnStore
 from IPython.core.display import display
 from IPython.display import clear_output
 import ipywidgets as widgets
 
 from .constants import supportedInstruments, serialRegex
 from .helper import reconnectInstructions, getInstTypeCount, filterArrByKey
+from .instrumentRegistry import InstrumentRecord, InstrumentRegistry
+from .discovery import discoverLANResources, forgetLANResource
+from .experimentRegistry import builtInExperiments, findExperiments
 
-allExperiments = [
-    curieWeiss,
-    hallEffect,
-]
 
+def __getattr__(name):
+    # The built-in experiments import the sweep engine, the run catalogue and the LAN discovery, so they are only
+    # imported when they are used: `allExperiments` lists them as experimentRegistry entries, which import their
+    # module the first time one of its functions is used
+    if name == "allExperiments":
+        return findExperiments(experimentDirs=[], includeEntryPoints=False)
+    if "HallPy_Teach.experiments." + name in builtInExperiments:
+        return importlib.import_module("HallPy_Teach.experiments." + name)
+    raise AttributeError("module '" + __name__ + "' has no attribute '" + name + "'")
 
-def initInstruments(inGui: bool = False):
+
+def initInstruments(inGui: bool = False, resourceManager=None, lanDiscovery=None):
     """Initializing and recognising connected equipment.
 
     Function does the setup for any of the experiments which use this HallPy_Teach. It recognises the connected
     instruments and provides the instruments in the form of the `inst` object. It also classifies the equipment by their
     uses depending on the manufacturer & model. Equipment is queried using the pyvisa library (`inst.query("*IDN?")`).
+    The `*IDN?` response of every instrument is parsed once into an InstrumentRecord, and the records are returned in an
+    InstrumentRegistry indexed by type, serial number and model.
 
     The list of supported instruments is in the constants' module (mentioned in the See Also section).
 
@@ -52,16 +85,26 @@ def initInstruments(inGui: bool = False):
     ----------
     inGui: bool, default=False
         Bool to check if gui is being used (if using Setup() the whole experiment setup process is done via GUI)
+    resourceManager: object, optional
+        Resource manager used to find and open the instruments. Defaults to a new pyvisa.ResourceManager(). Use
+        trace.TraceRecorder.resourceManager() to record the instrument traffic or trace.ReplayResourceManager to replay
+        a recorded trace.
+    lanDiscovery: bool, optional
+        Also look for LAN / LXI instruments announced with mDNS (see discovery.discoverLANResources()). The discovery
+        runs while the local resources are listed and the found instruments are classified like all others. Defaults to
+        True with a pyvisa.ResourceManager and False with any other resource manager (eg.: a replayed trace).
 
     See Also
     --------
     + constants.supportedEquipment : Used to classify instrument
     + Setup() : Used to use library with GUI in Jupyter Notebook / Lab
+    + instrumentRegistry.InstrumentRegistry : Returned registry of instruments
 
     Returns
     -------
-    list[object]
-        Array of objects containing information about the connected instruments
+    InstrumentRegistry
+        Registry of InstrumentRecords containing information about the connected instruments. The registry can be used
+        like a list and each record like the objects shown in the example.
 
     Examples
     --------
@@ -90,9 +133,21 @@ def initInstruments(inGui: bool = False):
         }
     ]
     """
-    rm = pyvisa.ResourceManager()
-    resList = rm.list_resources()
-    instruments = []
+    rm = resourceManager if resourceManager is not None else pyvisa.ResourceManager()
+    if lanDiscovery is None:
+        lanDiscovery = isinstance(rm, pyvisa.ResourceManager)
+
+    # Looking for LAN instruments on a separate thread while the local resources are listed
+    lanResList = []
+    lanThread = None
+    if lanDiscovery:
+        lanThread = threading.Thread(target=lambda: lanResList.extend(discoverLANResources()), daemon=True)
+        lanThread.start()
+    resList = list(rm.list_resources())
+    if lanThread is not None:
+        lanThread.join()
+        resList += [res for res in lanResList if res not in resList]
+    instruments = InstrumentRegistry()
 
     # Looping through all connected USB devices to look for usable instruments
     for res in resList:
@@ -104,29 +159,17 @@ def initInstruments(inGui: bool = False):
             # another USB device
             name = instResource.query("*IDN?")
 
-            # Creating the instrument object to be used in the rest of the library
-            inst = {
-                "inst": instResource,
-                "name": name,
-                "resName": res
-            }
-
-            # Defining instrument type (see supported instruments in hp.constants.supportedInstruments)
-            for instrumentType in supportedInstruments.keys():
-                for supportedInstrumentName in supportedInstruments[instrumentType]:
-                    if supportedInstrumentName in name:
-                        inst['type'] = instrumentType
+            # Creating the instrument record to be used in the rest of the library. The type is defined from
+            # hp.constants.supportedInstruments, and is 'Unknown' if the instrument cannot be classified
+            inst = InstrumentRecord.fromIDN(name, res, instResource)
 
-            # Defining instrument type as Unknown if instrument cannot be classified
-            if len(inst.keys()) == 3:
-                inst["type"] = "Unknown"
-
-            # Adding instrument to the list of all instruments usable by HallPy_Teach_uofgPhys
-            instruments.append(inst)
+            # Adding instrument to the registry of all instruments usable by HallPy_Teach_uofgPhys
+            instruments.add(inst)
 
         # Error indicates that the USB device is incompatible with PyVisa
         except pyvisa.VisaIOError:
-            pass
+            if res in lanResList:
+                forgetLANResource(res)
         finally:
             pass
 
@@ -171,6 +214,8 @@ class Setup:
         Notes
         -------
         Use classInstanceName.expInsts in doExperiment() function to perform given experiment.
+        The experiments to pick from are found with experimentRegistry.findExperiments(experimentDirs), so experiment
+        files in the working directory (or in the directories given with the experimentDirs argument) are listed too.
 
         Example
         ------
@@ -189,11 +234,12 @@ class Setup:
         >>> data = Experiment.doExperiment(expInsts)
         """
 
-    def __init__(self, btn=None):
+    def __init__(self, btn=None, experimentDirs=None):
 
-        # Getting all experiments in the library
+        # Getting all experiments: the ones in the library, registered by other packages and in local experiment files.
+        # Only their names and required equipment are read here, the picked experiment is imported when it is set up.
         expChoices = []
-        for experiment in allExperiments:
+        for experiment in findExperiments(experimentDirs):
             expChoices.append((experiment.expName, experiment))
 
         # Setting up UI buttons and dropdowns for later use
@@ -234,15 +280,10 @@ class Setup:
             if len(expReq[instType]) > 1:
                 print("Assign", instType + "(s)")
                 availableSerials = []
-                for inst in filterArrByKey(availableInsts, "type", instType):
-                    regex = ""
-                    for instPartialName in serialRegex.keys():
-                        if instPartialName in inst["name"]:
-                            regex = serialRegex[instPartialName]
-                    if regex == "":
+                for inst in InstrumentRegistry.fromInstruments(availableInsts).byType(instType):
+                    if inst.serial == "":
                         raise Exception("Regular expression not defined for given instrument")
-                    serial = re.search(regex, inst["name"]).group()
-                    availableSerials.append((serial, serial))
+                    availableSerials.append((inst.serial, inst.serial))
 
                 for neededInst in expReq[instType]:
                     instSerialDropdown = widgets.Dropdown(
@@ -0,0 +1,435 @@
+"""
+HallPy_Teach.analysis: batch analysis of data collected with the HallPy_Teach experiments
+=========================================================================================
+
+Description
+-----------
+Functions in this module fit every electromagnet sweep of a Hall Effect data set at once with numpy, instead of
+looping over `data[str(emV)]` by hand. The fits are done with grouped sums (np.bincount), so a data set with many
+sweeps costs a handful of vectorised numpy calls. The Curie Weiss law is fitted with an online estimator which can
+also be updated point by point during data collection.
+
+See Also
+--------
++ fitHallSweeps(*args)
++ analyseHallFiles(*args)
++ CurieWeissEstimator
++ fitCurieWeiss(*args)
+
+"""
+import numpy as np
+
+from .archive import ArchiveReader
+from .constants import elementaryCharge
+from .helper import getDataFromFile
+
+
+def loadHallDataset(source):
+    """Load a Hall Effect data set from memory or from file
+
+    Parameters
+    ----------
+    source : dict or numpy.ndarray or str
+        One of the following:
+            - Data object returned by hallEffect.doExperiment() or getDataFromFile()
+            - Flat data set: structured array (or dict of equal length arrays) with an 'emVolt' column
+            - File name of a '.p' file saved by doExperiment(), a '.hpz' archive (see archive.exportArchive()), or a
+              '.npy' / '.npz' file holding a flat data set. '.npy' files are memory-mapped so only the needed columns
+              are read from disk.
+        Only the first Hall bar of a multi bar data set is loaded, use hallEffect.getHallBarData() for the others.
+
+    Returns
+    -------
+    dict or numpy.ndarray
+        Data set which can be passed to flattenHallDataset()
+    """
+    if isinstance(source, str):
+        if source.endswith(".npy"):
+            return np.load(source, mmap_mode="r")
+        if source.endswith(".npz"):
+            return np.load(source)
+        if source.endswith(".hpz"):
+            with ArchiveReader(source) as archive:
+                return {group: archive.readGroup(group, columns=["supplyCurr", "hallBarVolt"])
+                        for group in archive.groups() if "/" not in group}
+        return getDataFromFile(source)
+
+    return source
+
+
+def flattenHallDataset(data):
+    """Flatten a Hall Effect data set into equal length columns
+
+    Parameters
+    ----------
+    data : dict or numpy.ndarray
+        Data set as accepted by loadHallDataset()
+
+    Returns
+    -------
+    dict[str, numpy.ndarray]
+        Object with keys 'emVolt', 'sweep', 'supplyCurr', 'hallBarVolt' holding one value per data point and 'emCurr'
+        holding one value per sweep. 'sweep' is the index of the sweep (into the sorted 'emVolt' values) for each point.
+    """
+    fieldNames = getattr(getattr(data, "dtype", None), "names", None)
+    if fieldNames is not None or "emVolt" in data.keys():
+        emVoltCol = np.asarray(data["emVolt"], dtype=float)
+        emVolts, sweepIndex = np.unique(emVoltCol, return_inverse=True)
+        emCurrCol = np.asarray(data["emCurr"], dtype=float)
+        emCurr = np.bincount(sweepIndex, emCurrCol, minlength=len(emVolts)) / np.bincount(sweepIndex,
+                                                                                          minlength=len(emVolts))
+        return {
+            "emVolt": emVolts,
+            "sweep": sweepIndex,
+            "supplyCurr": np.asarray(data["supplyCurr"], dtype=float),
+            "hallBarVolt": np.asarray(data["hallBarVolt"], dtype=float),
+            "emCurr": emCurr,
+        }
+
+    sweepKeys = [key for key in data.keys() if isinstance(data[key], dict) and "supplyCurr" in data[key]]
+    sweepKeys.sort(key=float)
+    sweepLengths = np.array([len(data[key]["supplyCurr"]) for key in sweepKeys], dtype=int)
+
+    return {
+        "emVolt": np.array([float(key) for key in sweepKeys]),
+        "sweep": np.repeat(np.arange(len(sweepKeys)), sweepLengths),
+        "supplyCurr": np.concatenate([np.asarray(data[key]["supplyCurr"], dtype=float) for key in sweepKeys]
+                                     + [np.empty(0)]),
+        "hallBarVolt": np.concatenate([np.asarray(data[key]["hallBarVolt"], dtype=float) for key in sweepKeys]
+                                      + [np.empty(0)]),
+        "emCurr": np.array([float(data[key]["emCurr"]) for key in sweepKeys]),
+    }
+
+
+def fitHallSweeps(data, thickness=None, fieldPerEMCurr=None, carrierCharge=elementaryCharge):
+    """Fit Hall voltage against supply current for every electromagnet sweep at once
+
+    A straight line (hallBarVolt = slope * supplyCurr + intercept) is fitted to every sweep with ordinary least squares.
+    All sweeps are fitted together using grouped sums, so the cost does not depend on looping over the sweeps in python.
+
+    If the thickness of the Hall bar and the electromagnet calibration are provided, the Hall coefficient and the carrier
+    density are calculated for every sweep (R_H = slope * thickness / B, n = 1 / (q * R_H)), and from the gradient of
+    the slopes against the magnetic field over all sweeps, which cancels any offset at zero field.
+
+    Parameters
+    ----------
+    data : dict or numpy.ndarray or str
+        Data set or file name (see loadHallDataset())
+    thickness : float, optional
+        Thickness of the Hall bar in metres
+    fieldPerEMCurr : float, optional
+        Electromagnet calibration in Tesla per Ampere of electromagnet current (emCurr)
+    carrierCharge : float, default=elementaryCharge
+        Charge of a single carrier in coulombs
+
+    Returns
+    -------
+    dict[str, Union[numpy.ndarray, float, None]]
+        Fit results, one value per sweep sorted by electromagnet voltage. See example for keys. Values which need the
+        thickness and field calibration are None if those are not provided. Values for sweeps with fewer than 3 points
+        are nan.
+
+    Example
+    -------
+    >>> fit = fitHallSweeps(data, thickness=1e-3, fieldPerEMCurr=0.5)
+    >>> fit = {
+    >>>     "emVolt": array([10., 20.]),
+    >>>     "emCurr": array([0.2, 0.4]),
+    >>>     "points": array([30, 30]),
+    >>>     "slope": array([...]),                   # V / A
+    >>>     "slopeErr": array([...]),
+    >>>     "intercept": array([...]),               # V
+    >>>     "interceptErr": array([...]),
+    >>>     "field": array([0.1, 0.2]),              # T
+    >>>     "hallCoefficient": array([...]),         # m^3 / C
+    >>>     "hallCoefficientErr": array([...]),
+    >>>     "carrierDensity": array([...]),          # m^-3
+    >>>     "carrierDensityErr": array([...]),
+    >>>     "hallCoefficientFromGradient": ...,      # float
+    >>>     "hallCoefficientFromGradientErr": ...,
+    >>>     "carrierDensityFromGradient": ...,
+    >>> }
+    """
+    flat = flattenHallDataset(loadHallDataset(data))
+    sweepCount = len(flat["emVolt"])
+    sweep = flat["sweep"]
+    x = flat["supplyCurr"]
+    y = flat["hallBarVolt"]
+
+    points = np.bincount(sweep, minlength=sweepCount)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        xMean = np.bincount(sweep, x, minlength=sweepCount) / points
+        yMean = np.bincount(sweep, y, minlength=sweepCount) / points
+        dx = x - xMean[sweep]
+        dy = y - yMean[sweep]
+        sxx = np.bincount(sweep, dx * dx, minlength=sweepCount)
+        sxy = np.bincount(sweep, dx * dy, minlength=sweepCount)
+
+        slope = sxy / sxx
+        intercept = yMean - slope * xMean
+
+        residuals = dy - slope[sweep] * dx
+        residualVar = np.bincount(sweep, residuals * residuals, minlength=sweepCount) / (points - 2)
+        slopeErr = np.sqrt(residualVar / sxx)
+        interceptErr = np.sqrt(residualVar * (1 / points + xMean ** 2 / sxx))
+
+    tooFewPoints = points < 3
+    for arr in (slope, intercept, slopeErr, interceptErr):
+        arr[tooFewPoints] = np.nan
+
+    fit = {
+        "emVolt": flat["emVolt"],
+        "emCurr": flat["emCurr"],
+        "points": points,
+        "slope": slope,
+        "slopeErr": slopeErr,
+        "intercept": intercept,
+        "interceptErr": interceptErr,
+        "field": None,
+        "hallCoefficient": None,
+        "hallCoefficientErr": None,
+        "carrierDensity": None,
+        "carrierDensityErr": None,
+        "hallCoefficientFromGradient": None,
+        "hallCoefficientFromGradientErr": None,
+        "carrierDensityFromGradient": None,
+    }
+
+    if thickness is None or fieldPerEMCurr is None:
+        return fit
+
+    field = flat["emCurr"] * fieldPerEMCurr
+    with np.errstate(divide="ignore", invalid="ignore"):
+        hallCoefficient = slope * thickness / field
+        hallCoefficientErr = np.abs(slopeErr * thickness / field)
+        carrierDensity = 1 / (carrierCharge * hallCoefficient)
+        carrierDensityErr = np.abs(carrierDensity * hallCoefficientErr / hallCoefficient)
+
+    fit["field"] = field
+    fit["hallCoefficient"] = hallCoefficient
+    fit["hallCoefficientErr"] = hallCoefficientErr
+    fit["carrierDensity"] = carrierDensity
+    fit["carrierDensityErr"] = carrierDensityErr
+
+    # Gradient of slope vs field over all usable sweeps: d(slope)/dB = R_H / thickness
+    usable = np.isfinite(slope) & np.isfinite(field)
+    if np.count_nonzero(usable) >= 2 and np.ptp(field[usable]) > 0:
+        fieldDev = field[usable] - np.mean(field[usable])
+        gradient = np.sum(fieldDev * slope[usable]) / np.sum(fieldDev ** 2)
+        hallCoefficientFromGradient = gradient * thickness
+        fit["hallCoefficientFromGradient"] = hallCoefficientFromGradient
+        if np.count_nonzero(usable) > 2:
+            gradientResiduals = slope[usable] - np.mean(slope[usable]) - gradient * fieldDev
+            gradientErr = np.sqrt(np.sum(gradientResiduals ** 2) / (np.count_nonzero(usable) - 2)
+                                  / np.sum(fieldDev ** 2))
+            fit["hallCoefficientFromGradientErr"] = gradientErr * thickness
+        if hallCoefficientFromGradient != 0:
+            fit["carrierDensityFromGradient"] = 1 / (carrierCharge * hallCoefficientFromGradient)
+
+    return fit
+
+
+def analyseHallFiles(fileNames, thickness=None, fieldPerEMCurr=None, carrierCharge=elementaryCharge):
+    """Fit every sweep in many saved Hall Effect data sets
+
+    Parameters
+    ----------
+    fileNames : list of str
+        Files saved by hallEffect.doExperiment() (or any other file accepted by loadHallDataset())
+    thickness : float, optional
+        See fitHallSweeps()
+    fieldPerEMCurr : float, optional
+        See fitHallSweeps()
+    carrierCharge : float, default=elementaryCharge
+        See fitHallSweeps()
+
+    Returns
+    -------
+    dict[str, dict]
+        Object with key as the file name and value as the fit results from fitHallSweeps()
+    """
+    results = {}
+    for fileName in fileNames:
+        results[fileName] = fitHallSweeps(fileName, thickness=thickness, fieldPerEMCurr=fieldPerEMCurr,
+                                          carrierCharge=carrierCharge)
+    return results
+
+
+class CurieWeissEstimator:
+    """Online least squares fit of the Curie Weiss law
+
+    The Curie Weiss law, C = curieConst / (T - weissTemp), is linear in the inverse capacitance:
+    1 / C = T / curieConst - weissTemp / curieConst. The estimator keeps running means and co-moments of temperature
+    and inverse capacitance (Welford's method), which gives the exact recursive least squares solution with O(1) work
+    and memory per data point, so it can be updated inside the acquisition loop.
+
+    Parameters
+    ----------
+    confidenceZ : float, default=1.96
+        Number of standard errors used for the confidence interval half-widths (1.96 gives ~95% for many points)
+
+    See Also
+    --------
+    + fitCurieWeiss()
+    + curieWeiss.doExperiment()
+
+    Example
+    -------
+    >>> estimator = CurieWeissEstimator()
+    >>> for temp, cap in zip(data["temp"], data["cap"]):
+    >>>     estimator.update(temp, cap)
+    >>> estimator.estimate()["weissTemp"]
+    """
+
+    def __init__(self, confidenceZ=1.96):
+        self.confidenceZ = confidenceZ
+        self.points = 0
+        self.tempMean = 0.0
+        self.invCapMean = 0.0
+        self.sTT = 0.0
+        self.sTI = 0.0
+        self.sII = 0.0
+
+    def update(self, temp, cap):
+        """Add a single data point to the fit
+
+        Parameters
+        ----------
+        temp : float
+            Temperature in ºC
+        cap : float
+            Capacitance in F. Points with zero capacitance are ignored.
+
+        Returns
+        -------
+        None
+        """
+        if cap == 0:
+            return
+        invCap = 1.0 / cap
+        self.points += 1
+        tempDelta = temp - self.tempMean
+        invCapDelta = invCap - self.invCapMean
+        self.tempMean += tempDelta / self.points
+        self.invCapMean += invCapDelta / self.points
+        self.sTT += tempDelta * (temp - self.tempMean)
+        self.sTI += tempDelta * (invCap - self.invCapMean)
+        self.sII += invCapDelta * (invCap - self.invCapMean)
+
+    def updateMany(self, temps, caps):
+        """Add many data points to the fit at once
+
+        Parameters
+        ----------
+        temps : array_like
+            Temperatures in ºC
+        caps : array_like
+            Capacitances in F. Points with zero capacitance are ignored.
+
+        Returns
+        -------
+        None
+        """
+        temps = np.asarray(temps, dtype=float)
+        caps = np.asarray(caps, dtype=float)
+        nonZero = caps != 0
+        temps = temps[nonZero]
+        invCaps = 1.0 / caps[nonZero]
+        batchPoints = len(temps)
+        if batchPoints == 0:
+            return
+
+        batchTempMean = np.mean(temps)
+        batchInvCapMean = np.mean(invCaps)
+        tempDev = temps - batchTempMean
+        invCapDev = invCaps - batchInvCapMean
+
+        # Merging the batch co-moments with the running ones (Chan et al. parallel update)
+        totalPoints = self.points + batchPoints
+        tempDelta = batchTempMean - self.tempMean
+        invCapDelta = batchInvCapMean - self.invCapMean
+        weight = self.points * batchPoints / totalPoints
+        self.sTT += np.dot(tempDev, tempDev) + tempDelta * tempDelta * weight
+        self.sTI += np.dot(tempDev, invCapDev) + tempDelta * invCapDelta * weight
+        self.sII += np.dot(invCapDev, invCapDev) + invCapDelta * invCapDelta * weight
+        self.tempMean += tempDelta * batchPoints / totalPoints
+        self.invCapMean += invCapDelta * batchPoints / totalPoints
+        self.points = totalPoints
+
+    def estimate(self):
+        """Current estimate of the Curie Weiss parameters
+
+        Returns
+        -------
+        dict[str, float]
+            Object with keys 'points', 'curieConst' (F ºC), 'curieConstCI', 'weissTemp' (ºC) and 'weissTempCI', where
+            the CI values are confidence interval half-widths. Values are nan until enough points are collected.
+        """
+        est = {
+            "points": self.points,
+            "curieConst": np.nan,
+            "curieConstCI": np.nan,
+            "weissTemp": np.nan,
+            "weissTempCI": np.nan,
+        }
+        if self.points < 2 or self.sTT <= 0 or self.sTI == 0:
+            return est
+
+        slope = self.sTI / self.sTT
+        est["curieConst"] = 1.0 / slope
+        est["weissTemp"] = self.tempMean - self.invCapMean / slope
+
+        if self.points > 2:
+            residualVar = max(self.sII - slope * self.sTI, 0.0) / (self.points - 2)
+            slopeVar = residualVar / self.sTT
+            invCapMeanVar = residualVar / self.points
+            est["curieConstCI"] = self.confidenceZ * np.sqrt(slopeVar) / slope ** 2
+            est["weissTempCI"] = self.confidenceZ * np.sqrt(
+                (self.invCapMean / slope ** 2) ** 2 * slopeVar + invCapMeanVar / slope ** 2
+            )
+
+        return est
+
+    def isConverged(self, weissTempTol, curieConstRelTol=0.05, minPoints=10):
+        """Check if the fit has converged
+
+        Parameters
+        ----------
+        weissTempTol : float
+            Largest acceptable confidence interval half-width of the Weiss temperature in ºC
+        curieConstRelTol : float, default=0.05
+            Largest acceptable confidence interval half-width of the Curie constant relative to its value
+        minPoints : int, default=10
+            Minimum number of points before the fit can be considered converged
+
+        Returns
+        -------
+        bool
+        """
+        est = self.estimate()
+        if est["points"] < minPoints or not np.isfinite(est["weissTempCI"]):
+            return False
+        return (est["weissTempCI"] <= weissTempTol
+                and est["curieConstCI"] <= curieConstRelTol * np.abs(est["curieConst"]))
+
+
+def fitCurieWeiss(data, confidenceZ=1.96):
+    """Fit the Curie Weiss law to a Curie Weiss data set
+
+    Parameters
+    ----------
+    data : dict or str
+        Data object returned by curieWeiss.doExperiment() / getDataFromFile(), or the name of a saved '.p' file
+    confidenceZ : float, default=1.96
+        See CurieWeissEstimator
+
+    Returns
+    -------
+    dict[str, float]
+        See CurieWeissEstimator.estimate()
+    """
+    if isinstance(data, str):
+        data = getDataFromFile(data)
+    estimator = CurieWeissEstimator(confidenceZ=confidenceZ)
+    estimator.updateMany(data["temp"], data["cap"])
+    return estimator.estimate()
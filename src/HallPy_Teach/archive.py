@@ -0,0 +1,317 @@
+"""
+HallPy_Teach.archive: compressed, chunked data archives with random access
+==========================================================================
+
+Description
+-----------
+The '.p' files saved during an experiment are plain pickles: they are not compressed, hold no information about the
+run and have to be loaded completely to look at a single sweep. The '.hpz' archive written by this module is a zip
+file (deflate compressed) with one '.npy' member per column chunk and a 'meta.json' member holding the run information
+(experiment, parameters, instrument IDNs, timing, recovery events) and the layout of the data.
+
+Data is organised in groups (one per electromagnet sweep for the Hall Effect experiment, a single group for the Curie
+Weiss experiment), columns and chunks of at most `chunkRows` rows. Members are written one at a time, so exporting a
+large run never builds the whole archive in memory, and ArchiveReader only decompresses the members it is asked for.
+
+Archive layout:
+    meta.json
+    data/<group>/<column>/<chunk number>.npy
+
+The sweeps of extra Hall bars (see hallEffect.getHallBarData()) are stored in groups named 'hallBar<n>/<sweep>'.
+
+See Also
+--------
++ exportArchive(*args)
++ ArchiveWriter
++ ArchiveReader
+
+"""
+import json
+import zipfile
+
+import numpy as np
+
+flatGroup = "_"
+"""Group name used for data sets which are not split into sweeps (eg.: Curie Weiss data)
+"""
+
+
+def _jsonDefault(obj):
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    return str(obj)
+
+
+class ArchiveWriter:
+    """Streams columns of data into a '.hpz' archive
+
+    Parameters
+    ----------
+    fileName : str
+        Name of the archive file (the '.hpz' extension is added if missing)
+    meta : dict, optional
+        Run information stored in 'meta.json' (eg.: the 'runInfo' of the experiment data)
+    chunkRows : int, default=65536
+        Largest number of rows in one chunk member
+    compressLevel : int, default=6
+        Deflate compression level (0-9)
+
+    Example
+    -------
+    >>> with ArchiveWriter("run1", meta=data["runInfo"]) as writer:
+    >>>     writer.writeColumn("_", "temp", data["temp"])
+    >>>     writer.setGroupValue("_", "note", "sample A")
+    """
+
+    def __init__(self, fileName, meta=None, chunkRows=65536, compressLevel=6):
+        if not fileName.endswith(".hpz"):
+            fileName = fileName + ".hpz"
+        self.fileName = fileName
+        self.chunkRows = int(chunkRows)
+        self._zip = zipfile.ZipFile(fileName, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=compressLevel)
+        self._meta = {
+            "format": "HallPy_Teach archive",
+            "version": 1,
+            "runInfo": meta if meta is not None else {},
+            "groups": {},
+            "groupOrder": [],
+        }
+
+    def _group(self, group):
+        if group not in self._meta["groups"]:
+            self._meta["groups"][group] = {"columns": {}, "values": {}}
+            self._meta["groupOrder"].append(group)
+        return self._meta["groups"][group]
+
+    def writeColumn(self, group, column, values):
+        """Write a column of a group, split into chunk members
+
+        Parameters
+        ----------
+        group : str
+            Name of the group (eg.: str(emV) of a Hall Effect sweep, or flatGroup)
+        column : str
+            Name of the column
+        values : array_like
+            Values of the column
+
+        Returns
+        -------
+        None
+        """
+        values = np.asarray(values)
+        chunkLengths = []
+        for chunk, start in enumerate(range(0, max(len(values), 1), self.chunkRows)):
+            chunkValues = np.ascontiguousarray(values[start:start + self.chunkRows])
+            with self._zip.open("data/" + group + "/" + column + "/" + str(chunk) + ".npy", "w",
+                                force_zip64=True) as member:
+                np.lib.format.write_array(member, chunkValues, allow_pickle=False)
+            chunkLengths.append(len(chunkValues))
+        self._group(group)["columns"][column] = {
+            "dtype": values.dtype.str,
+            "length": len(values),
+            "chunks": chunkLengths,
+        }
+
+    def setGroupValue(self, group, name, value):
+        """Store a single value (eg.: the electromagnet current of a sweep) with a group in 'meta.json'"""
+        self._group(group)["values"][name] = value
+
+    def close(self):
+        """Write 'meta.json' and close the archive"""
+        if self._zip is None:
+            return
+        self._zip.writestr("meta.json", json.dumps(self._meta, default=_jsonDefault, indent=1))
+        self._zip.close()
+        self._zip = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+
+def exportArchive(data, fileNameWithoutExt, chunkRows=65536, compressLevel=6):
+    """Export experiment data to a compressed '.hpz' archive
+
+    Parameters
+    ----------
+    data : dict
+        Data object returned by hallEffect.doExperiment() or curieWeiss.doExperiment() (or loaded with
+        getDataFromFile()). The 'runInfo' of the data is stored as the run information of the archive.
+    fileNameWithoutExt : str
+        File name without extension. It will be saved as a .hpz file
+    chunkRows : int, default=65536
+        See ArchiveWriter
+    compressLevel : int, default=6
+        See ArchiveWriter
+
+    Returns
+    -------
+    str
+        Name of the written archive file
+
+    See Also
+    --------
+    + ArchiveReader
+    """
+    meta = data.get("runInfo", {})
+    with ArchiveWriter(fileNameWithoutExt, meta=meta, chunkRows=chunkRows, compressLevel=compressLevel) as writer:
+        _writeDataSet(writer, data, "")
+        return writer.fileName
+
+
+def _writeDataSet(writer, data, prefix):
+    for key in data.keys():
+        if key == "runInfo":
+            continue
+        value = data[key]
+        if isinstance(value, dict) and "time" in value:
+            for column in value.keys():
+                if isinstance(value[column], (list, np.ndarray)):
+                    writer.writeColumn(prefix + str(key), column, value[column])
+                else:
+                    writer.setGroupValue(prefix + str(key), column, value[column])
+        elif isinstance(value, dict) and prefix == "":
+            # Data set of another Hall bar (see hallEffect.getHallBarData()), stored as '<key>/<sweep>' groups
+            _writeDataSet(writer, value, str(key) + "/")
+        elif isinstance(value, (list, np.ndarray)):
+            writer.writeColumn(prefix + flatGroup, key, value)
+        else:
+            writer.setGroupValue(prefix + flatGroup, key, value)
+
+
+class ArchiveReader:
+    """Lazy reader for '.hpz' archives
+
+    Only 'meta.json' is read when the archive is opened. Columns, sweeps and row ranges are decompressed when they are
+    requested.
+
+    Parameters
+    ----------
+    fileName : str
+        Name of the archive file
+
+    Example
+    -------
+    >>> with ArchiveReader("run1.hpz") as archive:
+    >>>     archive.groups()                          # eg.: ['5.0', '10.0']
+    >>>     sweep = archive.readGroup("10.0")           # one Hall Effect sweep
+    >>>     hallVolt = archive.readColumn("10.0", "hallBarVolt", start=10, stop=20)
+    >>>     data = archive.load()                       # everything, in the doExperiment() format
+    """
+
+    def __init__(self, fileName):
+        self.fileName = fileName
+        self._zip = zipfile.ZipFile(fileName, "r")
+        self.meta = json.loads(self._zip.read("meta.json"))
+        self.runInfo = self.meta["runInfo"]
+
+    def groups(self):
+        """Names of the groups in the order they were written"""
+        return list(self.meta["groupOrder"])
+
+    def columns(self, group):
+        """Names of the columns of a group"""
+        return list(self.meta["groups"][group]["columns"].keys())
+
+    def groupValues(self, group):
+        """Single values stored with a group"""
+        return dict(self.meta["groups"][group]["values"])
+
+    def _readChunk(self, group, column, chunk):
+        with self._zip.open("data/" + group + "/" + column + "/" + str(chunk) + ".npy") as member:
+            return np.lib.format.read_array(member, allow_pickle=False)
+
+    def readColumn(self, group, column, start=0, stop=None):
+        """Read a column of a group, or a range of its rows
+
+        Only the chunks overlapping the requested rows are decompressed.
+
+        Parameters
+        ----------
+        group : str
+            Name of the group
+        column : str
+            Name of the column
+        start : int, default=0
+            First row to read
+        stop : int, optional
+            Row after the last row to read. Defaults to the length of the column.
+
+        Returns
+        -------
+        numpy.ndarray
+        """
+        layout = self.meta["groups"][group]["columns"][column]
+        if stop is None or stop > layout["length"]:
+            stop = layout["length"]
+
+        parts = []
+        chunkStart = 0
+        for chunk, chunkLength in enumerate(layout["chunks"]):
+            chunkStop = chunkStart + chunkLength
+            if chunkStop > start and chunkStart < stop:
+                values = self._readChunk(group, column, chunk)
+                parts.append(values[max(start - chunkStart, 0):stop - chunkStart])
+            chunkStart = chunkStop
+
+        if len(parts) == 0:
+            return np.empty(0, dtype=np.dtype(layout["dtype"]))
+        if len(parts) == 1:
+            return parts[0]
+        return np.concatenate(parts)
+
+    def readGroup(self, group, columns=None):
+        """Read the columns and values of a group
+
+        Parameters
+        ----------
+        group : str
+            Name of the group
+        columns : list of str, optional
+            Columns to read. Defaults to all columns.
+
+        Returns
+        -------
+        dict
+            Object with key as column name and value as column, plus the single values of the group
+        """
+        if columns is None:
+            columns = self.columns(group)
+        groupData = {column: self.readColumn(group, column) for column in columns}
+        groupData.update(self.groupValues(group))
+        return groupData
+
+    def load(self):
+        """Read the whole archive in the format returned by doExperiment()
+
+        Returns
+        -------
+        dict
+        """
+        data = {}
+        for group in self.groups():
+            dataSet = data
+            name = group
+            if "/" in group:
+                outer, name = group.split("/", 1)
+                dataSet = data.setdefault(outer, {"runInfo": self.runInfo})
+            if name == flatGroup:
+                dataSet.update(self.readGroup(group))
+            else:
+                dataSet[name] = self.readGroup(group)
+        data["runInfo"] = self.runInfo
+        return data
+
+    def close(self):
+        self._zip.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
@@ -0,0 +1,265 @@
+"""
+HallPy_Teach.background: running experiments without blocking the notebook
+==========================================================================
+
+Description
+-----------
+startExperiment() (or the `start()` function of an experiment, eg.: `hallEffect.start(...)`) runs doExperiment() on a
+worker thread and returns a RunHandle straight away, so the notebook kernel stays free (eg.: to analyse earlier runs)
+while the data is collected.
+
+The handle gives access to the data collected so far (the same data object doExperiment() fills, its arrays are views
+of the data store so nothing is copied), the progress and the estimated time left. The run can be paused and resumed
+between data points and cancelled: cancelling raises ExperimentCancelled in the experiment loop, so the experiment
+shuts down the way it does after any other error (eg.: the Hall Effect experiment resets the power supplies).
+
+The live readings and graphs are not drawn by background runs by default, as the output of a worker thread ends up in
+whichever notebook cell is running at the time. Use `handle.data` with the experiment's graph functions instead.
+
+See Also
+--------
++ startExperiment(*args)
++ RunHandle
++ ExperimentCancelled
+
+"""
+import threading
+import time
+
+
+class ExperimentCancelled(Exception):
+    """Raised in the experiment loop when a background run is cancelled"""
+    pass
+
+
+class RunHandle:
+    """Handle of an experiment running on a worker thread (see startExperiment())
+
+    The experiment loop calls checkpoint() before every data point, which is where the run is paused and cancelled.
+
+    Attributes
+    ----------
+    status : str
+        'starting', 'running', 'paused', 'cancelling', 'completed', 'cancelled' or 'failed'
+    error : BaseException or None
+        Error the run failed with
+    """
+
+    def __init__(self, experiment, args=(), kwargs=None):
+        self.experiment = experiment
+        self.status = "starting"
+        self.error = None
+        self._args = args
+        self._kwargs = kwargs if kwargs is not None else {}
+        self._data = None
+        self._result = None
+        self._progress = 0.0
+        self._startTime = None
+        self._endTime = None
+        self._pausedFor = 0.0
+        self._pausedAt = None
+        self._runEvent = threading.Event()
+        self._runEvent.set()
+        self._cancelEvent = threading.Event()
+        self._doneEvent = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="HallPy_Teach experiment", daemon=True)
+
+    def start(self):
+        self._startTime = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def _run(self):
+        self.status = "running"
+        try:
+            self._result = self.experiment.doExperiment(*self._args, runControl=self, **self._kwargs)
+            self._data = self._result
+            self._progress = 1.0
+            self.status = "completed"
+        except ExperimentCancelled as err:
+            self.error = err
+            self.status = "cancelled"
+        except BaseException as err:
+            self.error = err
+            self.status = "failed"
+        finally:
+            self._endTime = time.perf_counter()
+            self._doneEvent.set()
+
+    def checkpoint(self, data, progress, whilePaused=None, onPause=None):
+        """Called by the experiment loop before every data point
+
+        Parameters
+        ----------
+        data : dict
+            Data object filled by the experiment
+        progress : float
+            Fraction of the run completed (0 - 1)
+        whilePaused : function, optional
+            Called regularly while the run is paused (eg.: to raise if the safety watchdog has tripped)
+        onPause : function, optional
+            Called once when the run is paused (eg.: to turn off the Hall bar current supplies)
+
+        Returns
+        -------
+        float
+            Time in seconds the run was paused for (0 if it was not paused)
+
+        Raises
+        ------
+        ExperimentCancelled
+            If the run was cancelled
+        """
+        self._data = data
+        self._progress = min(max(float(progress), 0.0), 1.0)
+        if self._cancelEvent.is_set():
+            raise ExperimentCancelled("The experiment was cancelled")
+        if self._runEvent.is_set():
+            return 0.0
+
+        pauseStart = time.perf_counter()
+        self._pausedAt = pauseStart
+        self.status = "paused"
+        if onPause is not None:
+            onPause()
+        while not self._runEvent.wait(0.1):
+            if whilePaused is not None:
+                whilePaused()
+        pausedFor = time.perf_counter() - pauseStart
+        self._pausedFor += pausedFor
+        self._pausedAt = None
+        if self._cancelEvent.is_set():
+            raise ExperimentCancelled("The experiment was cancelled")
+        self.status = "running"
+        return pausedFor
+
+    def pause(self):
+        """Pause the run before its next data point"""
+        if not self._doneEvent.is_set():
+            self._runEvent.clear()
+
+    def resume(self):
+        """Resume a paused run"""
+        self._runEvent.set()
+
+    def cancel(self, wait=True, timeout=None):
+        """Stop the run before its next data point and shut the experiment down
+
+        Parameters
+        ----------
+        wait : bool, default=True
+            Wait for the experiment to shut down
+        timeout : float, optional
+            Longest time in seconds to wait for
+        """
+        if self._doneEvent.is_set():
+            return
+        self.status = "cancelling"
+        self._cancelEvent.set()
+        self._runEvent.set()
+        if wait:
+            self._doneEvent.wait(timeout)
+
+    @property
+    def data(self):
+        """Data collected so far (None until the first data point). Not a copy, it keeps changing while the run goes on.
+        """
+        return self._data
+
+    @property
+    def progress(self):
+        """Fraction of the run completed (0 - 1)"""
+        return self._progress
+
+    @property
+    def elapsed(self):
+        """Time in seconds the run has been running for, not counting pauses"""
+        if self._startTime is None:
+            return 0.0
+        end = self._endTime if self._endTime is not None else time.perf_counter()
+        pausedFor = self._pausedFor + (end - self._pausedAt if self._pausedAt is not None else 0.0)
+        return end - self._startTime - pausedFor
+
+    @property
+    def eta(self):
+        """Estimated time left in seconds (None until the first data point is done)"""
+        if self._doneEvent.is_set():
+            return 0.0
+        if self._progress <= 0:
+            return None
+        return self.elapsed * (1 - self._progress) / self._progress
+
+    def isDone(self):
+        return self._doneEvent.is_set()
+
+    def wait(self, timeout=None):
+        """Wait for the run to end without raising its error
+
+        Parameters
+        ----------
+        timeout : float, optional
+            Longest time in seconds to wait for
+
+        Returns
+        -------
+        bool
+            True if the run has ended
+        """
+        return self._doneEvent.wait(timeout)
+
+    def result(self, timeout=None):
+        """Wait for the run to end
+
+        Parameters
+        ----------
+        timeout : float, optional
+            Longest time in seconds to wait for
+
+        Returns
+        -------
+        dict
+            Data returned by doExperiment(). If the run was cancelled, the data collected until then.
+
+        Raises
+        ------
+        TimeoutError
+            If the run did not end within the timeout
+        Exception
+            The error the run failed with
+        """
+        if not self._doneEvent.wait(timeout):
+            raise TimeoutError("The experiment is still running")
+        if self.status == "failed":
+            raise self.error
+        return self._result if self._result is not None else self._data
+
+    def __repr__(self):
+        return "RunHandle(" + getattr(self.experiment, "expName", "experiment") + ", " + self.status + ", " \
+               + str(round(self._progress * 100, 1)) + "%)"
+
+
+def startExperiment(experiment, *args, **kwargs):
+    """Run an experiment on a worker thread
+
+    Parameters
+    ----------
+    experiment : module
+        Experiment module (eg.: hallEffect) or experiment entry (see experimentRegistry)
+    *args, **kwargs
+        Arguments of the experiment's doExperiment() function. 'liveDisplay' defaults to False.
+
+    Returns
+    -------
+    RunHandle
+
+    Example
+    -------
+    >>> run = startExperiment(hallEffect, expInsts, emVolts=[1, 2, 3], supVoltSweep=(0, 5), dataPointsPerSupSweep=20)
+    >>> run.progress, run.eta
+    >>> hallEffect.draw3DHELabGraphs(run.data)
+    >>> run.pause()
+    >>> run.resume()
+    >>> data = run.result()
+    """
+    kwargs.setdefault("liveDisplay", False)
+    return RunHandle(experiment, args, kwargs).start()
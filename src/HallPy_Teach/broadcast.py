@@ -0,0 +1,285 @@
+"""
+HallPy_Teach.broadcast: live data broadcast to local dashboards
+===============================================================
+
+Description
+-----------
+LiveBroadcaster is an optional TCP server (localhost by default) fed by the experiment loops. Every data point is sent
+to all connected subscribers as a compact binary frame, so any number of dashboards can follow a run without rendering
+in the notebook kernel running the experiment.
+
+Publishing never blocks the data collection: every subscriber has its own bounded frame queue and sender thread. If a
+subscriber is too slow the oldest queued frames are dropped (and counted), and subscribers whose connection fails are
+disconnected.
+
+Frame layout (little endian):
+    uint32 length of the rest of the frame
+    uint8 kind (schemaFrame or pointFrame), uint16 stream, float64 time.time() timestamp
+    body: UTF-8 JSON {"name": ..., "columns": [...]} for schema frames, float64 values (one per column) for point frames
+
+Streams are numbered by the experiments (the Hall bar number for the Hall Effect experiment, 1 for the Curie Weiss
+experiment). The schema of every stream is sent to new subscribers when they connect.
+
+See Also
+--------
++ LiveBroadcaster
++ encodeFrame(*args)
++ decodeFrames(*args)
+
+"""
+import collections
+import json
+import socket
+import struct
+import threading
+import time
+
+import numpy as np
+
+schemaFrame = 1
+"""Frame kind announcing the name and columns of a stream
+"""
+
+pointFrame = 2
+"""Frame kind holding the values of one data point
+"""
+
+_lengthStruct = struct.Struct("<I")
+_headerStruct = struct.Struct("<BHd")
+
+
+def encodeFrame(kind, stream, body, timestamp=None):
+    """Encode a frame
+
+    Parameters
+    ----------
+    kind : int
+        schemaFrame or pointFrame
+    stream : int
+        Stream number (0 - 65535)
+    body : bytes
+        Frame body
+    timestamp : float, optional
+        time.time() timestamp. Defaults to now.
+
+    Returns
+    -------
+    bytes
+    """
+    header = _headerStruct.pack(kind, stream, time.time() if timestamp is None else timestamp)
+    return _lengthStruct.pack(len(header) + len(body)) + header + body
+
+
+def decodeFrames(buffer):
+    """Decode the complete frames at the start of a buffer
+
+    Parameters
+    ----------
+    buffer : bytes or bytearray
+        Data received from the broadcaster
+
+    Returns
+    -------
+    tuple[list of tuple, bytes]
+        Decoded frames as (kind, stream, timestamp, body) tuples, where body is the schema object for schema frames and
+        a numpy.ndarray of values for point frames, and the bytes left over after the last complete frame
+    """
+    frames = []
+    offset = 0
+    while len(buffer) - offset >= _lengthStruct.size:
+        length = _lengthStruct.unpack_from(buffer, offset)[0]
+        if len(buffer) - offset - _lengthStruct.size < length:
+            break
+        start = offset + _lengthStruct.size
+        kind, stream, timestamp = _headerStruct.unpack_from(buffer, start)
+        body = bytes(buffer[start + _headerStruct.size:start + length])
+        if kind == schemaFrame:
+            body = json.loads(body.decode("utf-8"))
+        elif kind == pointFrame:
+            body = np.frombuffer(body, dtype="<f8")
+        frames.append((kind, stream, timestamp, body))
+        offset = start + length
+    return frames, bytes(buffer[offset:])
+
+
+class _Subscriber:
+    def __init__(self, sock, address, maxQueuedFrames):
+        self.sock = sock
+        self.address = address
+        self.frames = collections.deque()
+        self.maxQueuedFrames = maxQueuedFrames
+        self.condition = threading.Condition()
+        self.dropped = 0
+        self.closed = False
+
+    def enqueue(self, frame):
+        with self.condition:
+            if len(self.frames) >= self.maxQueuedFrames:
+                self.frames.popleft()
+                self.dropped += 1
+            self.frames.append(frame)
+            self.condition.notify()
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class LiveBroadcaster:
+    """TCP server pushing live data points to any number of subscribers
+
+    Parameters
+    ----------
+    host : str, default='127.0.0.1'
+        Address to listen on
+    port : int, default=0
+        Port to listen on (0 picks a free port, see the 'port' attribute once started)
+    maxQueuedFrames : int, default=1024
+        Largest number of frames queued for one subscriber before the oldest are dropped
+    sendTimeout : float, default=5.0
+        Time in seconds after which a subscriber which does not accept any data is disconnected
+
+    Example
+    -------
+    >>> with LiveBroadcaster(port=5555) as broadcaster:
+    >>>     data = hallEffect.doExperiment(expInsts, ..., broadcaster=broadcaster)
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, maxQueuedFrames=1024, sendTimeout=5.0):
+        self.host = host
+        self.port = port
+        self.maxQueuedFrames = maxQueuedFrames
+        self.sendTimeout = sendTimeout
+        self.framesPublished = 0
+        self._schemas = {}
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._server = None
+        self._stopEvent = threading.Event()
+        self._droppedByClosed = 0
+
+    def start(self):
+        """Start listening for subscribers on a daemon thread"""
+        self._stopEvent.clear()
+        self._server = socket.create_server((self.host, self.port))
+        self._server.settimeout(0.2)
+        self.port = self._server.getsockname()[1]
+        threading.Thread(target=self._acceptLoop, name="HallPy_Teach broadcast", daemon=True).start()
+        return self
+
+    def stop(self):
+        """Stop the server and disconnect all subscribers"""
+        self._stopEvent.set()
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+        with self._lock:
+            subscribers = list(self._subscribers)
+            self._subscribers = []
+        for subscriber in subscribers:
+            subscriber.close()
+            self._droppedByClosed += subscriber.dropped
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, excType, excValue, traceback):
+        self.stop()
+
+    def _acceptLoop(self):
+        while not self._stopEvent.is_set():
+            try:
+                sock, address = self._server.accept()
+            except socket.timeout:
+                continue
+            except (OSError, AttributeError):
+                return
+            sock.settimeout(self.sendTimeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            subscriber = _Subscriber(sock, address, self.maxQueuedFrames)
+            with self._lock:
+                for schema in self._schemas.values():
+                    subscriber.enqueue(schema)
+                self._subscribers.append(subscriber)
+            threading.Thread(target=self._sendLoop, args=(subscriber,), name="HallPy_Teach broadcast subscriber",
+                             daemon=True).start()
+
+    def _sendLoop(self, subscriber):
+        while True:
+            with subscriber.condition:
+                while len(subscriber.frames) == 0 and not subscriber.closed:
+                    subscriber.condition.wait()
+                if subscriber.closed:
+                    return
+                frames = list(subscriber.frames)
+                subscriber.frames.clear()
+            try:
+                subscriber.sock.sendall(b"".join(frames))
+            except OSError:
+                self._disconnect(subscriber)
+                return
+
+    def _disconnect(self, subscriber):
+        with self._lock:
+            if subscriber in self._subscribers:
+                self._subscribers.remove(subscriber)
+                self._droppedByClosed += subscriber.dropped
+        subscriber.close()
+
+    def _send(self, frame):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            subscriber.enqueue(frame)
+
+    def announce(self, stream, columns, name=""):
+        """Announce the name and columns of a stream to all current and future subscribers
+
+        Parameters
+        ----------
+        stream : int
+            Stream number
+        columns : list of str
+            Names of the values of every point of the stream
+        name : str, optional
+            Name of the stream (eg.: experiment and Hall bar)
+        """
+        frame = encodeFrame(schemaFrame, stream, json.dumps({"name": name, "columns": list(columns)}).encode("utf-8"))
+        with self._lock:
+            self._schemas[stream] = frame
+        self._send(frame)
+
+    def publish(self, stream, values):
+        """Send a data point to all subscribers without blocking
+
+        Parameters
+        ----------
+        stream : int
+            Stream number
+        values : list of float
+            Values of the point in the order of the announced columns
+        """
+        self._send(encodeFrame(pointFrame, stream, np.asarray(values, dtype="<f8").tobytes()))
+        self.framesPublished += 1
+
+    def stats(self):
+        """Broadcast statistics
+
+        Returns
+        -------
+        dict[str, int]
+            Object with keys 'subscribers', 'framesPublished' and 'framesDropped' (dropped for slow subscribers)
+        """
+        with self._lock:
+            subscribers = list(self._subscribers)
+            droppedByClosed = self._droppedByClosed
+        return {
+            "subscribers": len(subscribers),
+            "framesPublished": self.framesPublished,
+            "framesDropped": droppedByClosed + sum(subscriber.dropped for subscriber in subscribers),
+        }
@@ -0,0 +1,165 @@
+"""
+HallPy_Teach.columnStore: preallocated column storage for experiment data
+=========================================================================
+
+Description
+-----------
+Experiments collect one row of readings per data point. Appending python floats to lists and converting them with
+np.array() for every plot and save costs an allocation per reading and a full copy per conversion. ColumnStore keeps
+the readings in a single preallocated numpy structured array instead, sized from the experiment plan and grown
+geometrically if the plan was too small, and hands out views of the filled rows without copying.
+
+See Also
+--------
++ ColumnStore
+
+"""
+import numpy as np
+
+
+class ColumnStore:
+    """Preallocated, geometrically growing column store backed by a numpy structured array
+
+    Parameters
+    ----------
+    columns : list of str or list of tuple
+        Column names (stored as float64) or (name, dtype) pairs
+    capacity : int, default=64
+        Number of rows to preallocate. Use the expected number of data points of the experiment.
+
+    Notes
+    -----
+    Views returned by view(), views() and asStructured() share memory with the store. They stay valid after more rows
+    are appended but will not show those rows, and after the store grows they refer to the old buffer. Take new views
+    after appending when the latest data is needed.
+
+    Example
+    -------
+    >>> store = ColumnStore(["time", "temp"], capacity=100)
+    >>> store.append(time=0.0, temp=24.1)
+    >>> store.appendRow(5.0, 25.2)
+    >>> store.view("temp")
+    array([24.1, 25.2])
+    """
+
+    def __init__(self, columns, capacity=64):
+        dtype = []
+        for column in columns:
+            if isinstance(column, str):
+                dtype.append((column, np.float64))
+            else:
+                dtype.append(tuple(column))
+        self.dtype = np.dtype(dtype)
+        self.columns = self.dtype.names
+        self._buffer = np.zeros(max(int(capacity), 1), dtype=self.dtype)
+        self._length = 0
+
+    def __len__(self):
+        return self._length
+
+    @property
+    def capacity(self):
+        """Number of rows which fit in the store before it needs to grow"""
+        return len(self._buffer)
+
+    def reserve(self, capacity):
+        """Make sure the store can hold at least the given number of rows without growing again
+
+        Parameters
+        ----------
+        capacity : int
+            Number of rows needed
+
+        Returns
+        -------
+        None
+        """
+        if capacity > len(self._buffer):
+            newBuffer = np.zeros(int(capacity), dtype=self.dtype)
+            newBuffer[:self._length] = self._buffer[:self._length]
+            self._buffer = newBuffer
+
+    def _nextRow(self):
+        if self._length == len(self._buffer):
+            self.reserve(2 * len(self._buffer))
+        row = self._length
+        self._length += 1
+        return row
+
+    def append(self, **values):
+        """Append a row of values by column name. Columns which are not provided are set to 0.
+
+        Returns
+        -------
+        int
+            Index of the appended row
+        """
+        row = self._nextRow()
+        bufferRow = self._buffer[row]
+        for column in values:
+            bufferRow[column] = values[column]
+        return row
+
+    def appendRow(self, *values):
+        """Append a row of values in column order
+
+        Returns
+        -------
+        int
+            Index of the appended row
+        """
+        row = self._nextRow()
+        self._buffer[row] = values
+        return row
+
+    def view(self, column, start=0, stop=None):
+        """View of the filled rows of a single column (no copy)
+
+        Parameters
+        ----------
+        column : str
+            Column name
+        start : int, default=0
+            First row of the view
+        stop : int, optional
+            Row after the last row of the view. Defaults to the number of filled rows.
+
+        Returns
+        -------
+        numpy.ndarray
+        """
+        if stop is None or stop > self._length:
+            stop = self._length
+        return self._buffer[column][start:stop]
+
+    def views(self, start=0, stop=None, columns=None):
+        """Views of the filled rows of several columns (no copy)
+
+        Parameters
+        ----------
+        start : int, default=0
+            See view()
+        stop : int, optional
+            See view()
+        columns : list of str, optional
+            Columns to include. Defaults to all columns.
+
+        Returns
+        -------
+        dict[str, numpy.ndarray]
+            Object with key as the column name and value as the view of that column
+        """
+        if columns is None:
+            columns = self.columns
+        return {column: self.view(column, start, stop) for column in columns}
+
+    def asStructured(self, start=0, stop=None):
+        """View of the filled rows as a structured array (no copy)
+
+        Returns
+        -------
+        numpy.ndarray
+        """
+        if stop is None or stop > self._length:
+            stop = self._length
+        return self._buffer[start:stop]
@@ -16,3 +16,71 @@ serialRegex = {
 }
 """Regular expressions to look for serial numbers of specific devices
 """
+
+elementaryCharge = 1.602176634e-19
+"""Elementary charge in coulombs, used to convert Hall coefficients to carrier densities
+"""
+
+multimeterRanges = {
+    "KEITHLEY INSTRUMENTS INC.,MODEL 2110": {
+        "VOLT:DC": [0.1, 1, 10, 100, 1000],
+        "CURR:DC": [0.01, 0.1, 1, 3, 10],
+    },
+    "GWInstek,GDM8342": {
+        "VOLT:DC": [0.05, 0.5, 5, 50, 500, 1000],
+        "CURR:DC": [0.0005, 0.005, 0.05, 0.5, 5, 10],
+    },
+    "GWInstek,GDM8341": {
+        "VOLT:DC": [0.05, 0.5, 5, 50, 500, 1000],
+        "CURR:DC": [0.0005, 0.005, 0.05, 0.5, 5, 10],
+    },
+}
+"""Fixed measurement ranges (V or A) of the supported multimeters, used by the measurement profiles
+"""
+
+multimeterProfiles = {
+    "KEITHLEY INSTRUMENTS INC.,MODEL 2110": {
+        "fast": {"commands": ["{function}:NPLC 0.02", "ZERO:AUTO OFF"], "readingTime": 0.0004, "noisePPM": 100},
+        "balanced": {"commands": ["{function}:NPLC 1", "ZERO:AUTO ONCE"], "readingTime": 0.0167, "noisePPM": 10},
+        "precise": {"commands": ["{function}:NPLC 10", "ZERO:AUTO ON"], "readingTime": 0.334, "noisePPM": 1},
+    },
+    "GWInstek,GDM8342": {
+        "fast": {"commands": ["SENS:DET:RATE F"], "readingTime": 0.025, "noisePPM": 100},
+        "balanced": {"commands": ["SENS:DET:RATE M"], "readingTime": 0.05, "noisePPM": 30},
+        "precise": {"commands": ["SENS:DET:RATE S"], "readingTime": 0.2, "noisePPM": 10},
+    },
+    "GWInstek,GDM8341": {
+        "fast": {"commands": ["SENS:DET:RATE F"], "readingTime": 0.025, "noisePPM": 100},
+        "balanced": {"commands": ["SENS:DET:RATE M"], "readingTime": 0.05, "noisePPM": 30},
+        "precise": {"commands": ["SENS:DET:RATE S"], "readingTime": 0.2, "noisePPM": 10},
+    },
+}
+"""Measurement profiles of the supported multimeters
+
+For every model and profile: the SCPI commands setting the integration time / reading rate and autozero ('{function}'
+is replaced with the measured function, eg.: 'VOLT:DC'), the nominal time of one reading in seconds (including autozero)
+and the nominal RMS noise in ppm of the range. The timing and noise values are nominal datasheet style figures, useful
+to compare profiles rather than as guaranteed specifications.
+"""
+
+queryOverhead = 0.005
+"""Nominal bus overhead of one instrument query in seconds, added to the reading time of the measurement profiles
+"""
+
+instrumentAveraging = {
+    "KEITHLEY INSTRUMENTS INC.,MODEL 2110": {
+        "commands": ["{function}:AVER:TCON REP", "{function}:AVER:COUN {samples}", "{function}:AVER:STAT ON"],
+        "off": ["{function}:AVER:STAT OFF"],
+        "maxSamples": 100,
+    },
+}
+"""Instruments which can average readings themselves (digital filter)
+
+For every model: the SCPI commands turning the repeating average filter on ('{function}' is replaced with the measured
+function and '{samples}' with the number of readings averaged per `READ?`), the commands turning it off and the largest
+number of readings the filter can average.
+"""
+
+nominalReadingTime = 0.02
+"""Nominal time of one reading in seconds for instruments without a measurement profile, used in run time estimates
+"""
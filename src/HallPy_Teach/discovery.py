@@ -0,0 +1,157 @@
+"""
+HallPy_Teach.discovery: finding LAN / LXI instruments with mDNS
+===============================================================
+
+Description
+-----------
+The VISA resource manager only lists USB, serial and GPIB instruments, so networked instruments had to be typed in by
+hand. discoverLANResources() browses for the mDNS (zeroconf) services announced by LXI instruments, resolves them to
+VISA resource names (`TCPIP::<address>::INSTR`, or `TCPIP::<address>::<port>::SOCKET` for raw SCPI sockets) and caches
+them until the TTL of their address record (at most `cacheTTL` seconds) runs out. Browsing stops as soon as no new
+service has been announced for `quietTime` seconds, and a browse which found nothing is remembered for `emptyCacheTTL`
+seconds, so labs without LAN instruments do not wait for the discovery every time. initInstruments() runs the discovery
+on a thread while the local resources are listed, then probes the found resources with `*IDN?` like every other
+instrument.
+
+If the zeroconf package is not installed, no LAN instruments are discovered. The discovery can be tried without a
+networked instrument with simulation.SimulatedLANInstrument, which serves a simulated instrument on a raw SCPI socket
+and announces it on the loopback interface: pass its `zeroconf` instance as `zeroconfInstance` to browse there.
+
+See Also
+--------
++ discoverLANResources(*args)
++ forgetLANResource(*args)
++ lxiServiceTypes
++ simulation.SimulatedLANInstrument
+
+"""
+import threading
+import time
+
+lxiServiceTypes = {
+    "_lxi._tcp.local.": "INSTR",
+    "_vxi-11._tcp.local.": "INSTR",
+    "_scpi-raw._tcp.local.": "SOCKET",
+}
+"""mDNS service types announced by LAN instruments and the kind of VISA resource they are opened as
+"""
+
+_lanCache = {}
+_cacheLock = threading.Lock()
+_lastEmptyBrowse = None
+
+
+def _resourceName(info, resourceKind):
+    addresses = info.parsed_addresses()
+    if len(addresses) == 0:
+        return None
+    if resourceKind == "SOCKET":
+        return "TCPIP::" + addresses[0] + "::" + str(info.port) + "::SOCKET"
+    return "TCPIP::" + addresses[0] + "::INSTR"
+
+
+def getCachedLANResources():
+    """LAN resources found earlier whose cache entries have not expired
+
+    Returns
+    -------
+    list of str
+    """
+    now = time.monotonic()
+    with _cacheLock:
+        for resName in [resName for resName, expiry in _lanCache.items() if expiry <= now]:
+            del _lanCache[resName]
+        return list(_lanCache.keys())
+
+
+def forgetLANResource(resName):
+    """Remove a resource from the cache (eg.: after it did not answer `*IDN?`)"""
+    with _cacheLock:
+        _lanCache.pop(resName, None)
+
+
+def discoverLANResources(timeout=1.5, cacheTTL=300, useCache=True, zeroconfInstance=None, quietTime=0.5,
+                         emptyCacheTTL=60):
+    """Find LAN instruments announced with mDNS
+
+    Parameters
+    ----------
+    timeout : float, default=1.5
+        Longest time in seconds spent browsing for services (and the longest time spent resolving each service)
+    cacheTTL : float, default=300
+        Longest time in seconds a discovered resource is cached. Shorter if the TTL of its address record is shorter.
+    useCache : bool, default=True
+        Return the cached resources without browsing if any are still valid, or an empty list without browsing if the
+        last browse found nothing less than emptyCacheTTL seconds ago
+    zeroconfInstance : zeroconf.Zeroconf, optional
+        Zeroconf instance to browse with (eg.: the one of a simulation.SimulatedLANInstrument, bound to the loopback
+        interface). A new instance is created and closed if not provided.
+    quietTime : float, default=0.5
+        Browsing stops once no new service has been announced for this many seconds
+    emptyCacheTTL : float, default=60
+        Time in seconds a browse which found nothing is remembered
+
+    Returns
+    -------
+    list of str
+        VISA resource names of the discovered instruments
+    """
+    global _lastEmptyBrowse
+    if useCache:
+        cached = getCachedLANResources()
+        if len(cached) > 0:
+            return cached
+        with _cacheLock:
+            if _lastEmptyBrowse is not None and time.monotonic() - _lastEmptyBrowse < emptyCacheTTL:
+                return []
+    try:
+        # Imported here, so importing HallPy_Teach does not pull in zeroconf when the LAN discovery is not used
+        from zeroconf import ServiceBrowser, ServiceStateChange, Zeroconf
+    except ImportError:
+        return []
+
+    zc = zeroconfInstance if zeroconfInstance is not None else Zeroconf()
+    foundServices = []
+    foundLock = threading.Lock()
+
+    def onServiceStateChange(zeroconf, service_type, name, state_change):
+        if state_change in (ServiceStateChange.Added, ServiceStateChange.Updated):
+            with foundLock:
+                if (service_type, name) not in foundServices:
+                    foundServices.append((service_type, name))
+
+    resources = {}
+    try:
+        browser = ServiceBrowser(zc, list(lxiServiceTypes.keys()), handlers=[onServiceStateChange])
+        browseStart = time.monotonic()
+        lastChange = browseStart
+        seen = 0
+        while time.monotonic() - browseStart < timeout:
+            time.sleep(0.05)
+            with foundLock:
+                if len(foundServices) != seen:
+                    seen = len(foundServices)
+                    lastChange = time.monotonic()
+            if time.monotonic() - lastChange >= quietTime:
+                break
+        browser.cancel()
+
+        with foundLock:
+            services = list(foundServices)
+        for serviceType, name in services:
+            info = zc.get_service_info(serviceType, name, timeout=int(timeout * 1000))
+            if info is None:
+                continue
+            resName = _resourceName(info, lxiServiceTypes[serviceType])
+            if resName is not None:
+                resources[resName] = min(cacheTTL, getattr(info, "host_ttl", cacheTTL))
+    finally:
+        if zeroconfInstance is None:
+            zc.close()
+
+    now = time.monotonic()
+    with _cacheLock:
+        for resName, ttl in resources.items():
+            _lanCache[resName] = now + ttl
+        _lastEmptyBrowse = now if len(resources) == 0 else None
+    return list(resources.keys())
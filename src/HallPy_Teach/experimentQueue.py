@@ -0,0 +1,159 @@
+"""
+HallPy_Teach.experimentQueue: running many parameter sets back-to-back
+======================================================================
+
+Description
+-----------
+runQueue() runs an experiment once for every parameter set in a list, reusing the instruments which are already set up
+(expInsts), so a bench can work through a whole plan unattended. For the Hall Effect experiment the runs are reordered
+and swept up or down so the electromagnet moves as little as possible between runs, and it is left on between runs
+instead of being ramped down and up again. Every run is saved to its own data set and a combined timeline is returned.
+
+See Also
+--------
++ runQueue(*args)
++ orderHallRuns(*args)
+
+"""
+import time
+
+from .experiments import hallEffect
+from .helper import clearFileAndSaveData
+
+
+def orderHallRuns(paramSets, startEMVolt=0.0):
+    """Order Hall Effect runs to minimise electromagnet ramping
+
+    Starting from the electromagnet voltage startEMVolt, the next run is always the one with an end (lowest or highest
+    emVolt) closest to the current electromagnet voltage, and it is swept starting from that end.
+
+    Parameters
+    ----------
+    paramSets : list of dict
+        Keyword arguments for hallEffect.doExperiment(), one object per run (must include 'emVolts')
+    startEMVolt : float, default=0.0
+        Electromagnet voltage before the first run
+
+    Returns
+    -------
+    list of tuple[int, bool]
+        (index into paramSets, descendingEM) for every run in the order it should be done
+    """
+    remaining = list(range(len(paramSets)))
+    curEMVolt = startEMVolt
+    order = []
+    while len(remaining) > 0:
+        bestIndex = None
+        bestDescending = False
+        bestDistance = None
+        for index in remaining:
+            emVolts = [float(V) for V in paramSets[index]["emVolts"]]
+            for descending, startV, endV in ((False, min(emVolts), max(emVolts)), (True, max(emVolts), min(emVolts))):
+                distance = abs(startV - curEMVolt)
+                if bestDistance is None or distance < bestDistance:
+                    bestIndex, bestDescending, bestDistance, bestEndV = index, descending, distance, endV
+        order.append((bestIndex, bestDescending))
+        remaining.remove(bestIndex)
+        curEMVolt = bestEndV
+    return order
+
+
+def runQueue(experiment, expInsts, paramSets, dataFileNamePrefix=None, reorder=True, stopOnError=True):
+    """Run an experiment for every parameter set in a list
+
+    Parameters
+    ----------
+    experiment : module
+        Experiment module (eg.: HallPy_Teach.experiments.hallEffect or curieWeiss)
+    expInsts : object
+        Instruments already set up with the experiment's setup() function. They are reused by every run.
+    paramSets : list of dict
+        Keyword arguments for the experiment's doExperiment() function (other than expInsts), one object per run
+    dataFileNamePrefix : str, optional
+        If provided, run i is saved to '<prefix>_<i>.p' (i is the index in paramSets) unless its parameter set has its own
+        'dataFileName'. The queue summary is saved to '<prefix>_queue.p'.
+    reorder : bool, default=True
+        Reorder Hall Effect runs to minimise electromagnet ramping (see orderHallRuns()) and leave the electromagnet on
+        between runs. The power supplies are reset once the queue is done. Other experiments always run in the given
+        order.
+    stopOnError : bool, default=True
+        If False, a run which fails with an error other than a safety Warning is recorded in the timeline and the queue
+        carries on with the next run. Safety Warnings always stop the queue.
+
+    Returns
+    -------
+    dict
+        Object with keys:
+            - 'results' : data returned by doExperiment() for every parameter set, in the order of paramSets (None for
+              failed runs)
+            - 'timeline' : one object per run in the order the runs were done, with keys 'index', 'params', 'start',
+              'end', 'duration' (s), 'dataFileName' and 'error' (None if the run succeeded)
+            - 'totalTime' : time from the start of the first run to the end of the last run (s)
+            - 'utilisation' : fraction of the total time spent inside doExperiment()
+
+    Example
+    -------
+    >>> queue = runQueue(hallEffect, expInsts, [
+    >>>     {"emVolts": [5, 10, 15], "supVoltSweep": (1, 20), "dataPointsPerSupSweep": 30, "plot": False},
+    >>>     {"emVolts": [15, 20, 25], "supVoltSweep": (1, 20), "dataPointsPerSupSweep": 30, "plot": False},
+    >>> ], dataFileNamePrefix="overnight")
+    """
+    if reorder and experiment is hallEffect:
+        order = orderHallRuns(paramSets)
+    else:
+        order = [(index, None) for index in range(len(paramSets))]
+
+    results = [None] * len(paramSets)
+    timeline = []
+    queueStart = time.time()
+    try:
+        for position, (index, descending) in enumerate(order):
+            params = dict(paramSets[index])
+            if dataFileNamePrefix is not None and "dataFileName" not in params:
+                params["dataFileName"] = dataFileNamePrefix + "_" + str(index)
+            if descending is not None:
+                params["descendingEM"] = descending
+                params["keepEMOn"] = True
+
+            print("\x1b[;42m Queue: starting run", position + 1, "of", len(order),
+                  "(parameter set " + str(index) + ") \x1b[m")
+            runEntry = {
+                "index": index,
+                "params": params,
+                "start": time.time(),
+                "end": None,
+                "duration": None,
+                "dataFileName": params.get("dataFileName"),
+                "error": None
+            }
+            timeline.append(runEntry)
+            try:
+                results[index] = experiment.doExperiment(expInsts=expInsts, **params)
+            except Warning as warning:
+                runEntry["error"] = str(warning)
+                raise
+            except Exception as err:
+                runEntry["error"] = repr(err)
+                if stopOnError:
+                    raise
+                print("\x1b[;43m Run", index, "failed, carrying on with the next run \x1b[m")
+            finally:
+                runEntry["end"] = time.time()
+                runEntry["duration"] = runEntry["end"] - runEntry["start"]
+    finally:
+        if reorder and experiment is hallEffect:
+            hallEffect.resetPowerSupplies(expInsts)
+            print("The power supplies have been reset.")
+        totalTime = time.time() - queueStart
+        summary = {
+            "results": results,
+            "timeline": timeline,
+            "totalTime": totalTime,
+            "utilisation": (sum(entry["duration"] for entry in timeline if entry["duration"] is not None) / totalTime
+                            if totalTime > 0 else 0.0)
+        }
+        if dataFileNamePrefix is not None:
+            clearFileAndSaveData({key: summary[key] for key in ["timeline", "totalTime", "utilisation"]},
+                                 dataFileNamePrefix + "_queue")
+
+    return summary
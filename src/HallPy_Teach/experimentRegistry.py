@@ -0,0 +1,256 @@
+"""
+HallPy_Teach.experimentRegistry: finding experiments without importing them
+===========================================================================
+
+Description
+-----------
+Experiments are found in three places:
+    - the experiments shipped with HallPy_Teach
+    - modules registered by other packages under the 'HallPy_Teach.experiments' entry point group, eg.:
+          [project.entry-points."HallPy_Teach.experiments"]
+          myExperiment = "myPackage.myExperiment"
+    - experiment files (see Method 2 in the README) in local directories: the working directory and the directories
+      listed in the HALLPY_TEACH_EXPERIMENTS environment variable (separated by os.pathsep) by default
+
+Only the source of an experiment is read when it is found: its `expName` and `requiredEquipment` are taken from the
+module level assignments without running any code. The module itself (and everything it imports) is only imported
+when one of its functions is used, eg.: when the experiment is picked in Setup().
+
+An experiment file is any Python file assigning `expName` and `requiredEquipment` and defining `setup()` and
+`doExperiment()` at module level.
+
+See Also
+--------
++ ExperimentEntry
++ findExperiments(*args)
++ readExperimentMetadata(*args)
+
+"""
+import ast
+import copy
+import importlib
+import importlib.util
+import os
+import sys
+import threading
+
+entryPointGroup = "HallPy_Teach.experiments"
+"""Entry point group other packages register their experiment modules under
+"""
+
+builtInExperiments = ["HallPy_Teach.experiments.curieWeiss", "HallPy_Teach.experiments.hallEffect"]
+"""Module names of the experiments shipped with HallPy_Teach
+"""
+
+_metadataCache = {}
+_cacheLock = threading.Lock()
+
+
+def readExperimentMetadata(filePath):
+    """Read the name and required equipment of an experiment file without importing it
+
+    Parameters
+    ----------
+    filePath : str
+        Path of the Python file
+
+    Returns
+    -------
+    dict or None
+        Object with keys 'expName' and 'requiredEquipment', or None if the file is not an experiment file (or the values
+        are not plain literals)
+
+    Notes
+    -----
+    The result is cached by path and modification time, so a file is only parsed again after it has been changed.
+    """
+    try:
+        cacheKey = (os.path.realpath(filePath), os.stat(filePath).st_mtime_ns)
+    except OSError:
+        return None
+    with _cacheLock:
+        if cacheKey in _metadataCache:
+            return copy.deepcopy(_metadataCache[cacheKey])
+
+    metadata = _parseExperimentMetadata(filePath)
+    with _cacheLock:
+        for key in [key for key in _metadataCache if key[0] == cacheKey[0]]:
+            del _metadataCache[key]
+        _metadataCache[cacheKey] = metadata
+    return copy.deepcopy(metadata)
+
+
+def _parseExperimentMetadata(filePath):
+    try:
+        with open(filePath, "r", encoding="utf-8") as sourceFile:
+            tree = ast.parse(sourceFile.read(), filename=filePath)
+    except (OSError, SyntaxError, UnicodeDecodeError, ValueError):
+        return None
+
+    metadata = {}
+    functions = set()
+    for node in tree.body:
+        if isinstance(node, ast.FunctionDef):
+            functions.add(node.name)
+        elif isinstance(node, ast.Assign):
+            for target in node.targets:
+                if isinstance(target, ast.Name) and target.id in ("expName", "requiredEquipment"):
+                    try:
+                        metadata[target.id] = ast.literal_eval(node.value)
+                    except ValueError:
+                        return None
+
+    if "expName" not in metadata or "requiredEquipment" not in metadata \
+            or not {"setup", "doExperiment"}.issubset(functions):
+        return None
+    return metadata
+
+
+class ExperimentEntry:
+    """Experiment found by findExperiments(), imported the first time it is used
+
+    `expName` and `requiredEquipment` are available straight away. Every other attribute (eg.: `setup`,
+    `doExperiment`) imports the experiment module and is taken from it, so an entry can be used like the module.
+
+    Parameters
+    ----------
+    expName : str
+        Display name of the experiment
+    requiredEquipment : object
+        Required equipment of the experiment
+    moduleName : str, optional
+        Importable module name (built-in and entry point experiments)
+    filePath : str, optional
+        Path of the experiment file. Local experiments are imported from it if no moduleName is given.
+    """
+
+    def __init__(self, expName, requiredEquipment, moduleName=None, filePath=None):
+        self.expName = expName
+        self.requiredEquipment = requiredEquipment
+        self.moduleName = moduleName
+        self.filePath = filePath
+        self.module = None
+
+    @property
+    def isLoaded(self):
+        return self.module is not None
+
+    def load(self):
+        """Import the experiment module (only once)
+
+        Returns
+        -------
+        module
+        """
+        if self.module is None:
+            if self.moduleName is not None:
+                self.module = importlib.import_module(self.moduleName)
+            else:
+                moduleName = "HallPy_Teach_experiment_" + os.path.splitext(os.path.basename(self.filePath))[0]
+                spec = importlib.util.spec_from_file_location(moduleName, self.filePath)
+                module = importlib.util.module_from_spec(spec)
+                sys.modules[moduleName] = module
+                spec.loader.exec_module(module)
+                self.module = module
+        return self.module
+
+    def __getattr__(self, name):
+        if name.startswith("__") or name == "module":
+            raise AttributeError(name)
+        return getattr(self.load(), name)
+
+    def __repr__(self):
+        return "ExperimentEntry(" + repr(self.expName) + ", " + repr(self.moduleName or self.filePath) + ")"
+
+
+def _entryForModule(moduleName):
+    loaded = sys.modules.get(moduleName)
+    if loaded is not None and hasattr(loaded, "expName") and hasattr(loaded, "requiredEquipment"):
+        entry = ExperimentEntry(loaded.expName, loaded.requiredEquipment, moduleName=moduleName,
+                                filePath=getattr(loaded, "__file__", None))
+        entry.module = loaded
+        return entry
+    try:
+        spec = importlib.util.find_spec(moduleName)
+    except (ImportError, ValueError):
+        return None
+    if spec is None:
+        return None
+
+    metadata = readExperimentMetadata(spec.origin) if spec.origin is not None else None
+    if metadata is not None:
+        return ExperimentEntry(metadata["expName"], metadata["requiredEquipment"], moduleName=moduleName,
+                               filePath=spec.origin)
+
+    # The metadata is not a plain literal, the module has to be imported to read it
+    try:
+        module = importlib.import_module(moduleName)
+    except ImportError:
+        return None
+    if not hasattr(module, "expName") or not hasattr(module, "requiredEquipment"):
+        return None
+    entry = ExperimentEntry(module.expName, module.requiredEquipment, moduleName=moduleName,
+                            filePath=getattr(module, "__file__", None))
+    entry.module = module
+    return entry
+
+
+def _entryPointModules():
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:
+        return []
+    try:
+        found = entry_points(group=entryPointGroup)
+    except TypeError:
+        found = entry_points().get(entryPointGroup, [])
+    return [entryPoint.value.split(":")[0].strip() for entryPoint in found]
+
+
+def findExperiments(experimentDirs=None, includeBuiltIn=True, includeEntryPoints=True):
+    """Find all available experiments
+
+    Parameters
+    ----------
+    experimentDirs : list of str, optional
+        Directories to look for experiment files in. Defaults to the working directory and the directories in the
+        HALLPY_TEACH_EXPERIMENTS environment variable.
+    includeBuiltIn : bool, default=True
+        Include the experiments shipped with HallPy_Teach
+    includeEntryPoints : bool, default=True
+        Include the experiments registered under the entry point group
+
+    Returns
+    -------
+    list of ExperimentEntry
+    """
+    if experimentDirs is None:
+        experimentDirs = [os.getcwd()]
+        experimentDirs += [path for path in os.environ.get("HALLPY_TEACH_EXPERIMENTS", "").split(os.pathsep) if path]
+
+    moduleNames = []
+    if includeBuiltIn:
+        moduleNames += builtInExperiments
+    if includeEntryPoints:
+        moduleNames += [name for name in _entryPointModules() if name not in moduleNames]
+
+    experiments = []
+    for moduleName in moduleNames:
+        entry = _entryForModule(moduleName)
+        if entry is not None:
+            experiments.append(entry)
+
+    knownFiles = {os.path.realpath(entry.filePath) for entry in experiments if entry.filePath is not None}
+    for experimentDir in experimentDirs:
+        if not os.path.isdir(experimentDir):
+            continue
+        for fileName in sorted(os.listdir(experimentDir)):
+            filePath = os.path.realpath(os.path.join(experimentDir, fileName))
+            if not fileName.endswith(".py") or filePath in knownFiles:
+                continue
+            metadata = readExperimentMetadata(filePath)
+            if metadata is not None:
+                knownFiles.add(filePath)
+                experiments.append(ExperimentEntry(metadata["expName"], metadata["requiredEquipment"],
+                                                   filePath=filePath))
+    return experiments
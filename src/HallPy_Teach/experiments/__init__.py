@@ -27,8 +27,9 @@ import time
 
 from pyvisa import VisaIOError
 
-from ..helper import requiredInstrumentNotFound, notEnoughReqInstType, filterArrByKey
+from ..helper import requiredInstrumentNotFound, notEnoughReqInstType
 from ..helper import reconnectInstructions, getInstTypeCount
+from ..instrumentRegistry import InstrumentRegistry
 
 
 def getAndSetupExpInsts(requiredEquipment=None, instruments=None, serials=None, inGui=False):
@@ -38,8 +39,8 @@ def getAndSetupExpInsts(requiredEquipment=None, instruments=None, serials=None,
     ----------
     requiredEquipment : object
         Required equipment list from experiment.py file
-    instruments : list of objects
-        List of instrument objects (see initInstruments() docs)
+    instruments : InstrumentRegistry or list of objects
+        Registry or list of instrument objects (see initInstruments() docs)
     serials : object
         Object with key as var name set in requiredEquipment and value as selected serial number (string)
     inGui : bool, default=False
@@ -49,7 +50,8 @@ def getAndSetupExpInsts(requiredEquipment=None, instruments=None, serials=None,
     -------
     object
         Object with the instruments for the experiment. Key same as var name set in requiredEquipment in experiment.py
-        file and value as instrument object (see initInstruments() docs for object details)
+        file and value as instrument object (see initInstruments() docs for object details). Each instrument object also
+        has the 'serial' and 'idn' of the assigned instrument and its 'record' in the instrument registry.
 
     """
     if serials is None:
@@ -67,6 +69,7 @@ def getAndSetupExpInsts(requiredEquipment=None, instruments=None, serials=None,
         reconnectInstructions(inGui)
         raise Exception("No instruments could be recognised / contacted.")
 
+    instruments = InstrumentRegistry.fromInstruments(instruments)
     instTypeCount = getInstTypeCount(instruments)
     expInstruments = {}
 
@@ -90,8 +93,9 @@ def getAndSetupExpInsts(requiredEquipment=None, instruments=None, serials=None,
                 if len(instNeeded["config"]) > 0:
                     instNeededObj["config"] = instNeeded["config"]
 
+            foundInst = None
             if instTypeCount[instType] == 1 and len(requiredEquipment[instType]) == 1:
-                instNeededObj["res"] = filterArrByKey(instruments, "type", instType)[0]['inst']
+                foundInst = instruments.byType(instType)[0]
             elif instNeeded["var"] not in serials.keys() and instTypeCount[instType] > 1:
                 if not inGui:
                     print(
@@ -101,13 +105,13 @@ def getAndSetupExpInsts(requiredEquipment=None, instruments=None, serials=None,
                 raise Exception("Missing serial numbers for " + instType + " assignment.")
             else:
                 serial = serials[instNeeded["var"]]
-                foundInsts = list(filter(lambda instrument: serial in instrument["name"], instruments))
+                foundInsts = instruments.findBySerial(serial)
                 if len(foundInsts) == 0:
                     print("\x1b[;43m  Please use a valid serial number for the " + instType + ". \x1b[m")
                     print("Serial number entered: " + serial)
                     print("Found Instruments | " + instType + "(s) : ")
                     print("Available " + instType + "(s): ")
-                    for inst in filterArrByKey(instruments, "type", instType):
+                    for inst in instruments.byType(instType):
                         print("   " + inst["name"].replace("\n", " "))
                         print(" ")
                     raise Exception("No instruments with given serial number found.")
@@ -128,7 +132,11 @@ def getAndSetupExpInsts(requiredEquipment=None, instruments=None, serials=None,
                         print(" ")
                     raise Exception("Multiple instruments with same serial number found.")
                 else:
-                    instNeededObj["res"] = foundInsts[0]['inst']
+                    foundInst = foundInsts[0]
+            instNeededObj["res"] = foundInst.session
+            instNeededObj["serial"] = foundInst.serial
+            instNeededObj["idn"] = foundInst.idn
+            instNeededObj["record"] = foundInst
             if "config" in instNeeded.keys():
                 for confLine in instNeededObj["config"]:
                     try:
@@ -1,10 +1,20 @@
+import sys
 import time
 
 import numpy as np
 from IPython.core.display import clear_output
 from pyvisa import VisaIOError
 
-from ..helper import reconnectInstructions, getLCRCap, getLCRCapLoss, showLiveReadings, clearFileAndSaveData
+from ..analysis import CurieWeissEstimator
+from ..background import startExperiment
+from ..columnStore import ColumnStore
+from ..runCatalogue import catalogueRun
+from ..resilience import RecoveryLog, makeExpInstsResilient
+from ..safety import LockedSession, SafetyWatchdog
+from ..scheduler import DeadlineScheduler
+from ..measurementProfiles import applyProfile, clearProfile
+from ..oversampling import estimateRunTimes, readAveraged, readLCRAveraged, setupOversampling
+from ..helper import reconnectInstructions, showLiveReadings, clearFileAndSaveData, parseLCRReading
 from .__init__ import getAndSetupExpInsts
 
 requiredEquipment = {
@@ -18,6 +28,10 @@ requiredEquipment = {
 """Required equipment for the Curie Weiss experiment 
 """
 
+dataColumns = ["time", "temp", "cap", "capLoss", "actualTime", "tempErr", "capErr", "capLossErr"]
+"""Columns of the data store used during the Curie Weiss experiment (one row per data point)
+"""
+
 expName = "Curie Weiss Lab"
 """Required equipment for the Curie Weiss experiment 
 """
@@ -88,11 +102,59 @@ def exampleExpCode():
     print("   2 |          expInsts=hp.expInsts,")
     print("   3 |          exptLength=50,")
     print("   4 |          measurementInterval=5,")
-    print("   5 |          dataFileName='curieWeissData'")
-    print("   6 |        )")
+    print("   5 |          dataFileName='curieWeissData',")
+    print("   6 |          earlyStopWeissTempTol=0.5     [optional, stop once the Weiss temp. is known to +/- 0.5ºC]")
+    print("   7 |        )")
+
+
+def getLiveGraphs(data, exptLength):
+    """Graphs shown during the Curie Weiss experiment
+
+    Parameters
+    ----------
+    data : object
+        Data collected so far (see doExperiment())
+    exptLength : float
+        Length of the experiment in minutes, used for the time axis
+
+    Returns
+    -------
+    tuple[object, object, object]
+        Time vs temperature, temperature vs capacitance and temperature vs 1 / capacitance graph objects (see
+        showLiveReadings())
+    """
+    timeVsTempGraph = {
+        "title": "Time Vs Temperature",
+        "xlim": (-1, (exptLength * 60)),
+        "ylim": (np.amin(data["temp"]), np.amax(data["temp"])),
+        "xdata": data["time"],
+        "ydata": data["temp"],
+        "xlabel": 'Time (S)',
+        "ylabel": 'Temperature (ºC)'
+    }
+    tempVsCapGraph = {
+        "title": "Temperature Vs Capacitance",
+        "xlim": (np.amin(data["temp"]), np.amax(data["temp"])),
+        "ylim": (np.amin(data["cap"]), np.amax(data["cap"])),
+        "xdata": data["temp"],
+        "ydata": data["cap"],
+        "xlabel": "Temperature (ºC)",
+        "ylabel": "Capacitance (F)"
+    }
+    tempVsInvCapGraph = {
+        "title": "Temperature Vs 1 / Capacitance",
+        "xdata": data["temp"],
+        "ydata": 1 / data["cap"],
+        "xlabel": "Temperature (ºC)",
+        "ylabel": "1 / Capacitance (1/F)"
+    }
+    return timeVsTempGraph, tempVsCapGraph, tempVsInvCapGraph
 
 
-def doExperiment(expInsts=None, exptLength=None, measurementInterval=5, dataFileName=None):
+def doExperiment(expInsts=None, exptLength=None, measurementInterval=5, dataFileName=None, earlyStopWeissTempTol=None,
+                 earlyStopCurieConstRelTol=0.05, safetyInterval=1.0, retryPolicy=None,
+                 overrunPolicy="skip", profile=None, broadcaster=None, samplesPerPoint=1, averaging="auto",
+                 triggerDeltaT=None, pollInterval=1.0, liveDisplay=True, runControl=None):
     """Function to perform the Curie Weiss experiment
 
     Parameters
@@ -105,12 +167,65 @@ def doExperiment(expInsts=None, exptLength=None, measurementInterval=5, dataFile
     measurementInterval : int
         Length of the interval between subsequent mreasurements in seconds
     dataFileName : str, optional
-     Name of the file where the collected data will be saved (the saved file will have a '.p' extension)
+     Name of the file where the collected data will be saved (the saved file will have a '.p' extension). Completed
+     runs are also added to the run catalogue (see runCatalogue).
+    earlyStopWeissTempTol : float, optional
+        If provided, the experiment stops early once the live Curie Weiss fit has converged: the confidence interval
+        half-width of the Weiss temperature is below this value (ºC) and the Curie constant is known to within
+        earlyStopCurieConstRelTol.
+    earlyStopCurieConstRelTol : float, default=0.05
+        Relative confidence interval half-width of the Curie constant needed for an early stop
+    safetyInterval : float or None, default=1.0
+        Time in seconds between temperature checks by the safety watchdog (see safety.SafetyWatchdog), which runs
+        independently of the data collection and stops the experiment as soon as the maximum operating temperature is
+        exceeded. The recorded temperatures are taken from the first watchdog reading after each data point is due.
+        None turns the watchdog off and the temperature is read once per data point.
+    retryPolicy : resilience.RetryPolicy, optional
+        If provided, instrument commands which fail with a VISA error are retried, and instruments which stop responding
+        are reconnected by serial number and set up again (see resilience.ResilientSession) instead of aborting the
+        experiment
+    overrunPolicy : str, default='skip'
+        What to do when a data point takes longer than measurementInterval: 'skip' the missed time slots (keeping a
+        regular time grid) or 'catchUp' by taking the next points without waiting (see scheduler.DeadlineScheduler)
+    profile : str, optional
+        Measurement profile of the temperature multimeter, 'fast', 'balanced' or 'precise' (see measurementProfiles).
+        The expected reading time and noise are stored in runInfo['measurementProfile']. None (default) sets the
+        multimeter back to the config of setup() if an earlier run used a profile (the integration time and autozero of
+        that profile are kept, see measurementProfiles.clearProfile()).
+    broadcaster : broadcast.LiveBroadcaster, optional
+        If provided, every data point is also sent to the broadcaster's subscribers (stream 1, values in the order of
+        dataColumns)
+    samplesPerPoint : int, default=1
+        Number of readings averaged into every temperature, capacitance and capacitance loss value. Their standard
+        errors are stored in the 'tempErr', 'capErr' and 'capLossErr' columns (see oversampling). With more than one
+        sample the temperature is read from the multimeter for every point instead of taken from the safety watchdog.
+        The expected data collection time with every averaging strategy is shown before the run starts.
+    averaging : str, default='auto'
+        How the readings are averaged: 'instrument' (the multimeter's averaging filter, the LCR meter's readings are
+        always averaged by the host), 'host' (a burst of readings averaged with numpy) or 'auto'
+    triggerDeltaT : float, optional
+        If provided, points are recorded when the temperature changes instead of on a fixed interval: the temperature
+        is polled every pollInterval seconds (from the safety watchdog readings if it is on) and the capacitance is
+        only read, and a point recorded, once the temperature has moved by triggerDeltaT ºC since the last point or
+        measurementInterval seconds have passed. Slow parts of the heating curve get fewer points and fast ramps
+        more. The number of polls and LCR queries is stored in runInfo['trigger'].
+    pollInterval : float, default=1.0
+        Time in seconds between temperature polls when triggerDeltaT is provided (at most measurementInterval)
+    liveDisplay : bool, default=True
+        Show the live readings and graphs after every data point
+    runControl : background.RunHandle, optional
+        Handle of a background run (see start()), checked before every data point to pause or cancel the run. The
+        temperature is still checked by the safety watchdog while the run is paused.
 
     Returns
     -------
-    dict[str, Union[list, ndarray]]
-        Data collected during the experiment. See examples for an example data set
+    dict[str, Union[ndarray, dict]]
+        Data collected during the experiment and the final Curie Weiss fit ('curieWeissFit', see
+        analysis.CurieWeissEstimator.estimate()). See examples for an example data set. The arrays are views of the
+        data store used during collection (see dataColumns), so no copies are made. The 'runInfo' key holds information
+        about the run: experiment name, parameters, instrument IDNs and serials, start and end time (time.time()),
+        timing statistics (see scheduler.DeadlineScheduler.report()) and the recovery counts and events (see
+        resilience.RecoveryLog.summary()).
 
     Example
     -------
@@ -120,7 +235,15 @@ def doExperiment(expInsts=None, exptLength=None, measurementInterval=5, dataFile
     >>>     "time": [0, 5, 10, 15, 20, 25, 30],
     >>>     "temp": [24.1, 25.2, 26.4, 27.2, 28.2, 29.2, 30.0],
     >>>     "cap": [2e-9, 3e-9, 4e-9, 5e-9, 6e-9, 7e-9, 8e-9],
-    >>>     "capLoss": [2e-11, 2e-11, 2e-11, 2e-11, 2e-11, 2e-11, 2e-11]
+    >>>     "capLoss": [2e-11, 2e-11, 2e-11, 2e-11, 2e-11, 2e-11, 2e-11],
+    >>>     "actualTime": [0.0001, 5.0002, 10.0001, 15.0003, 20.0001, 25.0002, 30.0001],
+    >>>     "tempErr": [nan, nan, nan, nan, nan, nan, nan],
+    >>>     "capErr": [nan, nan, nan, nan, nan, nan, nan],
+    >>>     "capLossErr": [nan, nan, nan, nan, nan, nan, nan],
+    >>>     "curieWeissFit": {"points": 7, "curieConst": 1.2e-6, "curieConstCI": 3e-8, "weissTemp": 19.8,
+    >>>                       "weissTempCI": 0.4},
+    >>>     "runInfo": {"experiment": "Curie Weiss Lab", "parameters": {...}, "instruments": {...}, "startTime": ...,
+    >>>                 "endTime": ..., "timing": {...}, "retries": 0, "reconnects": 0, "recovered": 0, "failed": 0, "recoveryEvents": []}
     >>> }
     """
     if expInsts is None:
@@ -156,31 +279,135 @@ def doExperiment(expInsts=None, exptLength=None, measurementInterval=5, dataFile
         print("\x1b[;43m NOTE : The desired length should be entered in seconds. (integer values only) \x1b[m")
         raise ValueError("Invalid measurement interval time in doExperiment(). Argument in question: "
                          "measurementInterval")
-    data = {
-        "time": [],
-        "temp": [],
-        "cap": [],
-        "capLoss": []
+    if triggerDeltaT is not None:
+        if not isinstance(triggerDeltaT, (int, float)) or triggerDeltaT <= 0:
+            print("\x1b[;41m Please provide a valid temperature change to trigger a measurement on \x1b[m")
+            print("The temperature change should be a positive number in ºC (eg.: triggerDeltaT=0.25)")
+            raise ValueError("Invalid trigger temperature change in doExperiment(). Argument in question: "
+                             "triggerDeltaT")
+        if not isinstance(pollInterval, (int, float)) or pollInterval <= 0 or pollInterval > measurementInterval:
+            print("\x1b[;41m Please provide a valid temperature poll interval \x1b[m")
+            print("The poll interval should be more than 0 seconds and at most the measurement interval (",
+                  str(measurementInterval), "seconds)")
+            raise ValueError("Invalid poll interval in doExperiment(). Argument in question: pollInterval")
+        pointInterval = pollInterval
+        capacity = int((exptLength * 60) / pollInterval) + 2
+    else:
+        pointInterval = measurementInterval
+        capacity = (exptLength * 60) // max(measurementInterval, 1) + 2
+    store = ColumnStore(dataColumns, capacity=capacity)
+    data = store.views()
+
+    profileReport = None
+    if profile is not None:
+        profileReport = {"mm": applyProfile(expInsts["mm"], profile, "TCO")}
+    else:
+        clearProfile(expInsts["mm"])
+
+    # Set up for every run, so an averaging filter left on by an earlier oversampled run is turned off
+    samplingPlans = {
+        "mm": setupOversampling(expInsts["mm"], "TCO", samplesPerPoint, averaging,
+                                profileReport["mm"] if profileReport is not None else None),
+        "lcr": setupOversampling(expInsts["lcr"], "LCR", samplesPerPoint, "host" if averaging == "instrument"
+                                 else averaging),
     }
+    oversamplingReport = None
+    sampling = {"mm": None, "lcr": None}
+    if samplesPerPoint != 1:
+        sampling = samplingPlans
+        oversamplingReport = {
+            "instruments": sampling,
+            "runTimeEstimates": estimateRunTimes(sampling, (exptLength * 60) // max(measurementInterval, 1),
+                                                 measurementInterval),
+        }
 
     lcr = expInsts["lcr"]["res"]
     mm = expInsts["mm"]["res"]
 
+    recoveryLog = RecoveryLog()
+    if retryPolicy is not None:
+        sessions, recoveryLog = makeExpInstsResilient(expInsts, retryPolicy, recoveryLog)
+        lcr = sessions["lcr"]
+        mm = sessions["mm"]
+
+    cwEstimator = CurieWeissEstimator()
+
+    # The heating element is not controlled by the computer, so the watchdog can only warn and stop the data collection
+    # (the experiment loop raises as soon as it has tripped)
+    def tempTooHigh():
+        print("\x1b[;41m IMMEDIATELY TURN OFF THE HEATING ELEMENT \x1b[m")
+        print("The temperature has exceeded the maximum operating temperature of", str(maxOperatingTemp), "ºC")
+
+    watchdog = None
+    pause = time.sleep
+    if safetyInterval is not None:
+        mm = LockedSession(mm)
+        watchdog = SafetyWatchdog(
+            checks=[{"name": "temp", "read": lambda: float(mm.query("READ?")), "limit": maxOperatingTemp, "unit": "ºC"}],
+            shutdown=tempTooHigh,
+            interval=safetyInterval
+        )
+        pause = watchdog.sleep
+
     timePassed = 0.00
     timeLeft = exptLength * 60
+    polls = 0
+    lastPointTemp = None
+    lastPointTime = 0.0
+    runStartTime = time.time()
 
-    try:
-        while timeLeft > 0:
-            startTimeCurLoop = time.time()
-
-            curTemp = float(mm.query("READ?"))
-            curCap = getLCRCap(lcr)
-            curCapLoss = getLCRCapLoss(lcr)
+    if broadcaster is not None:
+        broadcaster.announce(1, dataColumns, expName)
 
-            data["time"].append(timePassed)
-            data["temp"].append(curTemp)
-            data["cap"].append(curCap)
-            data["capLoss"].append(curCapLoss)
+    try:
+        tempSince = time.perf_counter()
+        if watchdog is not None:
+            watchdog.start()
+        scheduler = DeadlineScheduler(pointInterval, overrunPolicy=overrunPolicy, sleep=pause)
+        scheduler.start()
+        while scheduler.slot * pointInterval < exptLength * 60:
+            if runControl is not None:
+                scheduler.shift(runControl.checkpoint(
+                    data, scheduler.slot * pointInterval / (exptLength * 60),
+                    whilePaused=watchdog.raiseIfTripped if watchdog is not None else None))
+            timePassed, actualTime = scheduler.tick()
+            tickTime = time.perf_counter()
+            timeLeft = exptLength * 60 - timePassed
+
+            curTemp = None
+            if watchdog is not None:
+                # Only a reading taken after this point was due is used (for the first point, the one taken when the
+                # watchdog started), so no temperature is stale or recorded for two data points
+                curTemp = watchdog.cache.waitForNewer("temp", tickTime if tempSince is None else tempSince,
+                                                      timeout=5 * safetyInterval + 1)
+                tempSince = None
+                watchdog.raiseIfTripped()
+
+            if triggerDeltaT is not None:
+                # Only the temperature is polled until it has moved enough (or the measurement interval has passed)
+                polls += 1
+                if curTemp is None:
+                    curTemp = readAveraged(mm)[0]
+                if lastPointTemp is not None and abs(curTemp - lastPointTemp) < triggerDeltaT \
+                        and timePassed - lastPointTime < measurementInterval and curTemp <= maxOperatingTemp:
+                    scheduler.waitForNext()
+                    continue
+
+            curTempErr = float("nan")
+            if curTemp is None or samplesPerPoint > 1:
+                curTemp, curTempErr = readAveraged(mm, sampling["mm"])
+            lastPointTemp = curTemp
+            lastPointTime = timePassed
+            curCap, curCapErr, curCapLoss, curCapLossErr = readLCRAveraged(lcr, sampling["lcr"])
+
+            row = (timePassed, curTemp, curCap, curCapLoss, actualTime, curTempErr, curCapErr, curCapLossErr)
+            store.appendRow(*row)
+            if broadcaster is not None:
+                broadcaster.publish(1, row)
+            data.update(store.views())
+            cwEstimator.update(curTemp, curCap)
+            cwFit = cwEstimator.estimate()
+            data["curieWeissFit"] = cwFit
 
             if dataFileName is not None:
                 clearFileAndSaveData(data, dataFileName)
@@ -198,59 +425,155 @@ def doExperiment(expInsts=None, exptLength=None, measurementInterval=5, dataFile
                 "Temp (ºC)": curTemp,
                 "Capacitance (F)": curCap,
                 "Capacitance Loss (F)": curCapLoss,
+                "Weiss Temp. (ºC)": str(np.round(cwFit["weissTemp"], 2)) + " \u00b1 "
+                                     + str(np.round(cwFit["weissTempCI"], 2)),
+                "Curie Const. (F ºC)": "{:.3e} \u00b1 {:.1e}".format(cwFit["curieConst"], cwFit["curieConstCI"]),
                 "Time Passed": timePassed,
                 "Time Left": timeLeft
             }
-            timeVsTempGraph = {
-                "title": "Time Vs Temperature",
-                "xlim": (-1, (exptLength * 60)),
-                "ylim": (np.amin(data["temp"]), np.amax(data["temp"])),
-                "xdata": np.array(data["time"]),
-                "ydata": np.array(data["temp"]),
-                "xlabel": 'Time (S)',
-                "ylabel": 'Temperature (ºC)'
-            }
-            tempVsCapGraph = {
-                "title": "Temperature Vs Capacitance",
-                "xlim": (np.amin(data["temp"]), np.amax(data["temp"])),
-                "ylim": (np.amin(data["cap"]), np.amax(data["cap"])),
-                "xdata": np.array(data["temp"]),
-                "ydata": np.array(data["cap"]),
-                "xlabel": "Temperature (ºC)",
-                "ylabel": "Capacitance (F)"
-            }
-
-            clear_output(wait=True)
-            showLiveReadings(liveReadings=liveReadings, g1=timeVsTempGraph, g2=tempVsCapGraph)
-            print("\x1b[;41m The experiment will shut down if the temperature exceeds", str(maxOperatingTemp),
-                  "ºC \x1b[m")
+            if liveDisplay:
+                clear_output(wait=True)
+                showLiveReadings(liveReadings, *getLiveGraphs(data, exptLength))
+                print("\x1b[;41m The experiment will shut down if the temperature exceeds", str(maxOperatingTemp),
+                      "ºC \x1b[m")
 
-            endTimrCurrLoop = time.time()
-            loopTime = endTimrCurrLoop - startTimeCurLoop
-            if loopTime < measurementInterval:
-                time.sleep(measurementInterval - loopTime)
+            if earlyStopWeissTempTol is not None and cwEstimator.isConverged(earlyStopWeissTempTol,
+                                                                             earlyStopCurieConstRelTol):
+                print("\x1b[;42m The Curie Weiss fit has converged, stopping the experiment early \x1b[m")
+                break
 
-            timePassed += measurementInterval
-            timeLeft -= measurementInterval
+            scheduler.waitForNext()
 
     except VisaIOError:
+        if watchdog is not None:
+            watchdog.stop()
         print("\x1b[;41m IMMEDIATELY TURN OFF THE HEATING ELEMENT \x1b[m")
         print("Could not complete the full experiment")
         if dataFileName is not None:
             print("The data collected till now has been saved in", dataFileName + ".p")
         raise
     except:
+        if watchdog is not None:
+            watchdog.stop()
         print("\x1b[43m Could not complete the full experiment \x1b[m")
         if dataFileName is not None:
             print("The data collected till now has been saved in", dataFileName + ".p")
         raise
 
+    if watchdog is not None:
+        watchdog.stop()
     print("Experiment completed")
+
+    data["curieWeissFit"] = cwEstimator.estimate()
+    data["runInfo"] = {
+        "experiment": expName,
+        "parameters": {
+            "exptLength": exptLength,
+            "measurementInterval": measurementInterval,
+            "profile": profile,
+            "samplesPerPoint": samplesPerPoint,
+            "averaging": averaging,
+            "triggerDeltaT": triggerDeltaT,
+            "pollInterval": pollInterval if triggerDeltaT is not None else None,
+        },
+        "instruments": {var: expInsts[var].get("idn", "") for var in expInsts.keys()},
+        "serials": {var: expInsts[var].get("serial", "") for var in expInsts.keys()},
+        "startTime": runStartTime,
+        "endTime": time.time(),
+        "timing": scheduler.report(),
+        "measurementProfile": profileReport,
+        "oversampling": oversamplingReport,
+        "trigger": {
+            "polls": polls,
+            "points": len(store),
+            "lcrQueries": len(store) * (samplesPerPoint if sampling["lcr"] is not None
+                                        and sampling["lcr"]["strategy"] == "host" else 1),
+        } if triggerDeltaT is not None else None,
+    }
+    data["runInfo"].update(recoveryLog.summary())
+    if recoveryLog.events:
+        print("Recovered from", data["runInfo"]["recovered"], "instrument error(s) during the experiment.")
+
     if dataFileName is not None:
+        clearFileAndSaveData(data, dataFileName)
+        catalogueRun(data, dataFileName + ".p")
         print("The data collected till now has been saved in", dataFileName + ".p")
 
-    for key in data.keys():
-        if type(data[key]) == list:
-            data[key] = np.array(data[key])
-
     return data
+
+
+def start(*args, **kwargs):
+    """Run doExperiment() on a worker thread without blocking the notebook
+
+    Takes the same arguments as doExperiment() ('liveDisplay' defaults to False) and returns a background.RunHandle
+    giving the data collected so far, the progress and the estimated time left, and pausing, resuming or cancelling
+    the run. See background.startExperiment().
+
+    Example
+    -------
+    >>> run = curieWeiss.start(expInsts, exptLength=60, measurementInterval=5)
+    >>> run.progress, run.eta
+    >>> showLiveReadings({}, *getLiveGraphs(run.data, 60))
+    >>> data = run.result()
+    """
+    return startExperiment(sys.modules[__name__], *args, **kwargs)
+
+
+def sweepDescription(exptLength=None, measurementInterval=5, safetyInterval=1.0, samplesPerPoint=1):
+    """Sweep description of the Curie Weiss experiment (see sweepPlan)
+
+    Running it with sweepPlan.runSweep() gives data in the same format as doExperiment(), including the Curie Weiss fit
+    updated after every data point. The capacitance and capacitance loss are taken with a single LCR query and the
+    temperature is taken from the safety watchdog readings.
+
+    Parameters
+    ----------
+    exptLength, measurementInterval, safetyInterval
+        See doExperiment()
+    samplesPerPoint : int, default=1
+        Readings averaged by the computer for every value (see oversampling)
+
+    Returns
+    -------
+    dict
+        Sweep description (see sweepPlan)
+
+    Example
+    -------
+    >>> from HallPy_Teach import sweepPlan
+    >>> data = sweepPlan.runSweep(sweepDescription(exptLength=60), expInsts, dataFileName="curieWeissRun")
+    """
+    if exptLength is None or exptLength <= 0:
+        print("\x1b[;43m Please provide the length of the experiment in minutes \x1b[m")
+        raise ValueError("Invalid experiment length. Argument in question: exptLength")
+
+    cwEstimator = CurieWeissEstimator()
+
+    def updateFit(data, point):
+        cwEstimator.update(point["temp"], point["cap"])
+        data["curieWeissFit"] = cwEstimator.estimate()
+
+    def finalFit(data):
+        data["curieWeissFit"] = cwEstimator.estimate()
+
+    return {
+        "expName": expName,
+        "requiredEquipment": requiredEquipment,
+        "parameters": {
+            "exptLength": exptLength,
+            "measurementInterval": measurementInterval,
+            "samplesPerPoint": samplesPerPoint,
+        },
+        "axes": [{"name": "point", "duration": exptLength * 60}],
+        "readings": [
+            {"name": "temp", "inst": "mm", "samples": samplesPerPoint, "uncertainty": True},
+            {"names": ["cap", "capLoss"], "inst": "lcr", "query": "FETCh?", "parse": parseLCRReading,
+             "samples": samplesPerPoint, "uncertainty": True},
+        ],
+        "limits": [{"reading": "temp", "max": 61, "unit": "ºC", "watch": safetyInterval,
+                    "message": "IMMEDIATELY TURN OFF THE HEATING ELEMENT"}],
+        "interval": measurementInterval,
+        "onPoint": updateFit,
+        "onFinish": finalFit,
+        "liveGraphs": lambda data: getLiveGraphs(data, exptLength),
+    }
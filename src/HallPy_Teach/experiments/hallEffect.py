@@ -1,3 +1,4 @@
+import sys
 import time
 
 import numpy as np
@@ -7,7 +8,16 @@ from matplotlib.collections import PolyCollection
 from pyvisa import VisaIOError
 
 from .__init__ import getAndSetupExpInsts
-from ..helper import parseQueryReading, reconnectInstructions, showLiveReadings, setPSCurr, setPSVolt, clearFileAndSaveData
+from ..background import startExperiment
+from ..columnStore import ColumnStore
+from ..runCatalogue import catalogueRun
+from ..resilience import RecoveryLog, makeExpInstsResilient
+from ..safety import LockedSession, SafetyWatchdog
+from ..scheduler import DeadlineScheduler
+from ..measurementProfiles import applyProfile, clearProfile
+from ..oversampling import estimateRunTimes, readAveraged, setupOversampling
+from ..helper import reconnectInstructions, showLiveReadings, setPSCurr, setPSVolt, clearFileAndSaveData
+from ..helper import invalidatePSState
 
 requiredEquipment = {
     "Power Supply": [
@@ -22,12 +32,176 @@ requiredEquipment = {
 """Required equipment for the Hall Effect experiment 
 """
 
+hallBarVars = ["hcPS", "hvMM", "hcMM"]
+"""'var' names of the instruments used for a single Hall bar. For every extra Hall bar sharing the electromagnet the
+bar number is appended (eg.: 'hcPS2', 'hvMM2', 'hcMM2' for the second bar, see getRequiredEquipment())
+"""
+
+dataColumns = ["emVolt", "time", "supplyVolt", "supplyCurr", "hallBarVolt", "emCurr", "actualTime", "supplyCurrErr",
+               "hallBarVoltErr"]
+"""Columns of the flat data store used during the Hall Effect experiment (one row per data point)
+"""
+
 expName = "Hall Effect Lab"
 """Display name for the Hall Effect experiment
 """
 
 
-def setup(instruments=None, serials=None, inGui=False):
+def getRequiredEquipment(hallBars=1):
+    """Required equipment for a Hall Effect experiment with one or more Hall bars in the same electromagnet
+
+    Every Hall bar needs its own current supply and multimeters. The instruments of the first bar use the 'var' names
+    of requiredEquipment, the instruments of bar n > 1 have n appended to them (eg.: 'hcPS2').
+
+    Parameters
+    ----------
+    hallBars : int, default=1
+        Number of Hall bars
+
+    Returns
+    -------
+    object
+        Required equipment object in the same format as requiredEquipment
+    """
+    if type(hallBars) != int or hallBars < 1:
+        raise ValueError("Invalid number of Hall bars. Argument in question: hallBars")
+
+    equipment = {instType: [dict(instNeeded) for instNeeded in requiredEquipment[instType]]
+                 for instType in requiredEquipment.keys()}
+    for bar in range(2, hallBars + 1):
+        for instType in requiredEquipment.keys():
+            for instNeeded in requiredEquipment[instType]:
+                if instNeeded["var"] in hallBarVars:
+                    extraInst = dict(instNeeded)
+                    extraInst["var"] = instNeeded["var"] + str(bar)
+                    extraInst["purpose"] = instNeeded["purpose"] + " (Hall Bar " + str(bar) + ")"
+                    equipment[instType].append(extraInst)
+    return equipment
+
+
+def countHallBars(expInsts):
+    """Number of Hall bars set up in an expInsts object (see setup())"""
+    bars = 1
+    while all(var + str(bars + 1) in expInsts.keys() for var in hallBarVars):
+        bars += 1
+    return bars
+
+
+def getHallBarData(data, bar=1):
+    """Data set of a single Hall bar
+
+    With several Hall bars, doExperiment() returns the data of the first bar in the usual format and the data of bar
+    n > 1 under the key 'hallBar<n>'. This function returns the data of any bar in the usual format so it can be used
+    with the analysis functions (eg.: analysis.fitHallSweeps()).
+
+    Parameters
+    ----------
+    data : object
+        Data object from doExperiment() in the hall effect experiment
+    bar : int, default=1
+        Number of the Hall bar
+
+    Returns
+    -------
+    object
+    """
+    if bar == 1:
+        return {key: data[key] for key in data.keys() if not str(key).startswith("hallBar")}
+    return data["hallBar" + str(bar)]
+
+
+def groupIndependentBars(bars):
+    """Group Hall bars which can be swept at the same time
+
+    Bars are only swept together if none of their instruments are used by another bar in the group (eg.: two bars
+    wired to the same multimeter have to be measured one after the other).
+
+    Parameters
+    ----------
+    bars : list of dict
+        One object per Hall bar with the instrument objects under the hallBarVars keys
+
+    Returns
+    -------
+    list of list of dict
+        Groups of bars, in order
+    """
+    groups = []
+    for bar in bars:
+        barInsts = [id(getattr(bar[var], "wrappedSession", bar[var])) for var in hallBarVars]
+        for group in groups:
+            if not any(instId in group["insts"] for instId in barInsts):
+                group["bars"].append(bar)
+                group["insts"].update(barInsts)
+                break
+        else:
+            groups.append({"bars": [bar], "insts": set(barInsts)})
+    return [group["bars"] for group in groups]
+
+
+def planAdaptiveRefinement(supplyVolt, supplyCurr, hallBarVolt, tol=None, maxNewPoints=None, minStep=0.002):
+    """Supply voltages to add to a sweep where the Hall curve changes
+
+    For every measured point the residual from the straight line through its two neighbours (hall bar voltage vs
+    supply current, with the points ordered by supply voltage) measures the local curvature. Intervals next to a point
+    with a residual above the tolerance are split in half, the intervals with the largest residuals first.
+
+    Parameters
+    ----------
+    supplyVolt : array_like
+        Supply voltages of the points measured so far, in any order
+    supplyCurr : array_like
+        Supply currents of the points. A 2D array (one row per Hall bar swept together) is also accepted.
+    hallBarVolt : array_like
+        Hall bar voltages of the points, same shape as supplyCurr
+    tol : float, optional
+        Largest allowed residual in V. Defaults to 2% of the range of Hall bar voltages measured so far.
+    maxNewPoints : int, optional
+        Largest number of supply voltages to return
+    minStep : float, default=0.002
+        Intervals shorter than twice this voltage are not split (the power supply can only set steps of 0.001V)
+
+    Returns
+    -------
+    list of float
+        Supply voltages to measure next, in increasing order. Empty if no interval needs refining.
+    """
+    supplyVolt = np.asarray(supplyVolt, dtype=float)
+    supplyCurr = np.atleast_2d(np.asarray(supplyCurr, dtype=float))
+    hallBarVolt = np.atleast_2d(np.asarray(hallBarVolt, dtype=float))
+    if len(supplyVolt) < 3 or (maxNewPoints is not None and maxNewPoints <= 0):
+        return []
+
+    order = np.argsort(supplyVolt)
+    volts = supplyVolt[order]
+    curr = supplyCurr[:, order]
+    hallV = hallBarVolt[:, order]
+
+    currSpan = curr[:, 2:] - curr[:, :-2]
+    currSpan[currSpan == 0] = np.nan
+    weight = (curr[:, 1:-1] - curr[:, :-2]) / currSpan
+    residuals = np.abs(hallV[:, 1:-1] - (hallV[:, :-2] + weight * (hallV[:, 2:] - hallV[:, :-2])))
+    residuals = np.nan_to_num(residuals)
+
+    if tol is None:
+        scaledTol = np.maximum(0.02 * np.ptp(hallV, axis=1, keepdims=True), np.finfo(float).tiny)
+    else:
+        scaledTol = tol
+    pointScores = np.max(residuals / scaledTol, axis=0)
+
+    # Score of interval j (between points j and j + 1) is the largest score of its interior end points
+    paddedScores = np.concatenate(([0.0], pointScores, [0.0]))
+    intervalScores = np.maximum(paddedScores[:-1], paddedScores[1:])
+    intervalScores[np.diff(volts) < 2 * minStep] = 0
+
+    candidates = np.argsort(intervalScores)[::-1]
+    candidates = candidates[intervalScores[candidates] > 1]
+    if maxNewPoints is not None:
+        candidates = candidates[:maxNewPoints]
+    return sorted(float(np.round((volts[j] + volts[j + 1]) / 2, 3)) for j in candidates)
+
+
+def setup(instruments=None, serials=None, inGui=False, hallBars=1):
     """Setup function for the Hall Effect experiment
 
     Mainly handles sending proper errors and guidance to students so that they can do a majority of the troubleshooting.
@@ -41,6 +215,9 @@ def setup(instruments=None, serials=None, inGui=False):
         Object with key as 'var' name in requiredEquipment and value as the serial number of the specific instrument to be used for the defied purpose
     inGui: bool
         Bool to define if the jupyter python widgets GUI is being used
+    hallBars: int, default=1
+        Number of Hall bars in the electromagnet, each with its own current supply and multimeters (see
+        getRequiredEquipment() for the 'var' names of the extra instruments)
 
     Returns
     -------
@@ -58,7 +235,7 @@ def setup(instruments=None, serials=None, inGui=False):
         reconnectInstructions(inGui)
         raise Exception("No instruments could be recognised / contacted")
 
-    foundReqInstruments = getAndSetupExpInsts(requiredEquipment, instruments, serials, inGui)
+    foundReqInstruments = getAndSetupExpInsts(getRequiredEquipment(hallBars), instruments, serials, inGui)
 
     print("\x1b[;42m Instruments ready to use for Hall Effect experiment \x1b[m")
     print("Proceed as shown:")
@@ -98,6 +275,41 @@ def exampleExpCode():
     print("   8 |        )")
 
 
+def resetPowerSupplies(expInsts):
+    """Set the current and voltage of the electromagnet and all Hall bar current supplies to 0
+
+    Parameters
+    ----------
+    expInsts : object
+        Object returned by setup()
+
+    Returns
+    -------
+    None
+    """
+    for var in ["emPS"] + ["hcPS" + ("" if bar == 1 else str(bar)) for bar in range(1, countHallBars(expInsts) + 1)]:
+        setPSCurr(0.000, expInsts[var]["res"], force=True)
+        setPSVolt(0.000, expInsts[var]["res"], force=True)
+
+
+def getSweepKeys(data):
+    """Keys of the electromagnet sweeps in a Hall Effect data set
+
+    The data set returned by doExperiment() also holds run information ('runInfo') next to the sweeps, this function
+    only returns the str(emV) keys of the sweeps.
+
+    Parameters
+    ----------
+    data : object
+        Data object from doExperiment() in the hall effect experiment
+
+    Returns
+    -------
+    list of str
+    """
+    return [key for key in data.keys() if isinstance(data[key], dict) and "time" in data[key]]
+
+
 def draw3DHELabGraphs(dataToGraph):
     """Outputs 3D graph
 
@@ -136,15 +348,17 @@ def draw3DHELabGraphs(dataToGraph):
     }
 
     emVsWithData = []
-    for emV in list(dataToGraph.keys()):
+    for emV in getSweepKeys(dataToGraph):
         if len(dataToGraph[emV]['time']) > 0:
             emVsWithData.append(emV)
 
     verts = []
     for emV in emVsWithData:
         if len(dataToGraph[emV]['time']) > 0:
-            verts.append(list(zip(np.array(dataToGraph[emV][toGraphOnX]) * dataScaling[toGraphOnX],
-                                  np.array(dataToGraph[emV][toGraphOnY]) * dataScaling[toGraphOnY]
+            # Adaptive sweeps are not measured in order of the supply voltage
+            order = np.argsort(dataToGraph[emV]["supplyVolt"], kind="stable")
+            verts.append(list(zip(np.array(dataToGraph[emV][toGraphOnX])[order] * dataScaling[toGraphOnX],
+                                  np.array(dataToGraph[emV][toGraphOnY])[order] * dataScaling[toGraphOnY]
                                   )))
 
     for xySet in verts:
@@ -175,6 +389,7 @@ def draw3DHELabGraphs(dataToGraph):
            zlim=(yMin, yMax),
            ylim=(np.amin([float(V) for V in emVsWithData]) - 2, np.amax([float(V) for V in emVsWithData]) + 2))
     plt.show()
+    plt.close(fig)
 
 
 def doExperiment(
@@ -184,7 +399,21 @@ def doExperiment(
     dataPointsPerSupSweep=0, 
     measurementInterval=1, 
     dataFileName=None,
-    plot=True
+    plot=True,
+    safetyInterval=0.2,
+    retryPolicy=None,
+    descendingEM=False,
+    keepEMOn=False,
+    overrunPolicy="skip",
+    profile=None,
+    adaptive=False,
+    adaptiveTol=None,
+    coarsePoints=None,
+    broadcaster=None,
+    samplesPerPoint=1,
+    averaging="auto",
+    liveDisplay=True,
+    runControl=None
 ):
     """Function to perform the Hall Effect experiment
 
@@ -207,14 +436,79 @@ def doExperiment(
     measurementInterval : int
         Measurement interval between data collections in seconds
     dataFileName : str, optional
-        Name of the file where the collected data will be saved (the saved file will have a '.p' extension)
+        Name of the file where the collected data will be saved (the saved file will have a '.p' extension). Completed
+        runs are also added to the run catalogue (see runCatalogue).
     plot : bool
         True turns plotting on (default), False turns it off
+    safetyInterval : float or None, default=0.2
+        Time in seconds between electromagnet current checks by the safety watchdog (see safety.SafetyWatchdog), which
+        runs independently of the data collection and resets the power supplies as soon as the current is too high.
+        The electromagnet current recorded for each sweep is taken from the watchdog readings. None turns the watchdog
+        off and the current is only checked at the start and end of every sweep. The Hall bar supply current is read
+        for every data point and checked by the data collection loop either way.
+    retryPolicy : resilience.RetryPolicy, optional
+        If provided, instrument commands which fail with a VISA error are retried, and instruments which stop responding
+        are reconnected by serial number and set up again (see resilience.ResilientSession) instead of aborting the
+        experiment
+    descendingEM : bool, default=False
+        Sweep the electromagnet voltages from the highest to the lowest instead of from the lowest to the highest
+    keepEMOn : bool, default=False
+        If True, the electromagnet is not zeroed at the start and end of the run, so back-to-back runs (see
+        experimentQueue.runQueue()) do not have to ramp it down and up again. The power supplies are still reset if the
+        experiment fails. Use resetPowerSupplies() once the last run is done.
+    overrunPolicy : str, default='skip'
+        What to do when a data point takes longer than measurementInterval: 'skip' the missed time slots or 'catchUp'
+        by taking the next points without waiting (see scheduler.DeadlineScheduler)
+    profile : str, optional
+        Measurement profile of the multimeters, 'fast', 'balanced' or 'precise' (see measurementProfiles). The
+        multimeters are set to fixed ranges fitting the sweep (supply voltage and maximum supply current) instead of
+        autorange. The expected reading time and noise of every multimeter are stored in runInfo['measurementProfile'].
+        None (default) sets the multimeters back to the ranges configured by setup() if an earlier run used a
+        profile (the integration time and autozero of that profile are kept, see measurementProfiles.clearProfile()).
+    adaptive : bool, default=False
+        If True, every sweep starts with a coarse pass of evenly spaced supply voltages and then adds points where the
+        Hall voltage vs supply current curve bends (see planAdaptiveRefinement()), until no interval needs refining or
+        the sweep has dataPointsPerSupSweep + 1 points. Linear sweeps need fewer points than the evenly spaced sweep.
+        The points of a sweep are stored in the order they were measured, not sorted by supply voltage.
+    adaptiveTol : float, optional
+        Largest allowed deviation in V of a Hall voltage from the line through its neighbours. Defaults to 2% of the
+        range of Hall voltages of the sweep (see planAdaptiveRefinement()).
+    coarsePoints : int, optional
+        Number of points of the coarse pass. Defaults to a third of dataPointsPerSupSweep (at least 3).
+    broadcaster : broadcast.LiveBroadcaster, optional
+        If provided, every data point is also sent to the broadcaster's subscribers (stream number = Hall bar number,
+        values in the order of dataColumns)
+    samplesPerPoint : int, default=1
+        Number of readings averaged into every supply current and Hall voltage value. Their standard errors are stored
+        in the 'supplyCurrErr' and 'hallBarVoltErr' columns (see oversampling). The expected data collection time with
+        every averaging strategy is shown before the run starts.
+    averaging : str, default='auto'
+        How the readings are averaged: 'instrument' (the multimeter's averaging filter), 'host' (a burst of readings
+        averaged with numpy) or 'auto' (the filter where the multimeter has one)
+    liveDisplay : bool, default=True
+        Show the live readings (and the graphs if plot is True) after every data point
+    runControl : background.RunHandle, optional
+        Handle of a background run (see start()), checked before every data point to pause or cancel the run. While
+        the run is paused the Hall bar current supplies are set to 0 V, the electromagnet stays on and is still
+        checked by the safety watchdog.
+
+    Notes
+    -----
+    If expInsts was set up for several Hall bars (see setup()), every bar is swept at each electromagnet voltage, so the
+    electromagnet only has to be ramped and settled once for all of them. Bars with their own current supply and
+    multimeters are swept together: all current supplies are set, the readings settle once and every bar is read.
+    Bars sharing an instrument are swept one after the other.
 
     Returns
     -------
-     dict[str, dict[str, Union[list, int]]]
-        Data collected during the experiment. See examples for an example data set
+     dict[str, dict[str, Union[numpy.ndarray, float]]]
+        Data collected during the experiment. See examples for an example data set. The arrays are views of the flat
+        data store used during collection (see dataColumns), so no copies are made. The 'runInfo' key holds information
+        about the run: experiment name, parameters, instrument IDNs and serials, start and end time (time.time()),
+        timing statistics (see scheduler.DeadlineScheduler.report()) and the recovery counts and events (see
+        resilience.RecoveryLog.summary()). Use getSweepKeys() to get only the keys of the
+        sweeps. With several Hall bars the data of bar n > 1 is under the key 'hallBar<n>' in the same format (see
+        getHallBarData()).
 
     Example
     --------
@@ -226,8 +520,13 @@ def doExperiment(
     >>>         "supplyVolt": [0, 1, 2, 3, 4, 5],
     >>>         "supplyCurr": [0, 1e-5, 2e-5, 3e-5, 4e-5, 5e-5],
     >>>         "hallBarVolt": [0, 0.0005, 0.0007, 0.0008, 0.0010, 0.0015],
+    >>>         "actualTime": [0.0001, 1.0002, 2.0001, 3.0003, 4.0001, 5.0002],
+    >>>         "supplyCurrErr": [nan, nan, nan, nan, nan, nan],
+    >>>         "hallBarVoltErr": [nan, nan, nan, nan, nan, nan],
     >>>         "emCurr": 0.200
-    >>>     }
+    >>>     },
+    >>>     'runInfo': {"experiment": "Hall Effect Lab", "parameters": {...}, "instruments": {...}, "startTime": ...,
+    >>>                 "endTime": ..., "timing": {...}, "retries": 0, "reconnects": 0, "recovered": 0, "failed": 0, "recoveryEvents": []}
     >>> }
     """
 
@@ -292,16 +591,35 @@ def doExperiment(
         exampleExpCode()
         raise ValueError("Invalid experiment length time in doExperiment(). Argument in question: expLength")
 
+    # All points of a Hall bar are kept in one preallocated flat store (see dataColumns), sweeps are contiguous row ranges in it and
+    # data[str(emV)] holds views of those rows:
+    #   time        - actual clock time
+    #   supplyVolt  - supply Voltage - more for reference than actual use in calculation
+    #   supplyCurr  - the longitudinal current measured for this voltage
+    #   hallBarVolt - the voltage measured across the chosen terminals on the Hall bar
+    #   emCurr      - the measured current through the electromagnet - for conversion to field
+    #   actualTime  - actual time of the point since the start of the sweep (time is the nominal, scheduled time)
+    #   supplyCurrErr, hallBarVoltErr - standard errors of the averaged readings (NaN if not known, see oversampling)
+    # Every Hall bar has its own store; the data of bar n > 1 is kept under data["hallBar<n>"] in the same format.
+    sweepColumns = ["time", "supplyVolt", "supplyCurr", "hallBarVolt", "actualTime", "supplyCurrErr", "hallBarVoltErr"]
+    hallBars = countHallBars(expInsts)
     data = {}
     emVolts.sort()
-    for V in emVolts:
-        data[str(V)] = {
-            "time": [],              #actual clock time
-            "supplyVolt": [],        #supply Voltage - more for reference than actual use in calculation 
-            "supplyCurr": [],        #the longitudinal current measured for this voltage
-            "hallBarVolt": [],       #the voltage measured across the chosen terminals on the Hall bar
-            "emCurr": 0              #the measured current through the electromagnet - for conversion to field
-        }
+    bars = []
+    for bar in range(1, hallBars + 1):
+        barData = data if bar == 1 else {}
+        if bar > 1:
+            data["hallBar" + str(bar)] = barData
+        barStore = ColumnStore(dataColumns, capacity=len(emVolts) * (dataPointsPerSupSweep + 2))
+        for V in emVolts:
+            barData[str(V)] = barStore.views(0, 0, columns=sweepColumns)
+            barData[str(V)]["emCurr"] = 0
+        bars.append({
+            "number": bar,
+            "vars": {var: var + ("" if bar == 1 else str(bar)) for var in hallBarVars},
+            "store": barStore,
+            "data": barData
+        })
 
     supVoltIncrement = (supVoltSweep[1] - supVoltSweep[0]) / dataPointsPerSupSweep
     if np.absolute(supVoltIncrement) < 0.001:
@@ -321,119 +639,394 @@ def doExperiment(
         raise TypeError("dataFileName was found to be a " + str(type(dataFileName)) + "when it is supposed to be a "
                                                                                       "string")
 
-    emPS = expInsts["emPS"]["res"]
-    hcPS = expInsts["hcPS"]["res"]
-    hvMM = expInsts["hvMM"]["res"]
-    hcMM = expInsts["hcMM"]["res"]
+    profileReport = None
+    if profile is not None:
+        profileReport = {}
+        maxSupVolt = max(abs(V) for V in supVoltSweep) * 1.01
+        for bar in range(1, hallBars + 1):
+            suffix = "" if bar == 1 else str(bar)
+            profileReport["hvMM" + suffix] = applyProfile(expInsts["hvMM" + suffix], profile, "VOLT:DC", maxSupVolt)
+            profileReport["hcMM" + suffix] = applyProfile(expInsts["hcMM" + suffix], profile, "CURR:DC", maxSupCurr)
+    else:
+        for bar in range(1, hallBars + 1):
+            for var in ("hvMM", "hcMM"):
+                clearProfile(expInsts[var + ("" if bar == 1 else str(bar))])
+
+    # Set up for every run, so an averaging filter left on by an earlier oversampled run is turned off
+    samplingPlans = {}
+    for bar in range(1, hallBars + 1):
+        for var, function in (("hvMM", "VOLT:DC"), ("hcMM", "CURR:DC")):
+            var += "" if bar == 1 else str(bar)
+            samplingPlans[var] = setupOversampling(expInsts[var], function, samplesPerPoint, averaging,
+                                                   profileReport[var] if profileReport is not None else None)
+    oversamplingReport = None
+    if samplesPerPoint != 1:
+        oversamplingReport = samplingPlans
+        for bar in bars:
+            bar["sampling"] = {var: oversamplingReport[bar["vars"][var]] for var in ("hvMM", "hcMM")}
+
+    latencyReports = dict(profileReport or {})
+    latencyReports.update(oversamplingReport or {})
+    if len(latencyReports) > 0:
+        pointLatency = 0.1 + sum(report["expectedLatency"] for report in latencyReports.values())
+        if pointLatency > measurementInterval:
+            print("\x1b[;43m A data point is expected to take", np.round(pointLatency, 3),
+                  "s, longer than the measurement interval. \x1b[m")
+
+    sessions = {var: expInsts[var]["res"] for var in expInsts.keys()}
+    recoveryLog = RecoveryLog()
+    if retryPolicy is not None:
+        sessions, recoveryLog = makeExpInstsResilient(expInsts, retryPolicy, recoveryLog)
+    emPS = sessions["emPS"]
+    for bar in bars:
+        for var in hallBarVars:
+            bar[var] = sessions[bar["vars"][var]]
+
+    # Resets always write to the supplies, even if their shadowed setpoints are already 0
+    def resetSupplies():
+        setPSCurr(0.000, emPS, force=True)
+        setPSVolt(0.000, emPS, force=True)
+        for resetBar in bars:
+            setPSCurr(0.000, resetBar["hcPS"], force=True)
+            setPSVolt(0.000, resetBar["hcPS"], force=True)
+
+    watchdog = None
+    pause = time.sleep
+    if safetyInterval is not None:
+        # Only the electromagnet current is watched: the Hall bar supply current is already read for every data point
+        # (and checked against maxSupCurr right after), so a second reader would double the hcMM queries and wait on
+        # the data reads for the length of the averaging filter
+        emPS = LockedSession(emPS)
+        for bar in bars:
+            bar["hcPS"] = LockedSession(bar["hcPS"])
+        watchdog = SafetyWatchdog(
+            checks=[{"name": "emCurr", "read": lambda: float(emPS.query("IOUT1?")), "limit": maxEMCurr, "unit": "A"}],
+            shutdown=resetSupplies,
+            interval=safetyInterval
+        )
+        pause = watchdog.sleep
 
     setPSCurr(0.700, emPS)
-    setPSVolt(0.000, emPS)
-    setPSCurr(0.010, hcPS)
-    setPSVolt(0.000, hcPS)
+    if not keepEMOn:
+        setPSVolt(0.000, emPS)
+    for bar in bars:
+        setPSCurr(0.010, bar["hcPS"])
+        setPSVolt(0.000, bar["hcPS"])
+
+    # Bars whose instruments are independent of each other are swept together, sharing the settling time of every
+    # point. Bars sharing an instrument are swept one after the other at the same electromagnet voltage.
+    barGroups = groupIndependentBars(bars)
 
     timeBetweenEMVChange = 2.0
     sweepDur = measurementInterval * dataPointsPerSupSweep
     startSupVolt = supVoltSweep[0]
     endSupVolt = (supVoltSweep[1] * 1.01)
-    curSupVolt = startSupVolt
+    pointBudget = dataPointsPerSupSweep + 1
+    if coarsePoints is None:
+        coarsePoints = max(3, pointBudget // 3)
+
+    def sweepVolts(barGroup, sweepEMV):
+        if not adaptive:
+            supVolt = startSupVolt
+            while supVolt < endSupVolt:
+                yield supVolt
+                supVolt += supVoltIncrement
+            return
+
+        coarseVolts = np.round(np.linspace(supVoltSweep[0], supVoltSweep[1], min(coarsePoints, pointBudget)), 3)
+        for supVolt in coarseVolts:
+            yield float(supVolt)
+        pointsTaken = len(coarseVolts)
+        while pointsTaken < pointBudget:
+            sweeps = [bar["data"][str(sweepEMV)] for bar in barGroup]
+            newVolts = planAdaptiveRefinement(sweeps[0]["supplyVolt"],
+                                              [sweep["supplyCurr"] for sweep in sweeps],
+                                              [sweep["hallBarVolt"] for sweep in sweeps],
+                                              tol=adaptiveTol, maxNewPoints=pointBudget - pointsTaken)
+            if len(newVolts) == 0:
+                return
+            for supVolt in newVolts:
+                yield supVolt
+            pointsTaken += len(newVolts)
+
+    pointsTaken = 0
+    expectedPoints = max(len(emVolts) * len(barGroups) * pointBudget, 1)
+
+    def pauseHallBars():
+        for pausedBar in bars:
+            setPSVolt(0.000, pausedBar["hcPS"])
+
+    runTimeEstimates = None
+    if oversamplingReport is not None:
+        runTimeEstimates = estimateRunTimes(oversamplingReport, len(emVolts) * len(barGroups) * pointBudget,
+                                            measurementInterval, overhead=0.1)
+        oversamplingReport = {"instruments": oversamplingReport, "runTimeEstimates": runTimeEstimates}
+
     timePassed = 0.000
-    timeOnCurSupLoop = 0.000
-    timeLeft = float((sweepDur * len(emVolts)) + (timeBetweenEMVChange * (len(emVolts) - 1)))
+    timeLeft = float((sweepDur * len(barGroups) * len(emVolts)) + (timeBetweenEMVChange * (len(emVolts) - 1)))
+    runStartTime = time.time()
+    scheduler = DeadlineScheduler(measurementInterval, overrunPolicy=overrunPolicy, sleep=pause)
+
+    if broadcaster is not None:
+        for bar in bars:
+            broadcaster.announce(bar["number"], dataColumns, expName + " (Hall Bar " + str(bar["number"]) + ")")
 
     try:
-        for emV in emVolts:
+        if watchdog is not None:
+            watchdog.start()
+        for emV in (emVolts[::-1] if descendingEM else emVolts):
             setPSVolt(emV, emPS)
-            time.sleep(0.6)
-            curEMCurr = float(emPS.query("IOUT1?"))
+            pause(0.6)
+            curEMCurr = None
+            if watchdog is not None:
+                curEMCurr = watchdog.cache.waitForNewer("emCurr", time.perf_counter(), timeout=5 * safetyInterval + 1)
+                watchdog.raiseIfTripped()
+            if curEMCurr is None:
+                curEMCurr = float(emPS.query("IOUT1?"))
             if curEMCurr > maxEMCurr:
                 raise Warning("Electromagnet current was too high. Current before cut off: " + str(curEMCurr))
-            data[str(emV)]["emCurr"] = curEMCurr
-            curLoopStartTime = time.time()
-            while curSupVolt < endSupVolt:
-                setPSVolt(curSupVolt, hcPS)
-                time.sleep(0.1)
-                curSupCurr = parseQueryReading(hcMM.query("READ?"))
-                curHallVolt = parseQueryReading(hvMM.query("READ?"))
-                if float(curSupCurr) > maxSupCurr:
-                    raise Warning("Supply current was too high. Current before cut off: " + str(curSupCurr))
-
-                curLoopEndTime = time.time()
-                if (measurementInterval - (curLoopEndTime - curLoopStartTime)) > 0:
-                    time.sleep(measurementInterval - (curLoopEndTime - curLoopStartTime))
-
-                data[str(emV)]["time"].append(timeOnCurSupLoop)
-                data[str(emV)]["supplyVolt"].append(curSupVolt)
-                data[str(emV)]["supplyCurr"].append(curSupCurr)
-                data[str(emV)]["hallBarVolt"].append(curHallVolt)
-
-                if dataFileName is not None:
-                    clearFileAndSaveData(data, dataFileName)
-
-                timePassed += measurementInterval
-                timeOnCurSupLoop += measurementInterval
-                timeLeft -= measurementInterval
-
-                liveReading = {
-                    "EM Volt.  (V)": np.round(emV, decimals=3),
-                    "EM Curr. (A)": np.round(curEMCurr, decimals=3),
-                    "Supply Curr. (\u03bcA)": np.round((curSupCurr * 1000000), decimals=3),
-                    "Supply Volt. (V)": np.round(curSupVolt, decimals=3),
-                    "Hall Volt. (mV)": np.round((curHallVolt * 1000), decimals=3),
-                    "Time on Current EM Volt. (s)": timeOnCurSupLoop,
-                    "Time Elapsed (s)": timePassed,
-                    "Time Left (s)": timeLeft
-                }
-
-                clear_output(wait=True)
-                if plot==True:
-                    draw3DHELabGraphs(data)
-                showLiveReadings(liveReading)
-
-                curSupVolt += supVoltIncrement
-                curLoopStartTime = time.time()
-
-            curEMCurr = float(emPS.query("IOUT1?"))
-            if float(curEMCurr) > maxEMCurr:
-                raise Warning("Electromagnet current is too high. Current before cut off:", str(curEMCurr))
-
-            setPSVolt(0.000, hcPS)
-            timeOnCurSupLoop = 0.000
-            curSupVolt = startSupVolt
-            time.sleep(timeBetweenEMVChange - 0.6)
+            for bar in bars:
+                bar["data"][str(emV)]["emCurr"] = curEMCurr
+
+            for barGroup in barGroups:
+                for bar in barGroup:
+                    bar["sweepStartRow"] = len(bar["store"])
+                scheduler.start()
+                for curSupVolt in sweepVolts(barGroup, emV):
+                    if runControl is not None:
+                        scheduler.shift(runControl.checkpoint(
+                            data, pointsTaken / expectedPoints, onPause=pauseHallBars,
+                            whilePaused=watchdog.raiseIfTripped if watchdog is not None else None))
+                    timeOnCurSupLoop, actualTimeOnCurSupLoop = scheduler.tick()
+                    for bar in barGroup:
+                        setPSVolt(curSupVolt, bar["hcPS"])
+                    pause(0.1)
+                    liveReading = {
+                        "EM Volt.  (V)": np.round(emV, decimals=3),
+                        "EM Curr. (A)": np.round(curEMCurr, decimals=3),
+                        "Supply Volt. (V)": np.round(curSupVolt, decimals=3),
+                    }
+                    for bar in barGroup:
+                        curSupCurr, curSupCurrErr = readAveraged(bar["hcMM"], bar.get("sampling", {}).get("hcMM"))
+                        curHallVolt, curHallVoltErr = readAveraged(bar["hvMM"], bar.get("sampling", {}).get("hvMM"))
+                        if float(curSupCurr) > maxSupCurr:
+                            raise Warning("Supply current was too high. Current before cut off: " + str(curSupCurr))
+
+                        row = (emV, timeOnCurSupLoop, curSupVolt, curSupCurr, curHallVolt, curEMCurr,
+                               actualTimeOnCurSupLoop, curSupCurrErr, curHallVoltErr)
+                        bar["store"].appendRow(*row)
+                        if broadcaster is not None:
+                            broadcaster.publish(bar["number"], row)
+                        bar["data"][str(emV)].update(bar["store"].views(bar["sweepStartRow"], columns=sweepColumns))
+
+                        barLabel = "" if hallBars == 1 else " Bar " + str(bar["number"])
+                        liveReading["Supply Curr." + barLabel + " (\u03bcA)"] = np.round((curSupCurr * 1000000),
+                                                                                         decimals=3)
+                        liveReading["Hall Volt." + barLabel + " (mV)"] = np.round((curHallVolt * 1000), decimals=3)
+                        if samplesPerPoint > 1:
+                            liveReading["Hall Volt. Err." + barLabel + " (mV)"] = np.round((curHallVoltErr * 1000),
+                                                                                          decimals=4)
+
+                    if dataFileName is not None:
+                        clearFileAndSaveData(data, dataFileName)
+
+                    pointsTaken += 1
+                    timePassed += measurementInterval
+                    timeLeft -= measurementInterval
+
+                    liveReading["Time on Current EM Volt. (s)"] = timeOnCurSupLoop
+                    liveReading["Time Elapsed (s)"] = timePassed
+                    liveReading["Time Left (s)"] = timeLeft
+
+                    if liveDisplay:
+                        clear_output(wait=True)
+                        if plot==True:
+                            draw3DHELabGraphs(data)
+                        showLiveReadings(liveReading)
+
+                    scheduler.waitForNext()
+
+                for bar in barGroup:
+                    setPSVolt(0.000, bar["hcPS"])
+
+            if watchdog is not None:
+                watchdog.raiseIfTripped()
+            else:
+                curEMCurr = float(emPS.query("IOUT1?"))
+                if float(curEMCurr) > maxEMCurr:
+                    raise Warning("Electromagnet current is too high. Current before cut off:", str(curEMCurr))
+
+            pause(timeBetweenEMVChange - 0.6)
             timeLeft -= timeBetweenEMVChange
 
-        setPSCurr(0.000, emPS)
-        setPSVolt(0.000, emPS)
-        setPSCurr(0.000, hcPS)
-        setPSVolt(0.000, hcPS)
-        print("The power supplies have been reset.")
+        if watchdog is not None:
+            watchdog.stop()
+        if keepEMOn:
+            for bar in bars:
+                setPSVolt(0.000, bar["hcPS"])
+            print("The current supply has been reset, the electromagnet has been left on.")
+        else:
+            resetSupplies()
+            print("The power supplies have been reset.")
 
     except VisaIOError:
+        if watchdog is not None:
+            watchdog.stop()
+        invalidatePSState(emPS)
+        for bar in bars:
+            invalidatePSState(bar["hcPS"])
         print("\x1b[43m IMMEDIATELY SET ALL THE POWER SUPPLY VOLTAGES TO 0 \x1b[m")
         print("Could not complete the full experiment")
         if dataFileName is not None:
             print("The data collected till now has been saved in", dataFileName + ".p")
         raise
     except:
-        setPSCurr(0.000, emPS)
-        setPSVolt(0.000, emPS)
-        setPSCurr(0.000, hcPS)
-        setPSVolt(0.000, hcPS)
+        if watchdog is not None:
+            watchdog.stop()
+            if watchdog.tripped.is_set():
+                print("\x1b[;41m " + watchdog.tripReason + " \x1b[m")
+        resetSupplies()
         print("The power supplies have been reset.")
         print("\x1b[43m Could not complete the full experiment \x1b[m")
         if dataFileName is not None:
             print("The data collected till now has been saved in", dataFileName + ".p")
         raise
 
+    data["runInfo"] = {
+        "experiment": expName,
+        "parameters": {
+            "emVolts": list(emVolts),
+            "supVoltSweep": list(supVoltSweep),
+            "dataPointsPerSupSweep": dataPointsPerSupSweep,
+            "measurementInterval": measurementInterval,
+            "descendingEM": descendingEM,
+            "hallBars": hallBars,
+            "profile": profile,
+            "adaptive": adaptive,
+            "adaptiveTol": adaptiveTol,
+            "samplesPerPoint": samplesPerPoint,
+            "averaging": averaging,
+        },
+        "instruments": {var: expInsts[var].get("idn", "") for var in expInsts.keys()},
+        "serials": {var: expInsts[var].get("serial", "") for var in expInsts.keys()},
+        "startTime": runStartTime,
+        "endTime": time.time(),
+        "timing": scheduler.report(),
+        "measurementProfile": profileReport,
+        "oversampling": oversamplingReport,
+    }
+    data["runInfo"].update(recoveryLog.summary())
+    for bar in bars[1:]:
+        bar["data"]["runInfo"] = data["runInfo"]
+    if recoveryLog.events:
+        print("Recovered from", data["runInfo"]["recovered"], "instrument error(s) during the experiment.")
+
     print("Data collection completed.")
     if dataFileName is not None:
+        clearFileAndSaveData(data, dataFileName)
+        catalogueRun(data, dataFileName + ".p")
         print("The data collected till now has been saved in", dataFileName + ".p")
 
-    for emV in data.keys():
-        for key in data[emV].keys():
-            if type(data[emV][key]) is list:
-                data[emV][key] = np.array(data[emV][key])
-
     return data
 
 
+def start(*args, **kwargs):
+    """Run doExperiment() on a worker thread without blocking the notebook
+
+    Takes the same arguments as doExperiment() ('liveDisplay' defaults to False) and returns a background.RunHandle
+    giving the data collected so far, the progress and the estimated time left, and pausing, resuming or cancelling
+    the run. Cancelling resets the power supplies. See background.startExperiment().
+
+    Example
+    -------
+    >>> run = hallEffect.start(expInsts, emVolts=[1, 2, 3], supVoltSweep=(0, 5), dataPointsPerSupSweep=20)
+    >>> run.progress, run.eta
+    >>> draw3DHELabGraphs(run.data)
+    >>> data = run.result()
+    """
+    return startExperiment(sys.modules[__name__], *args, **kwargs)
+
+
+def sweepDescription(emVolts=None, supVoltSweep=(), dataPointsPerSupSweep=0, measurementInterval=1, plot=True,
+                     safetyInterval=0.2, descendingEM=False, samplesPerPoint=1):
+    """Sweep description of the Hall Effect experiment (single Hall bar, see sweepPlan)
+
+    Running it with sweepPlan.runSweep() gives data in the same format as doExperiment(). The electromagnet voltage is
+    the outer loop (its current is read once per voltage by the safety watchdog), and the settling time after every
+    electromagnet change ends as soon as its current is stable instead of after a fixed 2 seconds.
+
+    Parameters
+    ----------
+    emVolts, supVoltSweep, dataPointsPerSupSweep, measurementInterval, plot, safetyInterval, descendingEM
+        See doExperiment()
+    samplesPerPoint : int, default=1
+        Readings averaged by the computer for every multimeter value (see oversampling)
+
+    Returns
+    -------
+    dict
+        Sweep description (see sweepPlan)
+
+    Example
+    -------
+    >>> from HallPy_Teach import sweepPlan
+    >>> plan = sweepPlan.compileSweep(sweepDescription(emVolts=[1, 2, 3], supVoltSweep=(0, 5), dataPointsPerSupSweep=20))
+    >>> plan.explain()
+    >>> data = plan.run(expInsts, dataFileName="hallEffectRun")
+    """
+    if emVolts is None or len(emVolts) == 0 or len(supVoltSweep) != 2 or dataPointsPerSupSweep <= 0:
+        print("\x1b[;43m Please provide the electromagnet voltages, the supply voltage sweep and the number of data "
+              "points per sweep \x1b[m")
+        raise ValueError("Invalid Hall Effect sweep. Arguments in question: emVolts, supVoltSweep, dataPointsPerSupSweep")
+
+    supVoltIncrement = (supVoltSweep[1] - supVoltSweep[0]) / dataPointsPerSupSweep
+    supVolts = []
+    supVolt = supVoltSweep[0]
+    while supVolt < supVoltSweep[1] * 1.01:
+        supVolts.append(supVolt)
+        supVolt += supVoltIncrement
+
+    return {
+        "expName": expName,
+        "requiredEquipment": requiredEquipment,
+        "parameters": {
+            "emVolts": list(emVolts),
+            "supVoltSweep": tuple(supVoltSweep),
+            "dataPointsPerSupSweep": dataPointsPerSupSweep,
+            "measurementInterval": measurementInterval,
+            "samplesPerPoint": samplesPerPoint,
+        },
+        "axes": [
+            {"name": "emVolt", "inst": "emPS", "set": setPSVolt,
+             "values": sorted((float(emV) for emV in emVolts), reverse=descendingEM),
+             "settle": {"reading": "emCurr", "tol": 0.001, "min": 0.6, "timeout": 2.0, "poll": 0.2}},
+            {"name": "supplyVolt", "inst": "hcPS", "set": setPSVolt, "values": supVolts, "settle": 0.1, "rest": 0.0},
+        ],
+        "readings": [
+            {"name": "emCurr", "inst": "emPS", "query": "IOUT1?", "parse": float, "every": "emVolt"},
+            {"name": "supplyCurr", "inst": "hcMM", "samples": samplesPerPoint, "uncertainty": True},
+            {"name": "hallBarVolt", "inst": "hvMM", "samples": samplesPerPoint, "uncertainty": True},
+        ],
+        "limits": [
+            {"reading": "emCurr", "max": 0.700, "unit": "A", "watch": safetyInterval,
+             "message": "IMMEDIATELY TURN OFF THE ELECTROMAGNET POWER SUPPLY"},
+            {"reading": "supplyCurr", "max": 0.0001, "unit": "A",
+             "message": "Hall bar current too high. Lower the supply voltage sweep."},
+        ],
+        "interval": measurementInterval,
+        "groupBy": "emVolt",
+        "setup": [
+            ("emPS", lambda session: setPSCurr(0.700, session)),
+            ("emPS", lambda session: setPSVolt(0.000, session)),
+            ("hcPS", lambda session: setPSCurr(0.010, session)),
+            ("hcPS", lambda session: setPSVolt(0.000, session)),
+        ],
+        "shutdown": [
+            ("emPS", lambda session: setPSCurr(0.000, session, force=True)),
+            ("emPS", lambda session: setPSVolt(0.000, session, force=True)),
+            ("hcPS", lambda session: setPSCurr(0.000, session, force=True)),
+            ("hcPS", lambda session: setPSVolt(0.000, session, force=True)),
+        ],
+        "onPause": [("hcPS", lambda session: setPSVolt(0.000, session))],
+        "draw": draw3DHELabGraphs if plot else None,
+    }
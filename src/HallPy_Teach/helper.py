@@ -1,13 +1,17 @@
+import io
 import os
 import pickle
 import time
+import weakref
 
 import numpy as np
 from ipywidgets import widgets
-from matplotlib import pyplot as plt
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
 from IPython.display import display
 
 from .constants import supportedInstruments
+from .instrumentRegistry import InstrumentRegistry
 
 
 def parseQueryReading(reading):
@@ -94,8 +98,8 @@ def getInstTypeCount(instruments):
 
     Parameters
     ----------
-    instruments : list of object
-        List of instruments objects defined in initInstruments()
+    instruments : InstrumentRegistry or list of object
+        Registry or list of instruments objects defined in initInstruments()
 
     See Also
     --------
@@ -107,6 +111,9 @@ def getInstTypeCount(instruments):
         object with key as type of instrument and value as the number of type connected
 
     """
+    if isinstance(instruments, InstrumentRegistry):
+        return instruments.countByType()
+
     instTypeCount = supportedInstruments.copy()
 
     for instrumentType in instTypeCount:
@@ -179,6 +186,16 @@ def notEnoughReqInstType(instType, requiredEquipment, instruments, inGui=False):
         print("\x1b[;43m        plugging in the " + instType + "(s).                          \x1b[m")
 
 
+_liveFigureLayouts = {
+    1: ((6.4, 4.8), [111]),
+    2: ((14, 5), [121, 122]),
+    3: ((14, 10), [221, 222, 223]),
+    4: ((14, 10), [221, 222, 223, 224]),
+}
+_liveFigures = {}
+_liveDisplay = {"names": None, "values": [], "readings": None, "image": None, "box": None}
+
+
 # noinspection PyBroadException
 def showLiveReadings(liveReadings=None, g1=None, g2=None, g3=None, g4=None):
     """Function to display life readings
@@ -218,6 +235,9 @@ def showLiveReadings(liveReadings=None, g1=None, g2=None, g3=None, g4=None):
             'xlabel': 'Radians',\n
             'ylabel': 'Sin(Radians)'\n
         }
+    The widgets and figures are created once and updated on every call (the widgets are recreated only when the
+    reading names change), so showing the readings after every data point of a long run does not use more and more
+    memory.
 
     Returns
     -------
@@ -225,121 +245,154 @@ def showLiveReadings(liveReadings=None, g1=None, g2=None, g3=None, g4=None):
         Live readings and graphs are printed to jupyter python output
 
     """
-    displayItems = []
-    width = 900
-
-    # Checking if graphs need to be shown
-    if g1 is not None or g2 is not None or g3 is not None or g4 is not None:
-        graphs = [i for i in [g1, g2, g3, g4] if i is not None]
-        fig = plt.figure()
-        if np.size(graphs) == 1:
-            width = 450
-            g = graphs[0]
-            plt.plot(g['xdata'], g['ydata'])
-            plt.grid(True)
-            try:
-                plt.xlabel(g['xlabel'])
-            except:
-                pass
-            try:
-                plt.ylabel(g['ylabel'])
-            except:
-                pass
-            try:
-                plt.xlim(g['xlim'])
-            except:
-                pass
-            try:
-                plt.ylim(g['ylim'])
-            except:
-                pass
-            try:
-                plt.title(g['title'])
-            except:
-                pass
-        elif np.size(graphs) > 1:
-            g = []
-            if np.size(graphs) == 2:
-                fig = plt.figure(figsize=(14, 5))
-                g.append(fig.add_subplot(121))
-                g.append(fig.add_subplot(122))
-            elif np.size(graphs) == 3:
-                fig = plt.figure(figsize=(14, 10))
-                g.append(fig.add_subplot(221))
-                g.append(fig.add_subplot(222))
-                g.append(fig.add_subplot(223))
-            else:
-                fig = plt.figure(figsize=(14, 10))
-                g.append(fig.add_subplot(221))
-                g.append(fig.add_subplot(222))
-                g.append(fig.add_subplot(223))
-                g.append(fig.add_subplot(224))
-            for i in enumerate(graphs):
-                g[i[0]].plot(i[1]['xdata'], i[1]['ydata'])
-                g[i[0]].grid(True)
-                try:
-                    g[i[0]].set_xlabel(i[1]['xlabel'])
-                except:
-                    pass
-                try:
-                    g[i[0]].set_ylabel(i[1]['ylabel'])
-                except:
-                    pass
-                try:
-                    g[i[0]].set_xlim(i[1]['xlim'])
-                except:
-                    pass
-                try:
-                    g[i[0]].set_ylim(i[1]['ylim'])
-                except:
-                    pass
-                try:
-                    g[i[0]].set_title(i[1]['title'])
-                except:
-                    pass
-        plt.savefig('tempImg.jpeg')
-        plt.close(fig)
+    graphs = [i for i in [g1, g2, g3, g4] if i is not None]
+    finalDisplayStack = []
 
     # Checking if live readings need to be shown
     if liveReadings is not None:
-        displayItems = []
-        for i in liveReadings.keys():
-            if 'Time' in i:
-                displayItems.append(widgets.VBox([widgets.Label(str(i)), widgets.Label(str(liveReadings[i]))],
-                                                 layout=widgets.Layout(
-                                                     display="flex",
-                                                     justify_content="center",
-                                                     align_items="flex-end",
-                                                     margin="10px")
-                                                 )
-                                    )
-            else:
-                displayItems.append(widgets.VBox([widgets.Label(str(i)), widgets.Label(str(liveReadings[i]))],
+        names = tuple(str(i) for i in liveReadings.keys())
+        if _liveDisplay["names"] != names:
+            if _liveDisplay["readings"] is not None:
+                _closeWidgetTree(_liveDisplay["readings"])
+            displayItems = []
+            _liveDisplay["values"] = []
+            for i in names:
+                valueLabel = widgets.Label()
+                _liveDisplay["values"].append(valueLabel)
+                displayItems.append(widgets.VBox([widgets.Label(i), valueLabel],
                                                  layout=widgets.Layout(
                                                      display="flex",
                                                      justify_content="center",
-                                                     align_items="center",
+                                                     align_items="flex-end" if 'Time' in i else "center",
                                                      margin="10px")
                                                  )
                                     )
+            _liveDisplay["readings"] = widgets.HBox(displayItems)
+            _liveDisplay["names"] = names
+        for valueLabel, value in zip(_liveDisplay["values"], liveReadings.values()):
+            valueLabel.value = str(value)
+        finalDisplayStack.append(_liveDisplay["readings"])
+
+    # Checking if graphs need to be shown. The figures are reused and rendered in memory, so nothing is left open
+    # however many times the live display is updated.
+    if len(graphs) > 0:
+        figSize, subplots = _liveFigureLayouts[len(graphs)]
+        fig = _liveFigures.get(len(graphs))
+        if fig is None:
+            fig = Figure(figsize=figSize)
+            FigureCanvasAgg(fig)
+            _liveFigures[len(graphs)] = fig
+        fig.clf()
+        for subplot, graph in zip(subplots, graphs):
+            ax = fig.add_subplot(subplot)
+            ax.plot(graph['xdata'], graph['ydata'])
+            ax.grid(True)
+            for key, setter in (('xlabel', ax.set_xlabel), ('ylabel', ax.set_ylabel), ('xlim', ax.set_xlim),
+                                ('ylim', ax.set_ylim), ('title', ax.set_title)):
+                try:
+                    setter(graph[key])
+                except:
+                    pass
+        imageBuffer = io.BytesIO()
+        fig.savefig(imageBuffer, format='png')
+        if _liveDisplay["image"] is None:
+            _liveDisplay["image"] = widgets.Image(format='png')
+        _liveDisplay["image"].value = imageBuffer.getvalue()
+        _liveDisplay["image"].width = 450 if len(graphs) == 1 else 900
+        finalDisplayStack.append(_liveDisplay["image"])
 
     # Showing graphs and live readings in correct order
-    if liveReadings is not None or g1 is not None or g2 is not None or g3 is not None or g4 is not None:
-        finalDisplayStack = []
-        if liveReadings is not None:
-            finalDisplayStack.append(widgets.HBox(displayItems))
-        if g1 is not None or g2 is not None or g3 is not None or g4 is not None:
-            _ = widgets.Image(value=open('tempImg.jpeg', 'rb').read(), format='png', width=width)
-            finalDisplayStack.append(_)
-            os.remove('tempImg.jpeg')
+    if len(finalDisplayStack) > 0:
+        if _liveDisplay["box"] is None:
+            _liveDisplay["box"] = widgets.VBox()
+        _liveDisplay["box"].children = tuple(finalDisplayStack)
+        display(_liveDisplay["box"])
+
+
+def _closeWidgetTree(widget):
+    for child in getattr(widget, "children", ()):
+        _closeWidgetTree(child)
+    widget.close()
+
+
+_psSetpoints = weakref.WeakKeyDictionary()
+
+
+def _getPSShadow(inst):
+    # Session wrappers (eg.: safety.LockedSession) expose the instrument they wrap, the shadow state belongs to that
+    while hasattr(inst, "wrappedSession"):
+        inst = inst.wrappedSession
+    try:
+        return _psSetpoints.setdefault(inst, {})
+    except TypeError:
+        return {}
+
 
-        display(widgets.VBox(finalDisplayStack))
+def getPSState(inst):
+    """Get the shadowed power supply setpoints
 
+    Parameters
+    ----------
+    inst : object
+        Power supply Pyvisa Object (value of 'res' in the instrument object in initInstruments())
+
+    Returns
+    -------
+    dict[tuple[str, int], float]
+        Copy of the last confirmed setpoints with key as (command, channel) (eg.: ('VSET', 1)) and value as setpoint
+
+    See Also
+    --------
+    + setPSVolt()
+    + setPSCurr()
+    + invalidatePSState()
+    """
+    return dict(_getPSShadow(inst))
+
+
+def invalidatePSState(inst=None):
+    """Forget the shadowed power supply setpoints
+
+    Used after errors or reconnects, when the state of the power supply is no longer known. The next setPSVolt() and
+    setPSCurr() calls will write to the instrument again.
+
+    Parameters
+    ----------
+    inst : object, optional
+        Power supply Pyvisa Object. If not provided the setpoints of all power supplies are forgotten.
+
+    Returns
+    -------
+    None
+    """
+    if inst is None:
+        _psSetpoints.clear()
+    else:
+        _getPSShadow(inst).clear()
 
-def setPSVolt(volt, inst, channel=1, instSleepTime=0.1):
+
+def _setPSValue(command, value, inst, channel, instSleepTime, force):
+    shadow = _getPSShadow(inst)
+    key = (command, int(channel))
+    if not force and key in shadow and shadow[key] == float(value):
+        return False
+
+    try:
+        inst.write(command + str(int(channel)) + ":" + str(value))
+    except Exception:
+        invalidatePSState(inst)
+        raise
+    # Looked up again as the write may have reconnected the instrument (see resilience.ResilientSession)
+    _getPSShadow(inst)[key] = float(value)
+    time.sleep(instSleepTime)
+    return True
+
+
+def setPSVolt(volt, inst, channel=1, instSleepTime=0.1, force=False):
     """Set Power Supply Voltage
 
-    Function uses pyvisa instrument object to set power supply voltage
+    Function uses pyvisa instrument object to set power supply voltage. The last confirmed setpoint of every channel is
+    shadowed, so setting the voltage the channel is already at neither writes to the instrument nor sleeps.
 
     Parameters
     ----------
@@ -351,20 +404,27 @@ def setPSVolt(volt, inst, channel=1, instSleepTime=0.1):
         Channel of the power supply which the voltage is to be set to (usually 1 or 2)
     instSleepTime : float, default=0.1
         Time to sleep for inorder to make sure voltage change is applied before carrying on operations
+    force : bool, default=False
+        Write the voltage even if the shadowed setpoint is the same (use for safety resets)
 
     Returns
     -------
-    None
+    bool
+        True if the voltage was written to the instrument, False if the write was skipped
+
+    See Also
+    --------
+    + invalidatePSState()
 
     """
-    inst.write("VSET" + str(int(channel)) + ":" + str(volt))
-    time.sleep(instSleepTime)
+    return _setPSValue("VSET", volt, inst, channel, instSleepTime, force)
 
 
-def setPSCurr(curr, inst, channel=1, instSleepTime=0.1):
+def setPSCurr(curr, inst, channel=1, instSleepTime=0.1, force=False):
     """Set Power Supply Current
 
-        Function uses pyvisa instrument object to set power supply current
+        Function uses pyvisa instrument object to set power supply current. The last confirmed setpoint of every channel
+        is shadowed, so setting the current the channel is already at neither writes to the instrument nor sleeps.
 
         Parameters
         ----------
@@ -376,14 +436,20 @@ def setPSCurr(curr, inst, channel=1, instSleepTime=0.1):
             Channel of the power supply which the current is to be set to (usually 1 or 2)
         instSleepTime : float, default=0.1
             Time to sleep for inorder to make sure current change is applied before carrying on operations
+        force : bool, default=False
+            Write the current even if the shadowed setpoint is the same (use for safety resets)
 
         Returns
         -------
-        None
+        bool
+            True if the current was written to the instrument, False if the write was skipped
+
+        See Also
+        --------
+        + invalidatePSState()
 
         """
-    inst.write("ISET" + str(int(channel)) + ":" + str(curr))
-    time.sleep(instSleepTime)
+    return _setPSValue("ISET", curr, inst, channel, instSleepTime, force)
 
 
 def clearFileAndSaveData(data, fileNameWithoutExt):
@@ -407,8 +473,6 @@ def clearFileAndSaveData(data, fileNameWithoutExt):
     fileName = fileNameWithoutExt + '.p'
     if os.path.exists(fileName):
         os.remove(fileName)
-    file = open(fileName, 'wb')
-
     formattedData = {}
 
     for key in data.keys():
@@ -417,7 +481,8 @@ def clearFileAndSaveData(data, fileNameWithoutExt):
         else:
             formattedData[key] = data[key]
 
-    pickle.dump(formattedData, file)
+    with open(fileName, 'wb') as file:
+        pickle.dump(formattedData, file)
 
 
 def getDataFromFile(fileNameWithExt):
@@ -440,8 +505,8 @@ def getDataFromFile(fileNameWithExt):
     + saveDataToFile()
 
     """
-    file = open(fileNameWithExt, 'rb')
-    dataFromFile = pickle.load(file)
+    with open(fileNameWithExt, 'rb') as file:
+        dataFromFile = pickle.load(file)
     return dataFromFile
 
 
@@ -489,3 +554,23 @@ def getLCRCapLoss(inst):
     capLoss = rawMeasurement[1].strip()
 
     return np.float(capLoss)
+
+
+def parseLCRReading(rawMeasurement):
+    """Parse the capacitance and capacitance loss from one LCR reading
+
+    Parameters
+    ----------
+    rawMeasurement : str
+        Response to the LCR's `FETCh?` query (eg.: '1.2345 nF,0.0012')
+
+    Returns
+    -------
+    tuple[float, float]
+        Capacitance (F) and capacitance loss
+    """
+    values = rawMeasurement.split(",")
+    cap = values[0].strip()
+    for unit, exponent in ((" nF", "E-9"), (" pF", "E-12"), (" fF", "E-15")):
+        cap = cap.replace(unit, exponent)
+    return float(cap), float(values[1].strip())
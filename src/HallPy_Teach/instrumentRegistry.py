@@ -0,0 +1,276 @@
+"""
+HallPy_Teach.instrumentRegistry: indexed registry of the connected instruments
+==============================================================================
+
+Description
+-----------
+Every connected instrument is parsed once, when it is found, into an InstrumentRecord (make, model, serial number,
+firmware and type from the `*IDN?` response). The records are kept in an InstrumentRegistry which indexes them by type,
+serial number and model, so looking up instruments does not need to scan the instrument list or run regular expressions
+again. The regular expressions in constants.serialRegex are compiled once when the module is imported.
+
+See Also
+--------
++ InstrumentRecord
++ InstrumentRegistry
++ initInstruments()
+
+"""
+import re
+
+from .constants import supportedInstruments, serialRegex
+
+_instTypeByName = [(name, instType) for instType in supportedInstruments.keys()
+                   for name in supportedInstruments[instType]]
+_serialPatterns = {name: re.compile(regex) for name, regex in serialRegex.items()}
+
+
+class InstrumentRecord:
+    """Parsed information about a single connected instrument
+
+    Records can also be read like the instrument objects returned by earlier versions of initInstruments(), i.e.
+    record['inst'], record['name'], record['resName'] and record['type'] all work.
+
+    Attributes
+    ----------
+    resName : str
+        VISA resource name (eg.: 'USB0::0x5E6::0x2110::8014885::INSTR')
+    idn : str
+        Response to `*IDN?`
+    make : str
+        Manufacturer from the `*IDN?` response
+    model : str
+        Model from the `*IDN?` response
+    serial : str
+        Serial number. Found with constants.serialRegex for supported instruments, otherwise the third field of the
+        `*IDN?` response (empty if not available).
+    type : str
+        Type of instrument (see constants.supportedInstruments) or 'Unknown'
+    firmware : str
+        Firmware version from the `*IDN?` response (empty if not available)
+    session : object
+        PyVisa instrument object used to communicate with the instrument
+    supportedName : str
+        Key of the instrument in constants.supportedInstruments (empty if the instrument is not supported)
+    """
+
+    __slots__ = ("resName", "idn", "make", "model", "serial", "type", "firmware", "session", "supportedName")
+
+    _legacyKeys = {
+        "inst": "session",
+        "name": "idn",
+        "resName": "resName",
+        "type": "type",
+    }
+
+    def __init__(self, resName, idn, make="", model="", serial="", type="Unknown", firmware="", session=None,
+                 supportedName=""):
+        self.resName = resName
+        self.idn = idn
+        self.make = make
+        self.model = model
+        self.serial = serial
+        self.type = type
+        self.firmware = firmware
+        self.session = session
+        self.supportedName = supportedName
+
+    @classmethod
+    def fromIDN(cls, idn, resName, session=None):
+        """Parse a `*IDN?` response into a record
+
+        Parameters
+        ----------
+        idn : str
+            Response to `*IDN?`
+        resName : str
+            VISA resource name of the instrument
+        session : object, optional
+            PyVisa instrument object
+
+        Returns
+        -------
+        InstrumentRecord
+        """
+        cleanIDN = idn.strip()
+        fields = [field.strip() for field in cleanIDN.split(",")]
+        if len(fields) == 1:
+            fields = cleanIDN.split(" ")
+
+        supportedName = ""
+        instType = "Unknown"
+        for name, nameType in _instTypeByName:
+            if name in idn:
+                supportedName = name
+                instType = nameType
+
+        serial = ""
+        if supportedName in _serialPatterns:
+            found = _serialPatterns[supportedName].search(idn)
+            if found is not None:
+                serial = found.group()
+        elif len(fields) > 2:
+            serial = fields[2]
+
+        return cls(
+            resName=resName,
+            idn=idn,
+            make=fields[0] if len(fields) > 0 else "",
+            model=fields[1] if len(fields) > 1 else "",
+            serial=serial,
+            type=instType,
+            firmware=fields[3] if len(fields) > 3 else "",
+            session=session,
+            supportedName=supportedName
+        )
+
+    def __getitem__(self, key):
+        if key in self._legacyKeys:
+            return getattr(self, self._legacyKeys[key])
+        if key in self.__slots__:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return list(self._legacyKeys.keys())
+
+    def __repr__(self):
+        return "InstrumentRecord(" + self.type + ", " + self.idn.strip() + ", " + self.resName + ")"
+
+
+class InstrumentRegistry:
+    """Connected instruments indexed by type, serial number and model
+
+    The registry behaves like the list of instruments returned by earlier versions of initInstruments() (it can be
+    iterated, indexed and measured with len()) and adds constant time lookups.
+
+    Parameters
+    ----------
+    records : list of InstrumentRecord, optional
+        Records to add to the registry
+
+    See Also
+    --------
+    + initInstruments() : Returns an InstrumentRegistry of all connected instruments
+    + InstrumentRegistry.fromInstruments() : Build a registry from a list of instrument objects
+
+    Example
+    -------
+    >>> instruments = initInstruments()
+    >>> instruments.byType("Multimeter")
+    >>> instruments.findBySerial("8014885")
+    """
+
+    def __init__(self, records=None):
+        self._records = []
+        self._byType = {}
+        self._bySerial = {}
+        self._byModel = {}
+        for record in records or []:
+            self.add(record)
+
+    @classmethod
+    def fromInstruments(cls, instruments):
+        """Build a registry from instrument objects
+
+        Parameters
+        ----------
+        instruments : list of object or InstrumentRegistry
+            Registry (returned as is), InstrumentRecords or instrument objects with 'inst', 'name', 'resName' and
+            'type' keys (see initInstruments() docs)
+
+        Returns
+        -------
+        InstrumentRegistry
+        """
+        if isinstance(instruments, InstrumentRegistry):
+            return instruments
+
+        registry = cls()
+        for inst in instruments:
+            if isinstance(inst, InstrumentRecord):
+                registry.add(inst)
+            else:
+                record = InstrumentRecord.fromIDN(inst["name"], inst.get("resName", ""), inst.get("inst"))
+                if "type" in inst.keys():
+                    record.type = inst["type"]
+                registry.add(record)
+        return registry
+
+    def add(self, record):
+        """Add a record to the registry and its indexes
+
+        Parameters
+        ----------
+        record : InstrumentRecord
+
+        Returns
+        -------
+        None
+        """
+        self._records.append(record)
+        self._byType.setdefault(record.type, []).append(record)
+        self._byModel.setdefault(record.model, []).append(record)
+        if record.serial != "":
+            self._bySerial.setdefault(record.serial, []).append(record)
+
+    def __iter__(self):
+        return iter(self._records)
+
+    def __len__(self):
+        return len(self._records)
+
+    def __getitem__(self, index):
+        return self._records[index]
+
+    def byType(self, instType):
+        """All records of the given instrument type (eg.: 'Multimeter')"""
+        return list(self._byType.get(instType, []))
+
+    def bySerial(self, serial):
+        """All records with exactly the given serial number"""
+        return list(self._bySerial.get(serial, []))
+
+    def byModel(self, model):
+        """All records of the given model as reported by `*IDN?` (eg.: 'MODEL 2110')"""
+        return list(self._byModel.get(model, []))
+
+    def findBySerial(self, serial):
+        """Find records by serial number
+
+        Looks for an exact serial number match first. If there is none, instruments whose `*IDN?` response contains
+        the given string are returned, so partially typed serial numbers still work.
+
+        Parameters
+        ----------
+        serial : str
+            Serial number
+
+        Returns
+        -------
+        list of InstrumentRecord
+        """
+        found = self.bySerial(serial)
+        if len(found) == 0:
+            found = [record for record in self._records if serial in record.idn]
+        return found
+
+    def countByType(self):
+        """Number of instruments of every supported type and of unknown instruments
+
+        Returns
+        -------
+        dict[str, int]
+            Object with key as type of instrument and value as the number of type connected
+        """
+        instTypeCount = {}
+        for instType in supportedInstruments.keys():
+            instTypeCount[instType] = len(self._byType.get(instType, []))
+        instTypeCount["Unknown"] = len(self._byType.get("Unknown", []))
+        return instTypeCount
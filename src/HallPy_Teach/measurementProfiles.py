@@ -0,0 +1,198 @@
+"""
+HallPy_Teach.measurementProfiles: speed / noise profiles for the multimeters
+============================================================================
+
+Description
+-----------
+The multimeter config lines in the experiments' requiredEquipment leave autorange and the default integration time on,
+so a single `READ?` may include range switching and a long integration, and the time per data point is unpredictable.
+A measurement profile ('fast', 'balanced' or 'precise') sets a fixed range chosen from the largest value expected
+during the sweep, the integration time (NPLC) or reading rate and autozero, using the commands in
+constants.multimeterProfiles for the model of the multimeter. applyProfile() reports the expected time and noise of a
+reading so they can be compared with the measurement interval.
+
+The commands written by a profile are kept in the instrument object ('profileConfig'), so a reconnected instrument is
+set up with the same profile again (see resilience.makeExpInstsResilient()). Runs without a profile call
+clearProfile(), which sets the range back to the setup() config and clears 'profileConfig'.
+
+See Also
+--------
++ profileNames
++ getInstModel(*args)
++ chooseRange(*args)
++ getProfileConfig(*args)
++ applyProfile(*args)
++ clearProfile(*args)
+
+"""
+import time
+
+from .constants import multimeterProfiles, multimeterRanges, queryOverhead
+
+profileNames = ["fast", "balanced", "precise"]
+"""Names of the available measurement profiles, from the shortest to the longest reading time
+"""
+
+
+def getInstModel(expInst):
+    """Key of an experiment instrument in constants.supportedInstruments
+
+    Parameters
+    ----------
+    expInst : object
+        Instrument object of the experiment (see getAndSetupExpInsts())
+
+    Returns
+    -------
+    str
+        Model name, or an empty string if the model is not known
+    """
+    record = expInst.get("record")
+    if record is not None and record.supportedName:
+        return record.supportedName
+    idn = expInst.get("idn", "")
+    for model in multimeterProfiles.keys():
+        if model in idn:
+            return model
+    return ""
+
+
+def chooseRange(model, function, maxValue):
+    """Smallest fixed range of a multimeter which fits the largest expected value
+
+    Parameters
+    ----------
+    model : str
+        Model name (key of constants.multimeterRanges)
+    function : str
+        Measured function, 'VOLT:DC' or 'CURR:DC'
+    maxValue : float
+        Largest expected absolute value (V or A)
+
+    Returns
+    -------
+    float
+        Range (V or A). The largest range is returned if maxValue does not fit any range.
+    """
+    ranges = multimeterRanges[model][function]
+    for measRange in ranges:
+        if abs(maxValue) <= measRange:
+            return measRange
+    return ranges[-1]
+
+
+def getProfileConfig(model, profile, function, maxValue=None):
+    """Config lines setting a measurement profile
+
+    Parameters
+    ----------
+    model : str
+        Model name (key of constants.multimeterProfiles)
+    profile : str
+        Name of the profile (see profileNames)
+    function : str
+        Measured function (eg.: 'VOLT:DC', 'CURR:DC', 'TCO')
+    maxValue : float, optional
+        Largest expected absolute value. If provided, the function is configured with a fixed range (see chooseRange()).
+        Otherwise the function's configuration is left as it is and only the integration time / autozero are set.
+
+    Returns
+    -------
+    tuple[list of str, float or None]
+        Config lines and the chosen range (None if no range was set)
+    """
+    if model not in multimeterProfiles.keys():
+        print("\x1b[;43m Measurement profiles are not available for this multimeter \x1b[m")
+        print("Multimeter in question:", model if model else "unknown model")
+        print("Multimeters with measurement profiles:")
+        for knownModel in multimeterProfiles.keys():
+            print("   " + knownModel)
+        raise ValueError("No measurement profiles for multimeter model '" + str(model) + "'")
+    if profile not in multimeterProfiles[model].keys():
+        print("\x1b[;43m Please use a valid measurement profile \x1b[m")
+        print("Valid profiles:", ", ".join(profileNames))
+        raise ValueError("Invalid measurement profile '" + str(profile) + "'")
+
+    configLines = []
+    measRange = None
+    if maxValue is not None:
+        measRange = chooseRange(model, function, maxValue)
+        configLines.append("CONF:" + function + " " + str(measRange))
+    configLines += [command.format(function=function) for command in multimeterProfiles[model][profile]["commands"]]
+    return configLines, measRange
+
+
+def applyProfile(expInst, profile, function, maxValue=None, session=None):
+    """Set a measurement profile on a multimeter of an experiment
+
+    Parameters
+    ----------
+    expInst : object
+        Instrument object of the experiment (see getAndSetupExpInsts())
+    profile : str
+        Name of the profile (see profileNames)
+    function : str
+        Measured function (eg.: 'VOLT:DC', 'CURR:DC', 'TCO')
+    maxValue : float, optional
+        Largest expected absolute value, used to choose a fixed range (see getProfileConfig())
+    session : object, optional
+        Instrument object to write the config lines to. Defaults to expInst['res'].
+
+    Returns
+    -------
+    dict[str, Union[str, float, list]]
+        Object with keys 'profile', 'model', 'function', 'range' (None if not set), 'config' (lines written),
+        'expectedLatency' (nominal time of one `READ?` in seconds) and 'expectedNoise' (nominal RMS noise in V or A, None
+        if no range was set)
+    """
+    model = getInstModel(expInst)
+    configLines, measRange = getProfileConfig(model, profile, function, maxValue)
+    if session is None:
+        session = expInst["res"]
+    for confLine in configLines:
+        session.write(confLine)
+        time.sleep(0.2)
+    expInst["profileConfig"] = configLines
+
+    profileInfo = multimeterProfiles[model][profile]
+    return {
+        "profile": profile,
+        "model": model,
+        "function": function,
+        "range": measRange,
+        "config": configLines,
+        "expectedLatency": profileInfo["readingTime"] + queryOverhead,
+        "expectedNoise": measRange * profileInfo["noisePPM"] * 1e-6 if measRange is not None else None,
+    }
+
+
+def clearProfile(expInst, session=None):
+    """Undo the range set by applyProfile() for a run without a measurement profile
+
+    If a profile was applied, the config lines of setup() are written again (so the multimeter is back on autorange)
+    and 'profileConfig' is cleared, so the profile is not set again when the instrument is reconnected. The integration
+    time / reading rate and autozero are not part of the setup() config and stay as the last profile set them.
+
+    Parameters
+    ----------
+    expInst : object
+        Instrument object of the experiment (see getAndSetupExpInsts())
+    session : object, optional
+        Instrument object to write the config lines to. Defaults to expInst['res'].
+
+    Returns
+    -------
+    list of str
+        Lines written (empty if no profile was applied)
+    """
+    if len(expInst.get("profileConfig") or []) == 0:
+        expInst["profileConfig"] = []
+        return []
+    configLines = list(expInst.get("config") or [])
+    if session is None:
+        session = expInst["res"]
+    for confLine in configLines:
+        session.write(confLine)
+        time.sleep(0.2)
+    expInst["profileConfig"] = []
+    return configLines
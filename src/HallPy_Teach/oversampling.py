@@ -0,0 +1,256 @@
+"""
+HallPy_Teach.oversampling: averaging several readings per data point
+====================================================================
+
+Description
+-----------
+With `samplesPerPoint` > 1 every value of a data point is the mean of several readings, and its standard error is
+stored in an uncertainty column next to it. The readings are averaged in one of two ways:
+    - 'instrument': the instrument's own averaging filter (see constants.instrumentAveraging) averages the readings
+      and a single `READ?` returns the mean. Only one query per point, but the instrument does not report the spread,
+      so the uncertainty is the nominal noise of the measurement profile divided by sqrt(samplesPerPoint) (NaN if no
+      profile is used).
+    - 'host': a burst of queries is sent and the mean and standard error are computed with numpy.
+'auto' uses the instrument's filter when it has one and the host otherwise. The expected time per point of both
+strategies is reported by setupOversampling(), so the cost of oversampling can be compared with the measurement
+interval before the run starts.
+
+See Also
+--------
++ averagingStrategies
++ setupOversampling(*args)
++ estimateRunTimes(*args)
++ readAveraged(*args)
++ readLCRAveraged(*args)
+
+"""
+import time
+
+import numpy as np
+
+from .constants import instrumentAveraging, multimeterProfiles, nominalReadingTime, queryOverhead
+from .helper import parseLCRReading, parseQueryReading
+from .measurementProfiles import getInstModel
+
+averagingStrategies = ["auto", "instrument", "host"]
+"""Ways of averaging the readings of a data point (see module description)
+"""
+
+
+def estimatePointCost(readingTime, samples):
+    """Expected time in seconds to take one averaged value with each strategy
+
+    Parameters
+    ----------
+    readingTime : float
+        Time of one reading in seconds (without the bus overhead)
+    samples : int
+        Readings per data point
+
+    Returns
+    -------
+    dict[str, float]
+        Object with keys 'instrument' (one query, the instrument takes all readings) and 'host' (one query per reading)
+    """
+    return {
+        "instrument": samples * readingTime + queryOverhead,
+        "host": samples * (readingTime + queryOverhead),
+    }
+
+
+def setupOversampling(expInst, function, samples, strategy="auto", profileReport=None, session=None):
+    """Choose how the readings of an instrument are averaged and set it up
+
+    Parameters
+    ----------
+    expInst : object
+        Instrument object of the experiment (see getAndSetupExpInsts())
+    function : str
+        Measured function (eg.: 'VOLT:DC', 'CURR:DC', 'TCO'), used in the averaging filter commands
+    samples : int
+        Readings per data point
+    strategy : str, default='auto'
+        'auto', 'instrument' or 'host' (see averagingStrategies)
+    profileReport : dict, optional
+        Object returned by measurementProfiles.applyProfile() for the instrument, used for the reading time and noise
+    session : object, optional
+        Instrument object to write the filter commands to. Defaults to expInst['res'].
+
+    Notes
+    -----
+    Call it for every run, also with samples=1: the averaging filter of the instrument is turned off unless the
+    'instrument' strategy is used, and expInst['averagingConfig'] (the lines written again when the instrument is
+    reconnected, see resilience) is replaced.
+
+    Returns
+    -------
+    dict[str, Union[str, int, float, list, None]]
+        Object with keys 'strategy' (the one used), 'samples', 'model', 'config' (lines written), 'readingTime' (nominal
+        time of one reading in seconds), 'readingNoise' (nominal noise of one reading in V or A, None if not known),
+        'costs' (expected time per value of each strategy, None for 'instrument' if not supported, see
+        estimatePointCost()) and 'expectedLatency' (of the strategy used)
+    """
+    if type(samples) != int or samples < 1:
+        print("\x1b[;43m Please provide a valid number of samples per point (integer, at least 1) \x1b[m")
+        raise ValueError("Invalid number of samples per point. Argument in question: samplesPerPoint")
+    if strategy not in averagingStrategies:
+        print("\x1b[;43m Please use a valid averaging strategy \x1b[m")
+        print("Valid strategies:", ", ".join(averagingStrategies))
+        raise ValueError("Invalid averaging strategy '" + str(strategy) + "'")
+
+    expInst["averagingConfig"] = []
+    model = getInstModel(expInst)
+    filterInfo = instrumentAveraging.get(model)
+    canAverage = filterInfo is not None and samples <= filterInfo["maxSamples"]
+    if strategy == "instrument" and not canAverage and samples > 1:
+        print("\x1b[;43m This instrument cannot average", samples, "readings itself \x1b[m")
+        print("Instrument in question:", model if model else "unknown model")
+        print("Use averaging='host' (or 'auto') to average the readings on the computer.")
+        raise ValueError("Instrument averaging is not available for '" + str(model) + "' with " + str(samples)
+                         + " samples")
+
+    if profileReport is not None:
+        readingTime = profileReport["expectedLatency"] - queryOverhead
+        readingNoise = profileReport["expectedNoise"]
+    elif model in multimeterProfiles.keys():
+        readingTime = multimeterProfiles[model]["balanced"]["readingTime"]
+        readingNoise = None
+    else:
+        readingTime = nominalReadingTime
+        readingNoise = None
+
+    costs = estimatePointCost(readingTime, samples)
+    if not canAverage:
+        costs["instrument"] = None
+
+    if samples == 1:
+        used = "host"
+    elif strategy == "auto":
+        used = "instrument" if canAverage else "host"
+    else:
+        used = strategy
+
+    # The filter is turned off whenever it is not used, so it is not left on by an earlier oversampled run
+    configLines = []
+    if filterInfo is not None:
+        commands = filterInfo["commands"] if used == "instrument" else filterInfo["off"]
+        configLines = [command.format(function=function, samples=samples) for command in commands]
+    if session is None:
+        session = expInst["res"]
+    for confLine in configLines:
+        session.write(confLine)
+        time.sleep(0.2)
+    expInst["averagingConfig"] = configLines
+
+    return {
+        "strategy": used,
+        "samples": samples,
+        "model": model,
+        "config": configLines,
+        "readingTime": readingTime,
+        "readingNoise": readingNoise,
+        "costs": costs,
+        "expectedLatency": costs[used] if samples > 1 else readingTime + queryOverhead,
+    }
+
+
+def estimateRunTimes(plans, points, interval, overhead=0.0):
+    """Expected data collection time with every averaging strategy, shown before the run starts
+
+    Parameters
+    ----------
+    plans : dict[str, dict]
+        Object with the 'var' names of the instruments read for every data point as keys and the objects returned by
+        setupOversampling() as values
+    points : int
+        Number of data points of the run
+    interval : float
+        Measurement interval in seconds (a point never takes less)
+    overhead : float, default=0.0
+        Time per point spent on anything but the readings (eg.: settling) in seconds
+
+    Returns
+    -------
+    dict[str, float]
+        Object with keys 'single' (one reading per value), 'instrument' (instrument averaging wherever it is
+        available, host averaging otherwise), 'host' and 'chosen' (the strategies used), in seconds
+    """
+    def runTime(latencies):
+        return points * max(interval, overhead + sum(latencies))
+
+    estimates = {
+        "single": runTime([plan["readingTime"] + queryOverhead for plan in plans.values()]),
+        "instrument": runTime([plan["costs"]["instrument"] if plan["costs"]["instrument"] is not None
+                               else plan["costs"]["host"] for plan in plans.values()]),
+        "host": runTime([plan["costs"]["host"] for plan in plans.values()]),
+        "chosen": runTime([plan["expectedLatency"] for plan in plans.values()]),
+    }
+
+    samples = max(plan["samples"] for plan in plans.values())
+    print("Averaging", samples, "readings per value:")
+    for var, plan in plans.items():
+        instrumentCost = plan["costs"]["instrument"]
+        print("   " + var + " : instrument",
+              "n/a" if instrumentCost is None else str(np.round(instrumentCost, 3)) + " s",
+              "| host", str(np.round(plan["costs"]["host"], 3)) + " s", "per value (using " + plan["strategy"] + ")")
+    print("Expected data collection time: single reading", str(np.round(estimates["single"], 1)) + " s",
+          "| instrument", str(np.round(estimates["instrument"], 1)) + " s",
+          "| host", str(np.round(estimates["host"], 1)) + " s")
+    return estimates
+
+
+def _standardError(readings, plan):
+    if plan is not None and plan["strategy"] == "host" and len(readings) > 1:
+        return float(np.std(readings, ddof=1) / np.sqrt(len(readings)))
+    samples = plan["samples"] if plan is not None else 1
+    readingNoise = plan["readingNoise"] if plan is not None else None
+    return readingNoise / np.sqrt(samples) if readingNoise is not None else float("nan")
+
+
+def readAveraged(session, plan=None, command="READ?"):
+    """Take one averaged value
+
+    Parameters
+    ----------
+    session : object
+        PyVisa instrument object
+    plan : dict, optional
+        Object returned by setupOversampling(). A single reading is taken if not provided.
+    command : str, default='READ?'
+        Query returning one reading
+
+    Returns
+    -------
+    tuple[float, float]
+        Mean of the readings and its standard error (NaN if it is not known)
+    """
+    burst = plan["samples"] if plan is not None and plan["strategy"] == "host" else 1
+    responses = [session.query(command) for _ in range(burst)]
+    try:
+        readings = np.array(responses, dtype=float)
+    except ValueError:
+        readings = np.array([parseQueryReading(response) for response in responses], dtype=float)
+    return float(np.mean(readings)), _standardError(readings, plan)
+
+
+def readLCRAveraged(session, plan=None):
+    """Take one averaged capacitance and capacitance loss value from the LCR meter
+
+    Parameters
+    ----------
+    session : object
+        LCR PyVisa object
+    plan : dict, optional
+        Object returned by setupOversampling(). A single reading is taken if not provided.
+
+    Returns
+    -------
+    tuple[float, float, float, float]
+        Capacitance (F), its standard error, capacitance loss and its standard error (NaN if not known)
+    """
+    burst = plan["samples"] if plan is not None and plan["strategy"] == "host" else 1
+    readings = np.array([parseLCRReading(session.query("FETCh?")) for _ in range(burst)], dtype=float)
+    means = np.mean(readings, axis=0)
+    capErr = _standardError(readings[:, 0], plan)
+    capLossErr = _standardError(readings[:, 1], plan)
+    return float(means[0]), capErr, float(means[1]), capLossErr
@@ -0,0 +1,177 @@
+"""
+HallPy_Teach.replay: replaying saved runs through the live display
+==================================================================
+
+Description
+-----------
+replayRun() feeds the points of a saved data set, one at a time, through the same live display used during the
+experiments (showLiveReadings() and, for the Hall Effect experiment, draw3DHELabGraphs()). Points are shown at their
+recorded times divided by the replay speed, or as fast as possible, so the cost of the display can be measured without
+any instruments connected. The achieved frames and points per second are returned.
+
+See Also
+--------
++ replayRun(*args)
++ loadRun(*args)
+
+"""
+import time
+
+import numpy as np
+from IPython.core.display import clear_output
+
+from .archive import ArchiveReader
+from .experiments import curieWeiss, hallEffect
+from .helper import getDataFromFile, showLiveReadings
+
+
+def loadRun(source):
+    """Load a saved run
+
+    Parameters
+    ----------
+    source : dict or str
+        Data object returned by doExperiment(), or the name of a '.p' file saved by clearFileAndSaveData() or a '.hpz'
+        archive (see archive.exportArchive())
+
+    Returns
+    -------
+    dict
+    """
+    if isinstance(source, str):
+        if source.endswith(".hpz"):
+            with ArchiveReader(source) as archive:
+                return archive.load()
+        return getDataFromFile(source)
+    return source
+
+
+def _hallFrames(data):
+    runInfo = data.get("runInfo", {})
+    parameters = runInfo.get("parameters", {})
+    sweepKeys = sorted(hallEffect.getSweepKeys(data), key=float, reverse=parameters.get("descendingEM", False))
+    interval = parameters.get("measurementInterval", 1)
+
+    # Sweeps restart their time at 0, the electromagnet change between sweeps takes about 2s
+    sweepOffset = 0.0
+    shown = {key: {column: data[key][column][:0] for column in data[key].keys() if column != "emCurr"}
+             for key in sweepKeys}
+    for key in sweepKeys:
+        shown[key]["emCurr"] = data[key]["emCurr"]
+    for key in sweepKeys:
+        sweep = data[key]
+        times = np.asarray(sweep["actualTime"] if "actualTime" in sweep else sweep["time"], dtype=float)
+        for point in range(len(times)):
+            for column in shown[key].keys():
+                if column != "emCurr":
+                    shown[key][column] = sweep[column][:point + 1]
+            liveReading = {
+                "EM Volt.  (V)": np.round(float(key), decimals=3),
+                "EM Curr. (A)": np.round(sweep["emCurr"], decimals=3),
+                "Supply Curr. (\u03bcA)": np.round(sweep["supplyCurr"][point] * 1000000, decimals=3),
+                "Supply Volt. (V)": np.round(sweep["supplyVolt"][point], decimals=3),
+                "Hall Volt. (mV)": np.round(sweep["hallBarVolt"][point] * 1000, decimals=3),
+                "Time on Current EM Volt. (s)": np.round(times[point], decimals=3),
+            }
+            yield sweepOffset + times[point], liveReading, shown
+        if len(times) > 0:
+            sweepOffset += times[-1] + interval + 2.0
+
+
+def _curieFrames(data):
+    parameters = data.get("runInfo", {}).get("parameters", {})
+    exptLength = parameters.get("exptLength", (np.amax(data["time"]) if len(data["time"]) > 0 else 0) / 60)
+    times = np.asarray(data["actualTime"] if "actualTime" in data else data["time"], dtype=float)
+    for point in range(len(times)):
+        shown = {column: data[column][:point + 1] for column in ["time", "temp", "cap", "capLoss"]}
+        liveReadings = {
+            "Temp (ºC)": data["temp"][point],
+            "Capacitance (F)": data["cap"][point],
+            "Capacitance Loss (F)": data["capLoss"][point],
+            "Time Passed": data["time"][point],
+        }
+        yield times[point], liveReadings, (shown, exptLength)
+
+
+def replayRun(source, speed=1.0, plot=True, frameEvery=1, maxPoints=None):
+    """Replay a saved run through the live display
+
+    Parameters
+    ----------
+    source : dict or str
+        Saved run (see loadRun())
+    speed : float or None, default=1.0
+        Replay speed as a multiple of the recorded speed (eg.: 10 replays ten times faster). None replays as fast as
+        possible.
+    plot : bool, default=True
+        Draw the graphs (False only shows the live readings)
+    frameEvery : int, default=1
+        Update the display every frameEvery points. The last point is always shown.
+    maxPoints : int, optional
+        Stop after this many points
+
+    Returns
+    -------
+    dict[str, Union[int, float]]
+        Object with keys 'points', 'frames', 'elapsed' (s), 'pointsPerSecond', 'framesPerSecond', 'meanFrameTime' (s),
+        'maxFrameTime' (s), 'lateFrames' (frames shown after their scheduled time) and 'achievedSpeed' (recorded time /
+        replay time)
+
+    Example
+    -------
+    >>> stats = replayRun("myHallRun.p", speed=None, plot=True)
+    >>> stats["framesPerSecond"]
+    """
+    data = loadRun(source)
+    isCurieWeiss = "temp" in data.keys() and "cap" in data.keys()
+    frames = _curieFrames(data) if isCurieWeiss else _hallFrames(data)
+
+    frameTimes = []
+    lateFrames = 0
+    points = 0
+    lastRecordedTime = 0.0
+    pending = None
+    replayStart = time.perf_counter()
+
+    def showFrame(liveReading, shown):
+        frameStart = time.perf_counter()
+        clear_output(wait=True)
+        if isCurieWeiss:
+            showLiveReadings(liveReading, *(curieWeiss.getLiveGraphs(*shown) if plot else ()))
+        else:
+            if plot:
+                hallEffect.draw3DHELabGraphs(shown)
+            showLiveReadings(liveReading)
+        frameTimes.append(time.perf_counter() - frameStart)
+
+    for recordedTime, liveReading, shown in frames:
+        if maxPoints is not None and points >= maxPoints:
+            break
+        if speed is not None:
+            waitTime = recordedTime / speed - (time.perf_counter() - replayStart)
+            if waitTime > 0:
+                time.sleep(waitTime)
+            elif (points % frameEvery) == 0 and waitTime < -0.001:
+                lateFrames += 1
+        points += 1
+        lastRecordedTime = recordedTime
+        pending = (liveReading, shown)
+        if (points - 1) % frameEvery == 0:
+            showFrame(liveReading, shown)
+            pending = None
+
+    if pending is not None:
+        showFrame(*pending)
+
+    elapsed = time.perf_counter() - replayStart
+    return {
+        "points": points,
+        "frames": len(frameTimes),
+        "elapsed": elapsed,
+        "pointsPerSecond": points / elapsed if elapsed > 0 else 0.0,
+        "framesPerSecond": len(frameTimes) / elapsed if elapsed > 0 else 0.0,
+        "meanFrameTime": float(np.mean(frameTimes)) if len(frameTimes) > 0 else 0.0,
+        "maxFrameTime": float(np.max(frameTimes)) if len(frameTimes) > 0 else 0.0,
+        "lateFrames": lateFrames,
+        "achievedSpeed": float(lastRecordedTime) / elapsed if elapsed > 0 else 0.0,
+    }
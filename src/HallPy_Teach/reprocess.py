@@ -0,0 +1,355 @@
+"""
+HallPy_Teach.reprocess: analysing whole directories of saved runs
+=================================================================
+
+Description
+-----------
+reprocessDirectory() finds every saved run ('.p' files and '.hpz' archives) in a directory and analyses them in
+parallel worker processes, one file per task: the Hall Effect sweeps are fitted with analysis.fitHallSweeps() (every
+Hall bar of a multi bar run gets its own row) and the Curie Weiss law with analysis.fitCurieWeiss(). Summary figures can
+be rendered to image files at the same time. The results of all files are written to one CSV table, with a row for
+every file that could not be analysed and the reason.
+
+The same is available from the command line:
+
+    hallpy-reprocess <directory> [-o results.csv] [--figures figureDir] [--workers N] [--thickness T]
+                     [--field-per-em-curr F]
+
+or `python -m HallPy_Teach.reprocess ...`.
+
+See Also
+--------
++ reprocessDirectory(*args)
++ reprocessFile(*args)
++ resultColumns
+
+"""
+import argparse
+import concurrent.futures
+import csv
+import functools
+import hashlib
+import os
+import sys
+import time
+
+import numpy as np
+
+from .analysis import fitCurieWeiss, fitHallSweeps
+from .archive import ArchiveReader
+from .constants import elementaryCharge
+from .helper import getDataFromFile
+
+resultColumns = [
+    "file", "hallBar", "experiment", "status", "error", "startTime", "points", "sweeps",
+    "meanSlope", "meanSlopeErr", "hallCoefficientFromGradient", "hallCoefficientFromGradientErr",
+    "carrierDensityFromGradient", "weissTemp", "weissTempCI", "curieConst", "curieConstCI", "figure", "seconds",
+]
+"""Columns of the results table written by reprocessDirectory()
+"""
+
+
+def _loadRun(fileName):
+    if fileName.endswith(".hpz"):
+        with ArchiveReader(fileName) as archive:
+            return archive.load()
+    return getDataFromFile(fileName)
+
+
+def _hallBarSets(data):
+    barSets = [(1, data)]
+    for key in sorted(data.keys()):
+        if key.startswith("hallBar") and isinstance(data[key], dict) and key[7:].isdigit():
+            barSets.append((int(key[7:]), data[key]))
+    return barSets
+
+
+def _drawHallFigure(fileName, fits, figureFile):
+    import matplotlib
+    matplotlib.use("Agg")
+    from matplotlib import pyplot as plt
+
+    fig, axes = plt.subplots(1, 2, figsize=(11, 4.5))
+    for bar, barData, fit in fits:
+        sweepKeys = sorted([key for key in barData.keys() if isinstance(barData[key], dict)
+                            and "supplyCurr" in barData[key]], key=float)
+        for key in sweepKeys:
+            axes[0].plot(np.asarray(barData[key]["supplyCurr"]) * 1e6, np.asarray(barData[key]["hallBarVolt"]) * 1e3,
+                         ".", ms=3, label=("Bar " + str(bar) + ", " if len(fits) > 1 else "") + key + " V")
+        axes[1].errorbar(fit["emCurr"], fit["slope"], yerr=fit["slopeErr"], fmt="o", ms=4, label="Bar " + str(bar))
+    axes[0].set_xlabel("Supply Current (μA)")
+    axes[0].set_ylabel("Hall Voltage (mV)")
+    axes[0].legend(fontsize="x-small", ncol=2)
+    axes[1].set_xlabel("Electromagnet Current (A)")
+    axes[1].set_ylabel("Slope (V/A)")
+    if len(fits) > 1:
+        axes[1].legend(fontsize="small")
+    fig.suptitle(os.path.basename(fileName))
+    fig.tight_layout()
+    fig.savefig(figureFile, dpi=100)
+    plt.close(fig)
+
+
+def _drawCurieFigure(fileName, data, fit, figureFile):
+    import matplotlib
+    matplotlib.use("Agg")
+    from matplotlib import pyplot as plt
+
+    temp = np.asarray(data["temp"], dtype=float)
+    cap = np.asarray(data["cap"], dtype=float)
+    fig, axis = plt.subplots(figsize=(6, 4.5))
+    axis.plot(temp, cap, ".", ms=3, label="Data")
+    if np.isfinite(fit["curieConst"]) and np.isfinite(fit["weissTemp"]) and len(temp) > 0:
+        fitTemp = np.linspace(np.min(temp), np.max(temp), 200)
+        fitTemp = fitTemp[fitTemp > fit["weissTemp"]]
+        axis.plot(fitTemp, fit["curieConst"] / (fitTemp - fit["weissTemp"]), "-",
+                  label="Curie Weiss fit (θ = " + str(np.round(fit["weissTemp"], 2)) + " ºC)")
+    axis.set_xlabel("Temperature (ºC)")
+    axis.set_ylabel("Capacitance (F)")
+    axis.legend(fontsize="small")
+    fig.suptitle(os.path.basename(fileName))
+    fig.tight_layout()
+    fig.savefig(figureFile, dpi=100)
+    plt.close(fig)
+
+
+def _figureFile(fileName, figureDir, figureFormat, baseDir=None):
+    # The readable part of the name (path relative to baseDir, extension kept) can be the same for different runs
+    # (eg.: 'a.b/run.p' and 'a_b/run.p'), the hash of the relative path keeps every figure name unique
+    if baseDir is None:
+        baseDir = os.path.dirname(os.path.abspath(fileName))
+    relativeName = os.path.relpath(os.path.abspath(fileName), os.path.abspath(baseDir)).replace(os.sep, "/")
+    readableName = "__".join(part for part in relativeName.split("/") if part not in ("", ".", ".."))
+    pathHash = hashlib.sha1(relativeName.encode("utf-8")).hexdigest()[:10]
+    return os.path.join(figureDir, readableName.replace(".", "_") + "_" + pathHash + "." + figureFormat)
+
+
+def reprocessFile(fileName, thickness=None, fieldPerEMCurr=None, carrierCharge=elementaryCharge, figureDir=None,
+                  figureFormat="png", baseDir=None):
+    """Analyse one saved run
+
+    Parameters
+    ----------
+    fileName : str
+        Name of a '.p' file or '.hpz' archive saved by one of the experiments
+    thickness, fieldPerEMCurr, carrierCharge : float, optional
+        See analysis.fitHallSweeps()
+    figureDir : str, optional
+        Directory to save a summary figure of the run to. No figure is drawn if not provided.
+    figureFormat : str, default='png'
+        Image format of the figure (any format supported by matplotlib)
+    baseDir : str, optional
+        Directory the figure is named relative to, eg.: the figure of '<baseDir>/lab1/run.p' is
+        'lab1__run_p_<hash>.png', where <hash> is a short hash of 'lab1/run.p' keeping the names of different runs
+        apart. Defaults to the directory of the file.
+
+    Returns
+    -------
+    list of dict
+        Rows of the results table (see resultColumns), one per Hall bar for Hall Effect runs
+    """
+    startTime = time.perf_counter()
+    row = {column: None for column in resultColumns}
+    row["file"] = os.path.abspath(fileName)
+    try:
+        data = _loadRun(fileName)
+        if not isinstance(data, dict):
+            raise ValueError("not a HallPy_Teach data set")
+        runInfo = data.get("runInfo", {})
+        row["startTime"] = runInfo.get("startTime")
+
+        figureFile = _figureFile(fileName, figureDir, figureFormat, baseDir) if figureDir is not None else None
+        rows = []
+        if "temp" in data.keys() and "cap" in data.keys():
+            fit = fitCurieWeiss(data)
+            row.update({
+                "experiment": runInfo.get("experiment", "Curie Weiss Lab"),
+                "status": "ok",
+                "points": len(data["temp"]),
+                "weissTemp": fit["weissTemp"],
+                "weissTempCI": fit["weissTempCI"],
+                "curieConst": fit["curieConst"],
+                "curieConstCI": fit["curieConstCI"],
+            })
+            if figureFile is not None:
+                _drawCurieFigure(fileName, data, fit, figureFile)
+                row["figure"] = figureFile
+            rows.append(row)
+        else:
+            fits = []
+            for bar, barData in _hallBarSets(data):
+                fit = fitHallSweeps(barData, thickness=thickness, fieldPerEMCurr=fieldPerEMCurr,
+                                    carrierCharge=carrierCharge)
+                if len(fit["emVolt"]) == 0:
+                    continue
+                fits.append((bar, barData, fit))
+                usable = np.isfinite(fit["slope"])
+                barRow = dict(row)
+                barRow.update({
+                    "hallBar": bar,
+                    "experiment": runInfo.get("experiment", "Hall Effect Lab"),
+                    "status": "ok",
+                    "points": int(np.sum(fit["points"])),
+                    "sweeps": len(fit["emVolt"]),
+                    "meanSlope": float(np.mean(fit["slope"][usable])) if np.any(usable) else float("nan"),
+                    "meanSlopeErr": float(np.sqrt(np.sum(fit["slopeErr"][usable] ** 2)) / np.count_nonzero(usable))
+                    if np.any(usable) else float("nan"),
+                    "hallCoefficientFromGradient": fit["hallCoefficientFromGradient"],
+                    "hallCoefficientFromGradientErr": fit["hallCoefficientFromGradientErr"],
+                    "carrierDensityFromGradient": fit["carrierDensityFromGradient"],
+                })
+                rows.append(barRow)
+            if len(rows) == 0:
+                raise ValueError("no Hall Effect sweeps or Curie Weiss data found")
+            if figureFile is not None:
+                _drawHallFigure(fileName, fits, figureFile)
+                for barRow in rows:
+                    barRow["figure"] = figureFile
+    except Exception as err:
+        row["status"] = "failed"
+        row["error"] = repr(err)
+        rows = [row]
+
+    seconds = time.perf_counter() - startTime
+    for resultRow in rows:
+        resultRow["seconds"] = seconds
+    return rows
+
+
+def findRunFiles(directory, recursive=True, extensions=(".p", ".hpz")):
+    """Saved runs in a directory, sorted by name
+
+    Parameters
+    ----------
+    directory : str
+    recursive : bool, default=True
+        Also look in the subdirectories
+    extensions : tuple of str, default=('.p', '.hpz')
+
+    Returns
+    -------
+    list of str
+    """
+    if not recursive:
+        return sorted(os.path.join(directory, fileName) for fileName in os.listdir(directory)
+                      if fileName.endswith(extensions))
+    fileNames = []
+    for root, dirNames, files in os.walk(directory):
+        fileNames += [os.path.join(root, fileName) for fileName in files if fileName.endswith(extensions)]
+    return sorted(fileNames)
+
+
+def reprocessDirectory(directory, outputFile="results.csv", figureDir=None, figureFormat="png", workers=None,
+                       recursive=True, thickness=None, fieldPerEMCurr=None, carrierCharge=elementaryCharge,
+                       showProgress=True):
+    """Analyse every saved run in a directory in parallel and write one results table
+
+    Parameters
+    ----------
+    directory : str
+        Directory with the saved runs ('.p' files and '.hpz' archives)
+    outputFile : str, default='results.csv'
+        Name of the CSV file the results table is written to (see resultColumns)
+    figureDir : str, optional
+        Directory to save a summary figure of every run to (created if needed). No figures are drawn if not provided.
+    figureFormat : str, default='png'
+        Image format of the figures
+    workers : int, optional
+        Number of worker processes. Defaults to the number of CPUs. 1 analyses the files in this process.
+    recursive : bool, default=True
+        Also analyse the runs in the subdirectories
+    thickness, fieldPerEMCurr, carrierCharge : float, optional
+        See analysis.fitHallSweeps()
+    showProgress : bool, default=True
+        Print the number of files done while the files are analysed
+
+    Returns
+    -------
+    dict[str, Union[int, float, str, list]]
+        Object with keys 'files', 'failed', 'rows' (the results table as a list of dicts, in file name order),
+        'outputFile', 'workers', 'elapsed' (s) and 'filesPerSecond'
+    """
+    if not os.path.isdir(directory):
+        print("\x1b[;43m The directory '" + str(directory) + "' does not exist \x1b[m")
+        raise ValueError("Invalid directory in reprocessDirectory(). Argument in question: directory")
+    fileNames = findRunFiles(directory, recursive=recursive)
+    if figureDir is not None:
+        os.makedirs(figureDir, exist_ok=True)
+    workers = max(1, min(workers or os.cpu_count() or 1, max(len(fileNames), 1)))
+
+    task = functools.partial(reprocessFile, thickness=thickness, fieldPerEMCurr=fieldPerEMCurr,
+                             carrierCharge=carrierCharge, figureDir=figureDir, figureFormat=figureFormat,
+                             baseDir=directory)
+    startTime = time.perf_counter()
+    results = {}
+
+    def progress():
+        if showProgress:
+            print("\rAnalysed", len(results), "/", len(fileNames), "files", end="", flush=True)
+
+    if workers == 1:
+        for fileName in fileNames:
+            results[fileName] = task(fileName)
+            progress()
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(task, fileName): fileName for fileName in fileNames}
+            for future in concurrent.futures.as_completed(futures):
+                fileName = futures[future]
+                try:
+                    results[fileName] = future.result()
+                except Exception as err:
+                    results[fileName] = [dict({column: None for column in resultColumns}, file=os.path.abspath(
+                        fileName), status="failed", error=repr(err))]
+                progress()
+    if showProgress and len(fileNames) > 0:
+        print("")
+
+    rows = [row for fileName in fileNames for row in results[fileName]]
+    with open(outputFile, "w", newline="") as csvFile:
+        writer = csv.DictWriter(csvFile, fieldnames=resultColumns)
+        writer.writeheader()
+        writer.writerows(rows)
+
+    elapsed = time.perf_counter() - startTime
+    failed = sum(1 for fileName in fileNames if any(row["status"] == "failed" for row in results[fileName]))
+    return {
+        "files": len(fileNames),
+        "failed": failed,
+        "rows": rows,
+        "outputFile": outputFile,
+        "workers": workers,
+        "elapsed": elapsed,
+        "filesPerSecond": len(fileNames) / elapsed if elapsed > 0 else 0.0,
+    }
+
+
+def main(argv=None):
+    """Command line entry point (see module description)"""
+    parser = argparse.ArgumentParser(prog="hallpy-reprocess",
+                                     description="Analyse every saved HallPy_Teach run in a directory in parallel.")
+    parser.add_argument("directory", help="directory with the saved runs ('.p' files and '.hpz' archives)")
+    parser.add_argument("-o", "--output", default="results.csv", help="CSV file for the results table")
+    parser.add_argument("--figures", default=None, help="directory to save a summary figure of every run to")
+    parser.add_argument("--figure-format", default="png", help="image format of the figures (default: png)")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes (default: all CPUs)")
+    parser.add_argument("--no-recursive", action="store_true", help="do not look in the subdirectories")
+    parser.add_argument("--thickness", type=float, default=None, help="Hall bar thickness in metres")
+    parser.add_argument("--field-per-em-curr", type=float, default=None,
+                        help="electromagnet calibration in Tesla per Ampere")
+    args = parser.parse_args(argv)
+
+    summary = reprocessDirectory(args.directory, outputFile=args.output, figureDir=args.figures,
+                                 figureFormat=args.figure_format, workers=args.workers,
+                                 recursive=not args.no_recursive, thickness=args.thickness,
+                                 fieldPerEMCurr=args.field_per_em_curr)
+    print("Analysed", summary["files"], "files with", summary["workers"], "workers in",
+          str(np.round(summary["elapsed"], 2)) + " s (" + str(np.round(summary["filesPerSecond"], 1)) + " files/s).")
+    if summary["failed"] > 0:
+        print("\x1b[;43m", summary["failed"], "file(s) could not be analysed, see the 'error' column \x1b[m")
+    print("Results saved in", summary["outputFile"])
+    return 1 if summary["failed"] > 0 and summary["failed"] == summary["files"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
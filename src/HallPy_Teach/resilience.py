@@ -0,0 +1,287 @@
+"""
+HallPy_Teach.resilience: retrying and reconnecting instrument sessions
+======================================================================
+
+Description
+-----------
+A transient VISA error (USB hiccup, serial timeout) used to abort the whole experiment. ResilientSession wraps a PyVisa
+instrument object and retries failed commands following a RetryPolicy. If the instrument keeps failing, the session is
+reopened through the resource manager by looking for the instrument's serial number, the experiment's config lines and
+the shadowed power supply setpoints (see helper.getPSState()) are applied again, and the failed command is retried.
+Every recovery is logged in a RecoveryLog which the experiments return with their data.
+
+See Also
+--------
++ RetryPolicy
++ RecoveryLog
++ ResilientSession
++ makeExpInstsResilient(*args)
+
+"""
+import threading
+import time
+
+import pyvisa
+from pyvisa import VisaIOError
+
+from .helper import getPSState, invalidatePSState, setPSCurr, setPSVolt
+from .instrumentRegistry import InstrumentRecord
+
+
+class RetryPolicy:
+    """How often and how quickly failed instrument commands are retried
+
+    Parameters
+    ----------
+    retries : int, default=3
+        Number of times a failed command is retried before the error is raised
+    backoff : float, default=0.5
+        Time to wait in seconds before the first retry
+    backoffFactor : float, default=2.0
+        Factor the wait time is multiplied by after every retry
+    maxBackoff : float, default=10.0
+        Longest time to wait between retries in seconds
+    reconnectAfter : int or None, default=1
+        Number of failed retries after which the session is reopened before retrying again. None never reconnects.
+    resourceManager : pyvisa.ResourceManager, optional
+        Resource manager used to reopen sessions. A new one is created if not provided.
+
+    Example
+    -------
+    >>> data = hallEffect.doExperiment(expInsts, ..., retryPolicy=RetryPolicy(retries=5, backoff=1.0))
+    """
+
+    def __init__(self, retries=3, backoff=0.5, backoffFactor=2.0, maxBackoff=10.0, reconnectAfter=1,
+                 resourceManager=None):
+        self.retries = retries
+        self.backoff = backoff
+        self.backoffFactor = backoffFactor
+        self.maxBackoff = maxBackoff
+        self.reconnectAfter = reconnectAfter
+        self.resourceManager = resourceManager
+
+    def delay(self, attempt):
+        """Time to wait before the given retry (starting at 0) in seconds"""
+        return min(self.backoff * self.backoffFactor ** attempt, self.maxBackoff)
+
+
+class RecoveryLog:
+    """Thread safe log of the recovery events of one experiment run
+
+    Every event is an object with keys 'time' (time.time()), 'inst' (name of the instrument), 'command', 'error',
+    'action' ('retry', 'reconnect', 'reconnectFailed' or 'failed') and 'recovered' (bool, set once the command succeeds
+    after the event).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.events = []
+
+    def add(self, inst, command, error, action):
+        event = {
+            "time": time.time(),
+            "inst": inst,
+            "command": command,
+            "error": str(error),
+            "action": action,
+            "recovered": False
+        }
+        with self._lock:
+            self.events.append(event)
+        return event
+
+    def summary(self):
+        """Counts of the logged events
+
+        Returns
+        -------
+        dict[str, Union[int, list]]
+            Object with keys 'retries', 'reconnects', 'recovered' (failed commands which succeeded on a retry), 'failed'
+            (counts) and 'recoveryEvents' (copy of the events)
+        """
+        with self._lock:
+            events = list(self.events)
+        return {
+            "retries": len([event for event in events if event["action"] == "retry"]),
+            "reconnects": len([event for event in events if event["action"] == "reconnect"]),
+            "recovered": len([event for event in events if event["action"] == "retry" and event["recovered"]]),
+            "failed": len([event for event in events if event["action"] == "failed"]),
+            "recoveryEvents": events
+        }
+
+
+class ResilientSession:
+    """PyVisa instrument object wrapper which retries failed commands and reconnects by serial number
+
+    Parameters
+    ----------
+    session : object
+        PyVisa instrument object
+    serial : str, optional
+        Serial number of the instrument, used to find it again when reconnecting: only an instrument whose `*IDN?`
+        response gives exactly this serial number (see instrumentRegistry.InstrumentRecord.fromIDN()) is accepted.
+        Without it (or with an empty serial number) the session can only be reopened with its old resource name.
+    config : list of str, optional
+        Config lines written to the instrument after reconnecting (the 'config' of the experiment's requiredEquipment
+        followed by the lines of its measurement profile, see measurementProfiles.applyProfile())
+    policy : RetryPolicy, optional
+        Retry policy. Defaults to RetryPolicy().
+    name : str, optional
+        Name of the instrument in the recovery log
+    log : RecoveryLog, optional
+        Log to record recovery events in. A new log is created if not provided.
+    expInst : object, optional
+        Instrument object of the experiment (see getAndSetupExpInsts()) whose 'res' is replaced with the new PyVisa
+        object after a reconnect, so later runs use the reopened session
+    """
+
+    def __init__(self, session, serial=None, config=None, policy=None, name="", log=None, expInst=None):
+        self.session = session
+        # An empty serial number (eg.: from an IDN without one) would match any instrument
+        self.serial = serial if serial else None
+        self.config = config if config is not None else []
+        self.policy = policy if policy is not None else RetryPolicy()
+        self.name = name
+        self.log = log if log is not None else RecoveryLog()
+        self.expInst = expInst
+        self.resName = getattr(session, "resource_name", None)
+
+    @property
+    def wrappedSession(self):
+        return self.session
+
+    def write(self, *args, **kwargs):
+        return self._call("write", args, kwargs)
+
+    def read(self, *args, **kwargs):
+        return self._call("read", args, kwargs)
+
+    def query(self, *args, **kwargs):
+        return self._call("query", args, kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.session, name)
+
+    def _call(self, method, args, kwargs):
+        command = str(args[0]) if len(args) > 0 else method
+        events = []
+        attempt = 0
+        while True:
+            try:
+                result = getattr(self.session, method)(*args, **kwargs)
+                for event in events:
+                    event["recovered"] = True
+                return result
+            except VisaIOError as err:
+                if attempt >= self.policy.retries:
+                    self.log.add(self.name, command, err, "failed")
+                    raise
+                events.append(self.log.add(self.name, command, err, "retry"))
+                time.sleep(self.policy.delay(attempt))
+                attempt += 1
+
+                if self.policy.reconnectAfter is not None and attempt >= self.policy.reconnectAfter:
+                    try:
+                        self.reconnect()
+                        events.append(self.log.add(self.name, command, err, "reconnect"))
+                    except VisaIOError as reconnectErr:
+                        self.log.add(self.name, command, reconnectErr, "reconnectFailed")
+
+    def _openMatching(self, rm, resName):
+        newSession = rm.open_resource(resName)
+        try:
+            idn = newSession.query("*IDN?")
+            if self.serial is None or InstrumentRecord.fromIDN(idn, resName).serial == self.serial:
+                return newSession
+        except VisaIOError:
+            pass
+        newSession.close()
+        return None
+
+    def reconnect(self):
+        """Reopen the session, reapply config lines and shadowed power supply setpoints
+
+        The old resource name is tried first. If it is gone or now belongs to a different instrument, every resource
+        found by the resource manager is checked for the serial number.
+
+        Returns
+        -------
+        None
+
+        Raises
+        ------
+        VisaIOError
+            If the instrument could not be found or configured
+        """
+        oldState = getPSState(self.session)
+        try:
+            self.session.close()
+        except Exception:
+            pass
+
+        if self.policy.resourceManager is None:
+            self.policy.resourceManager = pyvisa.ResourceManager()
+        rm = self.policy.resourceManager
+
+        newSession = None
+        candidates = [self.resName] if self.resName is not None else []
+        if self.serial is not None:
+            candidates += [res for res in rm.list_resources() if res != self.resName]
+        for resName in candidates:
+            try:
+                newSession = self._openMatching(rm, resName)
+            except VisaIOError:
+                newSession = None
+            if newSession is not None:
+                self.resName = resName
+                break
+
+        if newSession is None:
+            raise VisaIOError(pyvisa.constants.StatusCode.error_resource_not_found)
+
+        invalidatePSState(self.session)
+        self.session = newSession
+        if self.expInst is not None:
+            self.expInst["res"] = newSession
+        for confLine in self.config:
+            self.session.write(confLine)
+            time.sleep(0.2)
+        for (command, channel), value in oldState.items():
+            if command == "VSET":
+                setPSVolt(value, self.session, channel, force=True)
+            elif command == "ISET":
+                setPSCurr(value, self.session, channel, force=True)
+
+
+def makeExpInstsResilient(expInsts, policy, log=None):
+    """Wrap every instrument of an experiment in a ResilientSession
+
+    Parameters
+    ----------
+    expInsts : object
+        Object returned by the experiment's setup() function
+    policy : RetryPolicy
+        Retry policy used for every instrument
+    log : RecoveryLog, optional
+        Shared log for all instruments. A new log is created if not provided.
+
+    Returns
+    -------
+    tuple[dict, RecoveryLog]
+        Object with key as the 'var' name of the instrument and value as its ResilientSession, and the recovery log
+    """
+    if log is None:
+        log = RecoveryLog()
+    sessions = {}
+    for var in expInsts.keys():
+        sessions[var] = ResilientSession(
+            expInsts[var]["res"],
+            serial=expInsts[var].get("serial"),
+            config=(expInsts[var].get("config") or []) + expInsts[var].get("profileConfig", [])
+            + expInsts[var].get("averagingConfig", []),
+            policy=policy,
+            name=var,
+            log=log,
+            expInst=expInsts[var]
+        )
+    return sessions, log
@@ -0,0 +1,518 @@
+"""
+HallPy_Teach.runCatalogue: SQLite catalogue of saved runs
+=========================================================
+
+Description
+-----------
+The '.p' files saved by the experiments have names chosen by whoever ran them and no index, so finding a run on a
+shared lab PC meant unpickling the files one by one. RunCatalogue keeps one row per saved data set in an SQLite
+database: experiment, parameters, instrument IDNs and serial numbers, start and end time, number of data points, file
+path and summary statistics (see describeRun()).
+
+Runs are added automatically when doExperiment() saves its data file (see catalogueRun()). Files saved before the
+catalogue existed (and '.hpz' archives) are added with RunCatalogue.backfill(), which reads the files in parallel worker
+processes and skips files which have not changed since they were indexed.
+
+The database uses write-ahead logging and one connection per thread, so queries from several threads (see
+RunCatalogue.findMany()) run in parallel with each other and with a backfill.
+
+The catalogue is kept in the file named by the HALLPY_TEACH_CATALOGUE environment variable, or '~/.HallPy_Teach/
+runCatalogue.sqlite' by default. Setting HALLPY_TEACH_CATALOGUE to 'off' stops the experiments from adding runs.
+
+See Also
+--------
++ RunCatalogue
++ catalogueRun(*args)
++ describeRun(*args)
++ getDefaultCataloguePath()
+
+"""
+import concurrent.futures
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from .archive import ArchiveReader
+from .helper import getDataFromFile
+from .instrumentRegistry import InstrumentRecord
+
+_schema = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    fileSize INTEGER,
+    fileMtime REAL,
+    experiment TEXT,
+    parameters TEXT,
+    startTime REAL,
+    endTime REAL,
+    points INTEGER,
+    summary TEXT,
+    indexedAt REAL
+);
+CREATE TABLE IF NOT EXISTS runInstruments (
+    runId INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    var TEXT,
+    idn TEXT,
+    serial TEXT
+);
+CREATE INDEX IF NOT EXISTS runsExperiment ON runs(experiment);
+CREATE INDEX IF NOT EXISTS runsStartTime ON runs(startTime);
+CREATE INDEX IF NOT EXISTS runInstrumentsSerial ON runInstruments(serial);
+CREATE INDEX IF NOT EXISTS runInstrumentsRun ON runInstruments(runId);
+"""
+
+_parameterKeyPattern = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+def getDefaultCataloguePath():
+    """Path of the catalogue used by the experiments (None if turned off with HALLPY_TEACH_CATALOGUE='off')"""
+    path = os.environ.get("HALLPY_TEACH_CATALOGUE", "")
+    if path.lower() == "off":
+        return None
+    if path:
+        return path
+    return os.path.join(os.path.expanduser("~"), ".HallPy_Teach", "runCatalogue.sqlite")
+
+
+def _range(values):
+    values = np.asarray(values, dtype=float)
+    values = values[np.isfinite(values)]
+    if len(values) == 0:
+        return None
+    return [float(np.min(values)), float(np.max(values))]
+
+
+def _hallSweeps(data):
+    return {key: value for key, value in data.items() if isinstance(value, dict) and "supplyCurr" in value}
+
+
+def describeRun(data, path=None):
+    """Catalogue record of a data set
+
+    Parameters
+    ----------
+    data : dict
+        Data object returned by doExperiment() (or loaded from a saved file)
+    path : str, optional
+        Path of the file the data is saved in
+
+    Returns
+    -------
+    dict
+        Object with keys 'path', 'experiment', 'parameters', 'instruments' (object with 'var' names as keys and
+        {'idn': ..., 'serial': ...} as values), 'startTime', 'endTime', 'points' and 'summary'. Data saved without run
+        information (older files, runs which did not complete) gets the experiment from its columns and None for the
+        times.
+    """
+    runInfo = data.get("runInfo", {}) if isinstance(data, dict) else {}
+    isCurieWeiss = "temp" in data.keys() and "cap" in data.keys()
+
+    experiment = runInfo.get("experiment", "")
+    if not experiment:
+        experiment = "Curie Weiss Lab" if isCurieWeiss else ("Hall Effect Lab" if _hallSweeps(data) else "")
+
+    serials = runInfo.get("serials", {})
+    instruments = {}
+    for var, idn in runInfo.get("instruments", {}).items():
+        serial = serials.get(var) or (InstrumentRecord.fromIDN(idn, "").serial if idn else "")
+        instruments[var] = {"idn": idn, "serial": serial or ""}
+
+    if isCurieWeiss:
+        points = len(data["time"])
+        summary = {"tempRange": _range(data["temp"]), "capRange": _range(data["cap"])}
+        fit = data.get("curieWeissFit")
+        if isinstance(fit, dict):
+            summary["weissTemp"] = fit.get("weissTemp")
+            summary["curieConst"] = fit.get("curieConst")
+    else:
+        sweepSets = [_hallSweeps(data)]
+        sweepSets += [_hallSweeps(value) for key, value in data.items()
+                      if key.startswith("hallBar") and isinstance(value, dict)]
+        sweeps = [sweep for sweepSet in sweepSets for sweep in sweepSet.values()]
+        points = sum(len(sweep["supplyCurr"]) for sweep in sweeps)
+        summary = {
+            "hallBars": len(sweepSets),
+            "sweeps": len(sweepSets[0]),
+            "emVolts": sorted(float(key) for key in sweepSets[0].keys()),
+            "maxEMCurr": max((float(sweep["emCurr"]) for sweep in sweeps if "emCurr" in sweep), default=None),
+            "supplyCurrRange": _range(np.concatenate([np.asarray(sweep["supplyCurr"], dtype=float) for sweep in sweeps]))
+            if sweeps else None,
+            "hallBarVoltRange": _range(np.concatenate([np.asarray(sweep["hallBarVolt"], dtype=float)
+                                                       for sweep in sweeps])) if sweeps else None,
+        }
+
+    return {
+        "path": os.path.abspath(path) if path is not None else None,
+        "experiment": experiment,
+        "parameters": runInfo.get("parameters", {}),
+        "instruments": instruments,
+        "startTime": runInfo.get("startTime"),
+        "endTime": runInfo.get("endTime"),
+        "points": int(points),
+        "summary": summary,
+    }
+
+
+def _describeFile(path):
+    # Runs in the backfill worker processes, so only the small record is sent back
+    try:
+        if path.endswith(".hpz"):
+            with ArchiveReader(path) as archive:
+                data = archive.load()
+        else:
+            data = getDataFromFile(path)
+        if not isinstance(data, dict):
+            return path, None, "not a HallPy_Teach data set"
+        return path, describeRun(data, path), None
+    except Exception as err:
+        return path, None, repr(err)
+
+
+def _jsonDefault(obj):
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    return str(obj)
+
+
+class RunCatalogue:
+    """SQLite catalogue of saved runs
+
+    Parameters
+    ----------
+    dbPath : str, optional
+        Path of the SQLite database. Defaults to getDefaultCataloguePath() (or '~/.HallPy_Teach/runCatalogue.sqlite'
+        if the catalogue is turned off).
+
+    Example
+    -------
+    >>> catalogue = RunCatalogue()
+    >>> catalogue.backfill(["C:/Users/lab/Documents"])     # index the files saved before
+    >>> runs = catalogue.find(experiment="Hall Effect Lab", since=time.time() - 7 * 24 * 3600, serial="8014885")
+    >>> runs[0]["path"], runs[0]["points"]
+    """
+
+    def __init__(self, dbPath=None):
+        if dbPath is None:
+            dbPath = getDefaultCataloguePath() or os.path.join(os.path.expanduser("~"), ".HallPy_Teach",
+                                                               "runCatalogue.sqlite")
+        self.dbPath = dbPath
+        directory = os.path.dirname(os.path.abspath(dbPath))
+        if not os.path.isdir(directory):
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        self._connections = []
+        self._connectionsLock = threading.Lock()
+        self._writeLock = threading.Lock()
+        self._connection().executescript(_schema)
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.dbPath, timeout=30, check_same_thread=False)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA foreign_keys=ON")
+            self._local.connection = connection
+            with self._connectionsLock:
+                self._connections.append(connection)
+        return connection
+
+    def releaseConnection(self):
+        """Close the connection of the calling thread (eg.: before a worker thread ends)"""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            return
+        self._local.connection = None
+        with self._connectionsLock:
+            self._connections = [other for other in self._connections if other is not connection]
+        connection.close()
+
+    def close(self):
+        """Close the connections of all threads"""
+        with self._connectionsLock:
+            connections = list(self._connections)
+            self._connections = []
+        for connection in connections:
+            connection.close()
+        self._local = threading.local()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+    def _writeRecords(self, records):
+        connection = self._connection()
+        with self._writeLock, connection:
+            for record in records:
+                path = record["path"]
+                try:
+                    fileStat = os.stat(path)
+                    fileSize, fileMtime = fileStat.st_size, fileStat.st_mtime
+                except OSError:
+                    fileSize, fileMtime = None, None
+                connection.execute("DELETE FROM runs WHERE path = ?", (path,))
+                cursor = connection.execute(
+                    "INSERT INTO runs (path, fileSize, fileMtime, experiment, parameters, startTime, endTime, points,"
+                    " summary, indexedAt) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (path, fileSize, fileMtime, record["experiment"],
+                     json.dumps(record["parameters"], default=_jsonDefault), record["startTime"], record["endTime"],
+                     record["points"], json.dumps(record["summary"], default=_jsonDefault), time.time()))
+                connection.executemany(
+                    "INSERT INTO runInstruments (runId, var, idn, serial) VALUES (?, ?, ?, ?)",
+                    [(cursor.lastrowid, var, inst["idn"], inst["serial"]) for var, inst in record["instruments"].items()])
+
+    def add(self, data, path):
+        """Add (or update) the catalogue entry of a saved data set
+
+        Parameters
+        ----------
+        data : dict
+            Data object saved in the file
+        path : str
+            Path of the saved file
+        """
+        self._writeRecords([describeRun(data, path)])
+
+    def remove(self, path):
+        """Remove the entry of a file from the catalogue"""
+        connection = self._connection()
+        with self._writeLock, connection:
+            connection.execute("DELETE FROM runs WHERE path = ?", (os.path.abspath(path),))
+
+    def prune(self):
+        """Remove the entries of files which no longer exist
+
+        Returns
+        -------
+        int
+            Number of entries removed
+        """
+        missing = [row["path"] for row in self._connection().execute("SELECT path FROM runs")
+                   if not os.path.exists(row["path"])]
+        connection = self._connection()
+        with self._writeLock, connection:
+            connection.executemany("DELETE FROM runs WHERE path = ?", [(path,) for path in missing])
+        return len(missing)
+
+    def backfill(self, directories=None, recursive=True, workers=None, useProcesses=True, extensions=(".p", ".hpz")):
+        """Index saved files which are not in the catalogue yet (or changed since they were indexed)
+
+        Parameters
+        ----------
+        directories : list of str, optional
+            Directories to look for saved files in. Defaults to the working directory.
+        recursive : bool, default=True
+            Also look in the subdirectories
+        workers : int, optional
+            Number of files read in parallel. Defaults to the number of CPUs.
+        useProcesses : bool, default=True
+            Read the files in worker processes (unpickling is CPU bound). False uses threads.
+        extensions : tuple of str, default=('.p', '.hpz')
+            Extensions of the files to index
+
+        Returns
+        -------
+        dict[str, Union[int, dict]]
+            Object with keys 'indexed', 'unchanged' and 'failed' (object with the paths of the files which could not be
+            read as keys and the reasons as values)
+        """
+        if directories is None:
+            directories = [os.getcwd()]
+        paths = []
+        for directory in directories:
+            if recursive:
+                for root, dirNames, fileNames in os.walk(directory):
+                    paths += [os.path.join(root, fileName) for fileName in fileNames if fileName.endswith(extensions)]
+            elif os.path.isdir(directory):
+                paths += [os.path.join(directory, fileName) for fileName in os.listdir(directory)
+                          if fileName.endswith(extensions)]
+        paths = sorted(set(os.path.abspath(path) for path in paths))
+
+        known = {row["path"]: (row["fileSize"], row["fileMtime"])
+                 for row in self._connection().execute("SELECT path, fileSize, fileMtime FROM runs")}
+        toIndex = []
+        for path in paths:
+            try:
+                fileStat = os.stat(path)
+            except OSError:
+                continue
+            if known.get(path) != (fileStat.st_size, fileStat.st_mtime):
+                toIndex.append(path)
+
+        records = []
+        failed = {}
+        if len(toIndex) > 0:
+            workers = workers or os.cpu_count() or 1
+            if workers == 1:
+                results = map(_describeFile, toIndex)
+                self._collect(results, records, failed)
+            else:
+                executorType = concurrent.futures.ProcessPoolExecutor if useProcesses \
+                    else concurrent.futures.ThreadPoolExecutor
+                with executorType(max_workers=min(workers, len(toIndex))) as executor:
+                    self._collect(executor.map(_describeFile, toIndex, chunksize=16 if useProcesses else 1), records,
+                                  failed)
+        return {"indexed": len(records), "unchanged": len(paths) - len(toIndex), "failed": failed}
+
+    def _collect(self, results, records, failed):
+        batch = []
+        for path, record, error in results:
+            if record is None:
+                failed[path] = error
+                continue
+            batch.append(record)
+            records.append(record)
+            if len(batch) >= 256:
+                self._writeRecords(batch)
+                batch = []
+        if len(batch) > 0:
+            self._writeRecords(batch)
+
+    def find(self, experiment=None, since=None, until=None, serial=None, minPoints=None, pathContains=None,
+             parameters=None, limit=None):
+        """Find runs in the catalogue
+
+        Parameters
+        ----------
+        experiment : str, optional
+            Experiment name (eg.: 'Hall Effect Lab')
+        since, until : float, optional
+            Only runs started in this time range (time.time() timestamps)
+        serial : str, optional
+            Only runs using the instrument with this serial number
+        minPoints : int, optional
+            Only runs with at least this many data points
+        pathContains : str, optional
+            Only files whose path contains this text
+        parameters : dict, optional
+            Only runs with these parameter values (eg.: {'measurementInterval': 1})
+        limit : int, optional
+            Largest number of runs returned
+
+        Returns
+        -------
+        list of dict
+            Catalogue entries, newest first. Every entry has the keys of describeRun() and 'id', 'fileSize',
+            'fileMtime' and 'indexedAt'.
+        """
+        conditions = []
+        values = []
+        if experiment is not None:
+            conditions.append("experiment = ?")
+            values.append(experiment)
+        if since is not None:
+            conditions.append("startTime >= ?")
+            values.append(since)
+        if until is not None:
+            conditions.append("startTime <= ?")
+            values.append(until)
+        if serial is not None:
+            conditions.append("id IN (SELECT runId FROM runInstruments WHERE serial = ?)")
+            values.append(serial)
+        if minPoints is not None:
+            conditions.append("points >= ?")
+            values.append(minPoints)
+        if pathContains is not None:
+            conditions.append("instr(path, ?) > 0")
+            values.append(pathContains)
+        for key, value in (parameters or {}).items():
+            if not _parameterKeyPattern.match(key):
+                raise ValueError("Invalid parameter name '" + str(key) + "'")
+            conditions.append("json_extract(parameters, '$." + key + "') = ?")
+            values.append(json.dumps(value, default=_jsonDefault) if isinstance(value, (list, dict)) else value)
+
+        query = "SELECT * FROM runs"
+        if len(conditions) > 0:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY COALESCE(startTime, fileMtime) DESC"
+        if limit is not None:
+            query += " LIMIT ?"
+            values.append(int(limit))
+
+        connection = self._connection()
+        rows = connection.execute(query, values).fetchall()
+        runs = []
+        for row in rows:
+            run = dict(row)
+            run["parameters"] = json.loads(run["parameters"]) if run["parameters"] else {}
+            run["summary"] = json.loads(run["summary"]) if run["summary"] else {}
+            run["instruments"] = {instRow["var"]: {"idn": instRow["idn"], "serial": instRow["serial"]}
+                                  for instRow in connection.execute(
+                                      "SELECT var, idn, serial FROM runInstruments WHERE runId = ?", (run["id"],))}
+            runs.append(run)
+        return runs
+
+    def findMany(self, queries, workers=4):
+        """Run several find() queries in parallel
+
+        Parameters
+        ----------
+        queries : list of dict
+            Keyword arguments of every find() query
+        workers : int, default=4
+            Number of queries run at the same time
+
+        Returns
+        -------
+        list of list of dict
+            Results of the queries, in the same order
+        """
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(workers, len(queries)))) as executor:
+            return list(executor.map(lambda query: self.find(**query), queries))
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM runs").fetchone()[0]
+
+
+_defaultCatalogue = None
+_defaultCatalogueLock = threading.Lock()
+
+
+def catalogueRun(data, path, catalogue=None):
+    """Add a saved run to the catalogue, used by the experiments after saving their data file
+
+    Errors are printed instead of raised, so a catalogue problem never loses the data of a run.
+
+    Parameters
+    ----------
+    data : dict
+        Data object saved in the file
+    path : str
+        Path of the saved file
+    catalogue : RunCatalogue, optional
+        Catalogue to add the run to. Defaults to the catalogue at getDefaultCataloguePath() (nothing is added if it is
+        turned off).
+    """
+    global _defaultCatalogue
+    try:
+        if catalogue is None:
+            dbPath = getDefaultCataloguePath()
+            if dbPath is None:
+                return
+            with _defaultCatalogueLock:
+                if _defaultCatalogue is None or _defaultCatalogue.dbPath != dbPath:
+                    if _defaultCatalogue is not None:
+                        _defaultCatalogue.close()
+                    _defaultCatalogue = RunCatalogue(dbPath)
+                catalogue = _defaultCatalogue
+            # Runs are added from the thread they ran on (a new one for every background run), so the connection of
+            # the thread is not kept open after the run has been added
+            try:
+                catalogue.add(data, path)
+            finally:
+                catalogue.releaseConnection()
+            return
+        catalogue.add(data, path)
+    except Exception as err:
+        print("\x1b[;43m The run could not be added to the run catalogue \x1b[m")
+        print("Reason:", repr(err))
@@ -0,0 +1,228 @@
+"""
+HallPy_Teach.safety: safety watchdog running independently of the data collection loop
+=====================================================================================
+
+Description
+-----------
+The SafetyWatchdog samples safety relevant quantities (eg.: electromagnet current, sample temperature) on its own
+thread at its own rate. Every sample is published to a ReadingCache, so the data collection loop can read the latest
+value instead of querying the instrument again, and if a limit is exceeded the watchdog calls the shutdown function
+straight away instead of waiting for the next data point.
+
+Instruments shared between the watchdog and the data collection loop must be wrapped in a LockedSession so that
+commands from the two threads are never interleaved on the bus.
+
+See Also
+--------
++ ReadingCache
++ SafetyWatchdog
++ LockedSession
+
+"""
+import threading
+import time
+
+from pyvisa import VisaIOError
+
+
+class LockedSession:
+    """Thread safe wrapper around a PyVisa instrument object
+
+    write(), read() and query() hold a lock for the whole bus transaction. Every other attribute is passed through to
+    the wrapped instrument object.
+
+    Parameters
+    ----------
+    session : object
+        PyVisa instrument object
+    """
+
+    def __init__(self, session):
+        self.session = session
+        self.lock = threading.RLock()
+
+    def write(self, *args, **kwargs):
+        with self.lock:
+            return self.session.write(*args, **kwargs)
+
+    def read(self, *args, **kwargs):
+        with self.lock:
+            return self.session.read(*args, **kwargs)
+
+    def query(self, *args, **kwargs):
+        with self.lock:
+            return self.session.query(*args, **kwargs)
+
+    @property
+    def wrappedSession(self):
+        return self.session
+
+    def __getattr__(self, name):
+        return getattr(self.session, name)
+
+
+class ReadingCache:
+    """Lock protected store of the latest value of every published reading
+
+    Example
+    -------
+    >>> cache = ReadingCache()
+    >>> cache.publish("emCurr", 0.21)
+    >>> cache.get("emCurr")
+    0.21
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._values = {}
+
+    def publish(self, name, value):
+        """Store the latest value of a reading with the current time.perf_counter() timestamp"""
+        with self._condition:
+            self._values[name] = (value, time.perf_counter())
+            self._condition.notify_all()
+
+    def get(self, name, default=None):
+        """Latest value of a reading, or default if it was never published"""
+        with self._condition:
+            if name not in self._values:
+                return default
+            return self._values[name][0]
+
+    def getWithTime(self, name):
+        """Latest value of a reading and its time.perf_counter() timestamp, or (None, None)"""
+        with self._condition:
+            return self._values.get(name, (None, None))
+
+    def waitForNewer(self, name, since, timeout=None):
+        """Wait for a value of a reading published after the given time
+
+        Parameters
+        ----------
+        name : str
+            Name of the reading
+        since : float
+            time.perf_counter() timestamp the value has to be newer than
+        timeout : float, optional
+            Longest time to wait in seconds
+
+        Returns
+        -------
+        any
+            The value, or None if no newer value was published before the timeout
+        """
+        with self._condition:
+            isNewer = self._condition.wait_for(
+                lambda: name in self._values and self._values[name][1] > since,
+                timeout=timeout
+            )
+            if not isNewer:
+                return None
+            return self._values[name][0]
+
+    def snapshot(self):
+        """Copy of all readings: object with key as reading name and value as (value, timestamp)"""
+        with self._condition:
+            return dict(self._values)
+
+
+class SafetyWatchdog:
+    """Thread sampling safety relevant readings and shutting down on a limit breach
+
+    Parameters
+    ----------
+    checks : list of dict
+        One object per watched quantity with keys:
+            - 'name' : name of the reading, used in the cache and in messages
+            - 'read' : function without arguments returning the reading as a float
+            - 'limit' : highest allowed value
+            - 'unit' : unit used in messages (optional)
+    shutdown : function
+        Function without arguments which puts the experiment in a safe state (eg.: zeroes the power supplies). It is
+        called from the watchdog thread as soon as a limit is exceeded.
+    interval : float, default=0.2
+        Time between samples in seconds
+    cache : ReadingCache, optional
+        Cache to publish readings to. A new cache is created if not provided.
+    maxReadFailures : int, default=3
+        Number of consecutive failed reads of one quantity after which the watchdog treats the state as unsafe
+
+    Example
+    -------
+    >>> watchdog = SafetyWatchdog(
+    >>>     checks=[{"name": "emCurr", "read": lambda: float(emPS.query("IOUT1?")), "limit": 0.7, "unit": "A"}],
+    >>>     shutdown=zeroSupplies
+    >>> )
+    >>> watchdog.start()
+    >>> ...
+    >>> watchdog.raiseIfTripped()  # in the data collection loop
+    >>> watchdog.stop()
+    """
+
+    def __init__(self, checks, shutdown, interval=0.2, cache=None, maxReadFailures=3):
+        self.checks = checks
+        self.shutdown = shutdown
+        self.interval = interval
+        self.cache = cache if cache is not None else ReadingCache()
+        self.maxReadFailures = maxReadFailures
+        self.tripReason = None
+        self.tripped = threading.Event()
+        self._stopEvent = threading.Event()
+        self._thread = None
+        self._readFailures = {check["name"]: 0 for check in checks}
+
+    def start(self):
+        """Start sampling on a daemon thread"""
+        self._stopEvent.clear()
+        self._thread = threading.Thread(target=self._run, name="HallPy_Teach safety watchdog", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop sampling and wait for the watchdog thread to finish"""
+        self._stopEvent.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+    def _trip(self, reason):
+        self.tripReason = reason
+        try:
+            self.shutdown()
+        finally:
+            self.tripped.set()
+            self._stopEvent.set()
+
+    def _sampleOnce(self):
+        for check in self.checks:
+            try:
+                value = check["read"]()
+                self._readFailures[check["name"]] = 0
+            except (VisaIOError, ValueError):
+                self._readFailures[check["name"]] += 1
+                if self._readFailures[check["name"]] >= self.maxReadFailures:
+                    self._trip("Could not read " + check["name"] + " " + str(self.maxReadFailures) + " times in a row.")
+                    return
+                continue
+
+            self.cache.publish(check["name"], value)
+            if value > check["limit"]:
+                self._trip(check["name"] + " exceeded the limit of " + str(check["limit"]) + check.get("unit", "")
+                           + ". Value before cut off: " + str(value) + check.get("unit", ""))
+                return
+
+    def _run(self):
+        while not self._stopEvent.is_set():
+            sampleStart = time.perf_counter()
+            self._sampleOnce()
+            self._stopEvent.wait(max(self.interval - (time.perf_counter() - sampleStart), 0))
+
+    def raiseIfTripped(self):
+        """Raise a Warning in the calling thread if the watchdog has shut the experiment down"""
+        if self.tripped.is_set():
+            raise Warning("Safety watchdog shut down the experiment: " + self.tripReason)
+
+    def sleep(self, duration):
+        """Sleep for the given time, waking up early and raising a Warning if the watchdog trips"""
+        self.tripped.wait(duration)
+        self.raiseIfTripped()
@@ -0,0 +1,137 @@
+"""
+HallPy_Teach.scheduler: drift free measurement timing
+=====================================================
+
+Description
+-----------
+The data collection loops used to sleep for `measurementInterval - loopTime` and record the nominal time, so any time
+spent past the end of the interval (plotting, saving) was silently lost from the time axis and drift built up over long
+runs. DeadlineScheduler schedules every data point at an absolute deadline (start + n * interval) on the monotonic
+time.perf_counter() clock, returns both the nominal and the actual time of every point, and counts missed deadlines.
+
+Overrun policies:
+    - 'skip' : after a missed deadline the next point is scheduled at the next deadline which is still in the future,
+               the missed slots are skipped (regular time grid, fewer points)
+    - 'catchUp' : points are taken back to back without sleeping until the schedule has caught up (every slot is
+                  used, points bunch up after an overrun)
+
+See Also
+--------
++ DeadlineScheduler
+
+"""
+import math
+import time
+
+import numpy as np
+
+
+class DeadlineScheduler:
+    """Schedules data points at absolute, drift free deadlines
+
+    Parameters
+    ----------
+    interval : float
+        Time between data points in seconds
+    overrunPolicy : str, default='skip'
+        What to do after a missed deadline, 'skip' or 'catchUp' (see module description)
+    sleep : function, default=time.sleep
+        Function used to sleep (eg.: safety.SafetyWatchdog.sleep to wake up early on a safety shutdown)
+
+    Example
+    -------
+    >>> scheduler = DeadlineScheduler(5, overrunPolicy="skip")
+    >>> scheduler.start()
+    >>> while running:
+    >>>     nominalTime, actualTime = scheduler.tick()
+    >>>     ...                                       # take and record the data point
+    >>>     scheduler.waitForNext()
+    >>> scheduler.report()
+    """
+
+    overrunPolicies = ("skip", "catchUp")
+
+    def __init__(self, interval, overrunPolicy="skip", sleep=time.sleep):
+        if overrunPolicy not in self.overrunPolicies:
+            raise ValueError("Invalid overrun policy '" + str(overrunPolicy) + "'. Use one of: "
+                             + ", ".join(self.overrunPolicies))
+        self.interval = float(interval)
+        self.overrunPolicy = overrunPolicy
+        self.sleep = sleep
+        self.startTime = None
+        self.slot = 0
+        self.missedDeadlines = 0
+        self.skippedSlots = 0
+        self.jitter = []
+
+    def start(self):
+        """Start a new schedule at the current time
+
+        Can be called again (eg.: at the start of every sweep). The statistics of earlier schedules are kept.
+        """
+        self.startTime = time.perf_counter()
+        self.slot = 0
+
+    def tick(self):
+        """Mark the start of a data point
+
+        Returns
+        -------
+        tuple[float, float]
+            Nominal time (slot * interval) and actual time of the data point in seconds since start()
+        """
+        if self.startTime is None:
+            self.start()
+        nominalTime = self.slot * self.interval
+        actualTime = time.perf_counter() - self.startTime
+        self.jitter.append(actualTime - nominalTime)
+        return nominalTime, actualTime
+
+    def waitForNext(self):
+        """Sleep until the deadline of the next data point
+
+        Returns
+        -------
+        bool
+            False if the deadline had already passed
+        """
+        self.slot += 1
+        now = time.perf_counter() - self.startTime
+        deadline = self.slot * self.interval
+        if now < deadline:
+            self.sleep(deadline - now)
+            return True
+
+        self.missedDeadlines += 1
+        if self.overrunPolicy == "skip" and self.interval > 0:
+            nextSlot = int(math.floor(now / self.interval)) + 1
+            self.skippedSlots += nextSlot - self.slot
+            self.slot = nextSlot
+            self.sleep(max(self.slot * self.interval - (time.perf_counter() - self.startTime), 0))
+        return False
+
+    def shift(self, duration):
+        """Move the remaining deadlines later by the given time in seconds (eg.: after the run was paused)"""
+        if self.startTime is not None and duration > 0:
+            self.startTime += duration
+
+    def report(self):
+        """Timing statistics of all data points scheduled so far
+
+        Returns
+        -------
+        dict[str, Union[float, int, str]]
+            Object with keys 'interval', 'overrunPolicy', 'points', 'missedDeadlines', 'skippedSlots', and 'meanJitter',
+            'stdJitter', 'maxJitter' (actual time - nominal time, in seconds)
+        """
+        jitter = np.array(self.jitter)
+        return {
+            "interval": self.interval,
+            "overrunPolicy": self.overrunPolicy,
+            "points": len(jitter),
+            "missedDeadlines": self.missedDeadlines,
+            "skippedSlots": self.skippedSlots,
+            "meanJitter": float(np.mean(jitter)) if len(jitter) > 0 else 0.0,
+            "stdJitter": float(np.std(jitter)) if len(jitter) > 0 else 0.0,
+            "maxJitter": float(np.max(np.abs(jitter))) if len(jitter) > 0 else 0.0,
+        }
@@ -0,0 +1,379 @@
+"""
+HallPy_Teach.simulation: simulated lab instruments
+==================================================
+
+Description
+-----------
+Stand-ins for the PyVisa sessions of the lab instruments, answering the SCPI commands the experiments use with
+readings from a simple model of the experiment, so the experiments can be run without any instruments connected (eg.:
+by the soak test, see soak):
+    - SimulatedPowerSupply: 'VSET<n>:<v>' / 'ISET<n>:<i>' set the output, 'VOUT<n>?' / 'IOUT<n>?' read it back. The
+      output current is limited by the current setting.
+    - SimulatedMultimeter: 'READ?' returns the value of a function of the other simulated instruments plus noise.
+    - SimulatedLCRMeter: 'FETCh?' returns the capacitance of a Curie Weiss dielectric at the simulated temperature.
+Every other command is accepted and ignored. The noise is seeded, so the same run gives the same readings.
+
+getSimulatedExpInsts() returns the instruments of an experiment in the same format as its setup() function.
+SimulatedLANInstrument serves a simulated instrument on a raw SCPI socket and announces it with mDNS like an LXI
+instrument, so the LAN discovery (see discovery) can be tried without a networked instrument (needs zeroconf).
+
+See Also
+--------
++ getSimulatedExpInsts(*args)
++ SimulatedPowerSupply
++ SimulatedMultimeter
++ SimulatedLCRMeter
++ SimulatedLANInstrument
+
+"""
+import random
+import re
+import socket
+import threading
+import time
+
+import numpy as np
+
+_setCommand = re.compile(r"^(VSET|ISET)(\d+):\s*([-+0-9.eE]+)$")
+_outQuery = re.compile(r"^(VOUT|IOUT)(\d+)\?$")
+
+
+class SimulatedInstrument:
+    """Base of the simulated instruments: accepts any command and answers '*IDN?'
+
+    Attributes
+    ----------
+    idn : str
+        Response to '*IDN?'
+    writes : int
+        Number of commands written
+    """
+
+    def __init__(self, idn, noise=0.0, seed=None):
+        self.idn = idn
+        self.noise = noise
+        self.writes = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _noise(self, scale):
+        with self._lock:
+            return self._random.gauss(0, self.noise * scale) if self.noise > 0 else 0.0
+
+    def write(self, command):
+        self.writes += 1
+        self._handleWrite(command.strip())
+
+    def _handleWrite(self, command):
+        pass
+
+    def query(self, command):
+        command = command.strip()
+        if command == "*IDN?":
+            return self.idn
+        return self._handleQuery(command)
+
+    def _handleQuery(self, command):
+        return "0"
+
+    def read(self):
+        return self._handleQuery("READ?")
+
+    def close(self):
+        pass
+
+
+class SimulatedPowerSupply(SimulatedInstrument):
+    """Power supply driving a resistive load
+
+    Parameters
+    ----------
+    resistance : float
+        Resistance of the load in Ohm. The output current is the set voltage divided by the resistance, limited by the
+        current setting.
+    idn : str, optional
+    """
+
+    def __init__(self, resistance, idn="TENMA 72-2540 V2.1 SN:SIM0001"):
+        super().__init__(idn)
+        self.resistance = resistance
+        self.voltSet = {1: 0.0}
+        self.currSet = {1: 0.0}
+
+    def _handleWrite(self, command):
+        match = _setCommand.match(command)
+        if match is None:
+            return
+        channel = int(match.group(2))
+        (self.voltSet if match.group(1) == "VSET" else self.currSet)[channel] = float(match.group(3))
+
+    def voltage(self, channel=1):
+        """Output voltage in V"""
+        return min(self.voltSet.get(channel, 0.0), self.current(channel) * self.resistance)
+
+    def current(self, channel=1):
+        """Output current in A"""
+        return max(min(self.voltSet.get(channel, 0.0) / self.resistance, self.currSet.get(channel, 0.0)), 0.0)
+
+    def _handleQuery(self, command):
+        match = _outQuery.match(command)
+        if match is None:
+            return "0"
+        channel = int(match.group(2))
+        value = self.voltage(channel) if match.group(1) == "VOUT" else self.current(channel)
+        return "%.3f" % value
+
+
+class SimulatedMultimeter(SimulatedInstrument):
+    """Multimeter reading a function of the other simulated instruments
+
+    Parameters
+    ----------
+    measure : function
+        Called without arguments for every 'READ?', returns the value being measured
+    noise : float, default=0.0
+        Standard deviation of the noise relative to the value (plus the same fraction of 1 nano unit)
+    seed : int, optional
+    idn : str, optional
+    """
+
+    def __init__(self, measure, noise=0.0, seed=None, idn="KEITHLEY INSTRUMENTS INC.,MODEL 2110,SIM0002,1.0"):
+        super().__init__(idn, noise, seed)
+        self.measure = measure
+
+    def _handleQuery(self, command):
+        value = self.measure()
+        return "%+.8E" % (value + self._noise(abs(value) + 1e-9))
+
+
+class SimulatedLCRMeter(SimulatedInstrument):
+    """LCR meter measuring a dielectric whose capacitance follows the Curie Weiss law
+
+    Parameters
+    ----------
+    temperature : function
+        Called without arguments for every 'FETCh?', returns the temperature of the dielectric in ºC
+    curieConst : float, default=1.2e-6
+        Curie constant in F K
+    weissTemp : float, default=20.0
+        Weiss temperature in ºC
+    noise : float, default=0.0
+        Standard deviation of the noise relative to the capacitance
+    seed : int, optional
+    idn : str, optional
+    """
+
+    def __init__(self, temperature, curieConst=1.2e-6, weissTemp=20.0, noise=0.0, seed=None,
+                 idn="GW INSTEK,LCR-6002,SIM0003,1.0"):
+        super().__init__(idn, noise, seed)
+        self.temperature = temperature
+        self.curieConst = curieConst
+        self.weissTemp = weissTemp
+
+    def _handleQuery(self, command):
+        cap = self.curieConst / max(self.temperature() - self.weissTemp, 0.5)
+        cap += self._noise(cap)
+        return "%.6f nF,%.5f" % (cap * 1e9, 0.001 + abs(self._noise(0.0001)))
+
+
+class SimulatedLANInstrument:
+    """Simulated instrument on the local network, announced with mDNS like an LXI instrument
+
+    Serves the instrument on a raw SCPI socket (one command per line, queries end with '?' and are answered with one
+    line) and registers it as an mDNS service, so discovery.discoverLANResources() finds it.
+
+    Parameters
+    ----------
+    instrument : SimulatedInstrument
+        Instrument answering the commands sent to the socket
+    name : str, default='HallPy_Teach Simulated Instrument'
+        Name of the mDNS service (the port is appended so several instruments can be announced at the same time)
+    serviceType : str, default='_scpi-raw._tcp.local.'
+        mDNS service type, one of discovery.lxiServiceTypes. Only the raw SCPI socket is served, the other types only
+        make the instrument show up in the discovery.
+    address : str, default='127.0.0.1'
+        IPv4 address of the interface the socket and the mDNS service are bound to
+
+    Attributes
+    ----------
+    zeroconf : zeroconf.Zeroconf
+        Instance announcing the service (bound to address), set by start()
+    port : int
+        Port of the SCPI socket, set by start()
+    resourceName : str
+        VISA resource name the discovery gives for the instrument, set by start()
+
+    Example
+    -------
+    >>> from HallPy_Teach import discovery
+    >>> with SimulatedLANInstrument(SimulatedPowerSupply(resistance=40.0)) as lanInst:
+    ...     found = discovery.discoverLANResources(useCache=False, zeroconfInstance=lanInst.zeroconf)
+    ...     print(found == [lanInst.resourceName])
+    True
+    """
+
+    def __init__(self, instrument, name="HallPy_Teach Simulated Instrument", serviceType="_scpi-raw._tcp.local.",
+                 address="127.0.0.1"):
+        self.instrument = instrument
+        self.name = name
+        self.serviceType = serviceType
+        self.address = address
+        self.zeroconf = None
+        self.port = None
+        self.resourceName = None
+        self._serviceInfo = None
+        self._server = None
+        self._connections = []
+        self._stopEvent = threading.Event()
+
+    def start(self):
+        """Open the SCPI socket and announce the instrument
+
+        Returns
+        -------
+        SimulatedLANInstrument
+            This instrument
+        """
+        try:
+            from zeroconf import IPVersion, ServiceInfo, Zeroconf
+        except ImportError:
+            print("\x1b[;43m The zeroconf package is needed to announce simulated LAN instruments \x1b[m")
+            raise
+
+        self._stopEvent.clear()
+        self._server = socket.create_server((self.address, 0))
+        self._server.settimeout(0.2)
+        self.port = self._server.getsockname()[1]
+        threading.Thread(target=self._serve, name="HallPy_Teach simulated LAN instrument", daemon=True).start()
+
+        self.zeroconf = Zeroconf(interfaces=[self.address], ip_version=IPVersion.V4Only)
+        self._serviceInfo = ServiceInfo(
+            self.serviceType,
+            self.name + " " + str(self.port) + "." + self.serviceType,
+            addresses=[socket.inet_aton(self.address)],
+            port=self.port,
+            server="hallpy-sim-" + str(self.port) + ".local.",
+        )
+        self.zeroconf.register_service(self._serviceInfo)
+        if self.serviceType.startswith("_scpi-raw."):
+            self.resourceName = "TCPIP::" + self.address + "::" + str(self.port) + "::SOCKET"
+        else:
+            self.resourceName = "TCPIP::" + self.address + "::INSTR"
+        return self
+
+    def stop(self):
+        """Withdraw the announcement and close the socket"""
+        self._stopEvent.set()
+        if self.zeroconf is not None:
+            self.zeroconf.unregister_service(self._serviceInfo)
+            self.zeroconf.close()
+            self.zeroconf = None
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+        for connection in self._connections:
+            connection.close()
+        self._connections = []
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, excType, excValue, traceback):
+        self.stop()
+
+    def _serve(self):
+        server = self._server
+        while not self._stopEvent.is_set():
+            try:
+                connection, _ = server.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            self._connections.append(connection)
+            threading.Thread(target=self._handle, args=(connection,), daemon=True).start()
+
+    def _handle(self, connection):
+        buffer = b""
+        try:
+            while not self._stopEvent.is_set():
+                received = connection.recv(4096)
+                if not received:
+                    return
+                buffer += received
+                while b"\n" in buffer:
+                    line, buffer = buffer.split(b"\n", 1)
+                    command = line.decode("ascii", "replace").strip()
+                    if command.endswith("?"):
+                        connection.sendall((self.instrument.query(command) + "\n").encode("ascii"))
+                    elif command:
+                        self.instrument.write(command)
+        except OSError:
+            pass
+        finally:
+            connection.close()
+
+
+def _heatingCycle(startTime, minTemp, maxTemp, period):
+    def temperature():
+        phase = (time.perf_counter() - startTime) / period
+        return minTemp + (maxTemp - minTemp) * (0.5 - 0.5 * np.cos(2 * np.pi * phase))
+    return temperature
+
+
+def getSimulatedExpInsts(experiment, noise=1e-3, seed=0, heatingPeriod=600.0):
+    """Simulated instruments of an experiment
+
+    Parameters
+    ----------
+    experiment : module or str
+        Experiment module (hallEffect or curieWeiss) or its name
+    noise : float, default=1e-3
+        Relative noise of the readings
+    seed : int, default=0
+        Seed of the noise
+    heatingPeriod : float, default=600.0
+        Curie Weiss experiment only: the sample is heated from 25 to 55 ºC and cooled down again every heatingPeriod
+        seconds, so it never goes over the maximum operating temperature however long the run is
+
+    Returns
+    -------
+    dict
+        Object with the same keys and format as the one returned by the experiment's setup() function
+
+    Example
+    -------
+    >>> expInsts = getSimulatedExpInsts("hallEffect")
+    >>> data = hallEffect.doExperiment(expInsts, emVolts=[5, 10], supVoltSweep=(0, 5), dataPointsPerSupSweep=20)
+    """
+    name = experiment if isinstance(experiment, str) else experiment.__name__.split(".")[-1]
+    if name == "hallEffect":
+        emPS = SimulatedPowerSupply(resistance=40.0)
+        hcPS = SimulatedPowerSupply(resistance=100000.0)
+        insts = {
+            "emPS": emPS,
+            "hcPS": hcPS,
+            "hvMM": SimulatedMultimeter(lambda: 50.0 * hcPS.current() * emPS.current() + 2e-6, noise, seed),
+            "hcMM": SimulatedMultimeter(hcPS.current, noise, None if seed is None else seed + 1),
+        }
+        types = {"emPS": "Power Supply", "hcPS": "Power Supply", "hvMM": "Multimeter", "hcMM": "Multimeter"}
+    elif name == "curieWeiss":
+        temperature = _heatingCycle(time.perf_counter(), 25.0, 55.0, heatingPeriod)
+        insts = {
+            "lcr": SimulatedLCRMeter(temperature, noise=noise, seed=seed),
+            "mm": SimulatedMultimeter(temperature, noise, None if seed is None else seed + 1),
+        }
+        types = {"lcr": "LCR Meter", "mm": "Multimeter"}
+    else:
+        print("\x1b[;43m Only the hallEffect and curieWeiss experiments can be simulated \x1b[m")
+        raise ValueError("No simulated instruments for experiment '" + str(name) + "'")
+
+    return {
+        var: {
+            "res": session,
+            "type": types[var],
+            "purpose": "Simulated " + var,
+            "serial": session.idn.split(",")[2] if "," in session.idn else session.idn.split("SN:")[-1],
+            "idn": session.idn,
+        } for var, session in insts.items()
+    }
@@ -0,0 +1,337 @@
+"""
+HallPy_Teach.soak: long-run soak test
+=====================================
+
+Description
+-----------
+soakTest() runs an experiment back to back against simulated instruments (see simulation) for many thousands of data
+points, with the live display and the saving of the data after every point turned on, as in a long lab session. While
+it runs, the resources used by the process are sampled regularly:
+    - 'pyHeap': memory allocated by Python objects (tracemalloc)
+    - 'rss': memory used by the process (psutil if installed, /proc otherwise, None if neither is available)
+    - 'openFiles': open file descriptors / handles
+    - 'figures': matplotlib figures open in pyplot
+    - 'widgets': live ipywidgets objects
+    - 'threads': running threads
+After a warm-up, every metric must stay bounded: the growth per 1000 data points (slope of a linear fit) must be below
+the limits in defaultGrowthLimits, otherwise the test fails. The samples are returned, so the growth can be plotted.
+
+The experiments run with their own doExperiment() ('doExperiment' engine), which paces the points at the real minimum
+measurement intervals (0.5 s for the Hall Effect experiment, 1 s for the Curie Weiss experiment), or with their sweep
+descriptions ('sweepPlan' engine, see sweepPlan), which can run as fast as the simulated instruments answer (no
+points are skipped when the live display takes longer than the measurement interval).
+
+From the command line:
+    hallpy-soak --experiment curieWeiss --points 5000 --engine sweepPlan --interval 0.05
+
+See Also
+--------
++ soakTest(*args)
++ sampleResources()
++ defaultGrowthLimits
++ SoakTestFailed
+
+"""
+import argparse
+import contextlib
+import gc
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+from matplotlib import pyplot as plt
+
+from .experiments import curieWeiss, hallEffect
+from .simulation import getSimulatedExpInsts
+from .sweepPlan import checkBuiltInDescriptions, compileSweep
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+soakMetrics = ["pyHeap", "rss", "openFiles", "figures", "widgets", "threads"]
+"""Resources sampled during the soak test (see module description)
+"""
+
+defaultGrowthLimits = {
+    "pyHeap": 1024 * 1024,
+    "rss": 16 * 1024 * 1024,
+    "openFiles": 2,
+    "figures": 1,
+    "widgets": 16,
+    "threads": 1,
+}
+"""Largest growth per 1000 data points allowed after the warm-up, in bytes for 'pyHeap' and 'rss'
+"""
+
+soakEngines = ["doExperiment", "sweepPlan"]
+
+
+class SoakTestFailed(Exception):
+    """Raised by soakTest() when a resource keeps growing"""
+    pass
+
+
+def _readRSS():
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _countOpenFiles():
+    if psutil is not None:
+        process = psutil.Process()
+        return process.num_handles() if hasattr(process, "num_handles") else process.num_fds()
+    try:
+        return len(os.listdir("/proc/self/fd"))
+    except OSError:
+        return None
+
+
+def _countWidgets():
+    try:
+        from ipywidgets import Widget
+    except ImportError:
+        return None
+    registry = getattr(Widget, "_active_widgets", None)
+    if registry is None:
+        registry = getattr(Widget, "widgets", None)
+    return len(registry) if registry is not None else None
+
+
+def sampleResources():
+    """Resources used by the process right now (see module description)
+
+    Returns
+    -------
+    dict[str, Union[int, None]]
+        Object with the keys in soakMetrics. 'pyHeap' is None if tracemalloc is not tracing, and the other values are
+        None if they cannot be measured on this system.
+    """
+    gc.collect()
+    return {
+        "pyHeap": tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None,
+        "rss": _readRSS(),
+        "openFiles": _countOpenFiles(),
+        "figures": len(plt.get_fignums()),
+        "widgets": _countWidgets(),
+        "threads": threading.active_count(),
+    }
+
+
+def _planRun(experiment, engine, pointsLeft, measurementInterval, liveDisplay):
+    if experiment == "hallEffect":
+        emVolts = [5.0, 10.0, 15.0, 20.0, 25.0]
+        pointsPerSweep = int(np.clip(np.ceil(pointsLeft / len(emVolts)), 20, 100))
+        if engine == "sweepPlan":
+            plan = compileSweep(hallEffect.sweepDescription(emVolts=emVolts, supVoltSweep=(0, 5),
+                                                            dataPointsPerSupSweep=pointsPerSweep,
+                                                            measurementInterval=measurementInterval,
+                                                            plot=liveDisplay))
+            return plan, {"overrunPolicy": "catchUp"}
+        return hallEffect, {"emVolts": emVolts, "supVoltSweep": (0, 5), "dataPointsPerSupSweep": pointsPerSweep,
+                            "measurementInterval": measurementInterval, "plot": liveDisplay}
+
+    if engine == "sweepPlan":
+        exptLength = pointsLeft * measurementInterval / 60
+        plan = compileSweep(curieWeiss.sweepDescription(exptLength=exptLength, measurementInterval=measurementInterval,
+                                                        safetyInterval=min(1.0, measurementInterval)))
+        return plan, {"overrunPolicy": "catchUp"}
+    exptLength = int(np.clip(np.ceil(pointsLeft * measurementInterval / 60), 1, 100))
+    return curieWeiss, {"exptLength": exptLength, "measurementInterval": measurementInterval}
+
+
+def _countPoints(data):
+    if data is None:
+        return 0
+    if "time" in data:
+        return len(data["time"])
+    return sum(len(sweep["time"]) for sweep in data.values() if isinstance(sweep, dict) and "time" in sweep)
+
+
+def _fitGrowth(samples, metric, warmup):
+    points = np.array([sample["points"] for sample in samples if sample[metric] is not None], dtype=float)
+    values = np.array([sample[metric] for sample in samples if sample[metric] is not None], dtype=float)
+    keep = points >= warmup
+    if np.count_nonzero(keep) < 3 or np.ptp(points[keep]) == 0:
+        return None
+    return float(np.polyfit(points[keep], values[keep], 1)[0] * 1000)
+
+
+def soakTest(experiment="curieWeiss", points=5000, engine="doExperiment", measurementInterval=None,
+             sampleInterval=5.0, warmup=0.2, growthLimits=None, liveDisplay=True, quiet=True, raiseOnFailure=True):
+    """Run an experiment against simulated instruments for many data points and check that no resource keeps growing
+
+    Parameters
+    ----------
+    experiment : str or module, default='curieWeiss'
+        'hallEffect' or 'curieWeiss' (or the module)
+    points : int, default=5000
+        Data points to take. The experiment is run back to back until they are taken.
+    engine : str, default='doExperiment'
+        'doExperiment' or 'sweepPlan' (see module description)
+    measurementInterval : float, optional
+        Time between data points in seconds. Defaults to the experiment's minimum with 'doExperiment' and 0.05 with
+        'sweepPlan'.
+    sampleInterval : float, default=5.0
+        Time between resource samples in seconds
+    warmup : float, default=0.2
+        Fraction of the points taken before the growth is measured (caches, imports and the first figures are created
+        during the warm-up)
+    growthLimits : dict[str, float], optional
+        Limits replacing those in defaultGrowthLimits
+    liveDisplay : bool, default=True
+        Update the live display (readings and graphs) after every point, as in the notebook
+    quiet : bool, default=True
+        Hide the output of the experiments (the live display is still drawn)
+    raiseOnFailure : bool, default=True
+        Raise SoakTestFailed if a resource keeps growing
+
+    Returns
+    -------
+    dict
+        Object with keys 'experiment', 'engine', 'points', 'runs', 'elapsed', 'samples' (list of objects with keys
+        'elapsed', 'points' and the soakMetrics), 'growth' (growth per 1000 points after the warm-up, None if it
+        could not be measured), 'limits', 'failures' (list of str) and 'passed'
+
+    Example
+    -------
+    >>> report = soakTest("hallEffect", points=10000)
+    >>> report["growth"]
+    """
+    experimentName = experiment if isinstance(experiment, str) else experiment.__name__.split(".")[-1]
+    if experimentName not in ("hallEffect", "curieWeiss"):
+        print("\x1b[;43m Only the hallEffect and curieWeiss experiments can be soak tested \x1b[m")
+        raise ValueError("Invalid experiment. Argument in question: experiment")
+    if engine not in soakEngines:
+        print("\x1b[;43m Please use a valid engine \x1b[m")
+        print("Valid engines:", ", ".join(soakEngines))
+        raise ValueError("Invalid engine. Argument in question: engine")
+    if measurementInterval is None:
+        measurementInterval = 0.05 if engine == "sweepPlan" else (0.5 if experimentName == "hallEffect" else 1)
+    if engine == "sweepPlan":
+        checkBuiltInDescriptions()
+    limits = dict(defaultGrowthLimits)
+    limits.update(growthLimits or {})
+
+    workDir = tempfile.mkdtemp(prefix="hallpy-soak-")
+    previousCatalogue = os.environ.get("HALLPY_TEACH_CATALOGUE")
+    os.environ["HALLPY_TEACH_CATALOGUE"] = os.path.join(workDir, "runCatalogue.sqlite")
+    startedTracing = not tracemalloc.is_tracing()
+    if startedTracing:
+        tracemalloc.start()
+
+    samples = []
+    pointsTaken = 0
+    runs = 0
+    startTime = time.perf_counter()
+
+    def takeSample(pointsNow):
+        sample = {"elapsed": time.perf_counter() - startTime, "points": int(pointsNow)}
+        sample.update(sampleResources())
+        samples.append(sample)
+
+    try:
+        with open(os.devnull, "w") as devnull, \
+                (contextlib.redirect_stdout(devnull) if quiet else contextlib.nullcontext()):
+            takeSample(0)
+            while pointsTaken < points:
+                target, kwargs = _planRun(experimentName, engine, points - pointsTaken,
+                                                     measurementInterval, liveDisplay)
+                expInsts = getSimulatedExpInsts(experimentName, seed=runs)
+                kwargs.update({"dataFileName": os.path.join(workDir, "soakRun" + str(runs % 2)),
+                               "liveDisplay": liveDisplay})
+                run = target.start(expInsts, **kwargs)
+                while not run.wait(sampleInterval):
+                    takeSample(pointsTaken + _countPoints(run.data))
+                runPoints = _countPoints(run.result())
+                if runPoints == 0:
+                    raise SoakTestFailed("A run of the soak test did not take any data points")
+                pointsTaken += runPoints
+                runs += 1
+            takeSample(pointsTaken)
+    finally:
+        if startedTracing:
+            tracemalloc.stop()
+        if previousCatalogue is None:
+            del os.environ["HALLPY_TEACH_CATALOGUE"]
+        else:
+            os.environ["HALLPY_TEACH_CATALOGUE"] = previousCatalogue
+        shutil.rmtree(workDir, ignore_errors=True)
+
+    growth = {metric: _fitGrowth(samples, metric, warmup * pointsTaken) for metric in soakMetrics}
+    failures = []
+    for metric in soakMetrics:
+        if growth[metric] is not None and growth[metric] > limits[metric]:
+            failures.append(metric + " grows by " + str(np.round(growth[metric], 1)) + " per 1000 points (limit "
+                            + str(limits[metric]) + ")")
+
+    report = {
+        "experiment": experimentName,
+        "engine": engine,
+        "points": pointsTaken,
+        "runs": runs,
+        "elapsed": time.perf_counter() - startTime,
+        "samples": samples,
+        "growth": growth,
+        "limits": limits,
+        "failures": failures,
+        "passed": len(failures) == 0,
+    }
+
+    print("Soak test:", experimentName, "(" + engine + ")", pointsTaken, "points in", runs, "runs,",
+          str(np.round(report["elapsed"] / 60, 1)) + " minutes")
+    for metric in soakMetrics:
+        first = next((sample[metric] for sample in samples if sample["points"] >= warmup * pointsTaken), None)
+        print("   " + metric.ljust(10), "after warm-up:", str(first).rjust(12), "| end:",
+              str(samples[-1][metric]).rjust(12), "| growth / 1000 points:",
+              "n/a" if growth[metric] is None else np.round(growth[metric], 1))
+    if len(failures) > 0:
+        print("\x1b[;41m Soak test failed \x1b[m")
+        for failure in failures:
+            print("   " + failure)
+        if raiseOnFailure:
+            raise SoakTestFailed("; ".join(failures))
+    else:
+        print("Soak test passed, every resource stayed bounded.")
+    return report
+
+
+def main(argv=None):
+    """Command line entry point (see module description)"""
+    parser = argparse.ArgumentParser(prog="hallpy-soak",
+                                     description="Run an experiment against simulated instruments for many data "
+                                                 "points and check for memory, file and figure leaks.")
+    parser.add_argument("--experiment", default="curieWeiss", choices=["hallEffect", "curieWeiss"])
+    parser.add_argument("--points", type=int, default=5000, help="data points to take (default: 5000)")
+    parser.add_argument("--engine", default="doExperiment", choices=soakEngines)
+    parser.add_argument("--interval", type=float, default=None, help="measurement interval in seconds")
+    parser.add_argument("--sample-interval", type=float, default=5.0, help="seconds between resource samples")
+    parser.add_argument("--warmup", type=float, default=0.2, help="fraction of the points used as warm-up")
+    parser.add_argument("--no-live", action="store_true", help="do not draw the live display")
+    args = parser.parse_args(argv)
+
+    measurementInterval = args.interval
+    if measurementInterval is not None and args.engine == "doExperiment" and args.experiment == "curieWeiss":
+        if not measurementInterval.is_integer():
+            parser.error("--interval must be a whole number of seconds for the curieWeiss doExperiment engine "
+                         "(use --engine sweepPlan for shorter intervals)")
+        measurementInterval = int(measurementInterval)
+    report = soakTest(args.experiment, points=args.points, engine=args.engine, measurementInterval=measurementInterval,
+                      sampleInterval=args.sample_interval, warmup=args.warmup, liveDisplay=not args.no_live,
+                      raiseOnFailure=False)
+    return 0 if report["passed"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
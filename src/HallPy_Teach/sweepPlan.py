@@ -0,0 +1,704 @@
+"""
+HallPy_Teach.sweepPlan: declarative experiment descriptions
+===========================================================
+
+Description
+-----------
+Instead of hand coding the loops, waits, safety checks and saves of an experiment, a sweep description lists what is
+swept, what is read and what must not be exceeded. compileSweep() turns the description into an ExecutionPlan:
+    - axes are ordered so the slowest actuators (longest move / settle time) are in the outer loops and move the least
+      (unless the description fixes the order)
+    - readings taken only when an outer axis moves (eg.: the electromagnet current) are hoisted out of the inner loop
+    - readings sharing an instrument and query are taken with a single query
+    - readings on different instruments are taken in parallel (one thread per instrument)
+    - readings with a watched limit are sampled by the safety watchdog (see safety.SafetyWatchdog) and taken from its
+      readings instead of being queried again (readings averaging several samples are still queried, the watchdog
+      checks single readings)
+The plan runs with the same engine as the built-in experiments: flat column store (columnStore.ColumnStore), deadline
+scheduler (scheduler.DeadlineScheduler), resilient sessions, live display, broadcasting, background runs
+(background.RunHandle), file saving and the run catalogue.
+
+hallEffect.sweepDescription() and curieWeiss.sweepDescription() describe the built-in experiments, and running them
+gives data in the same format as their doExperiment() functions.
+
+Sweep description (object):
+    'expName' : display name of the experiment
+    'requiredEquipment' : requiredEquipment object of the experiment (the 'var' names used below are checked against it)
+    'parameters' : object stored in runInfo['parameters'] (optional)
+    'axes' : list of axis objects, from the outermost to the innermost loop:
+        'name' : column name of the setpoint
+        'inst' : 'var' name of the instrument setting it
+        'set' : SCPI command template (eg.: 'VSET1:{value}') or function(value, session)
+        'values' : setpoints
+        'repeat' : number of repeats instead of 'values' / 'set', for axes without an actuator (no column)
+        'duration' : seconds to repeat for instead of 'values' / 'set' (innermost axis only, no column)
+        'settle' : seconds to wait after a move, or a settle rule object {'reading': name, 'tol': ..., 'min': s,
+                   'timeout': s, 'poll': s} waiting (at least 'min' seconds) until two readings in a row differ by less
+                   than 'tol' (optional)
+        'rest' : setpoint to go back to after each pass over the values (optional)
+        'snake' : sweep every other pass backwards (optional)
+        'moveTime' : nominal time in seconds of a move, used to order the axes (defaults to the settle time)
+    'readings' : list of reading objects:
+        'name' (or 'names' for a query returning several values) : column name(s)
+        'inst' : 'var' name of the instrument
+        'query' : SCPI query (default 'READ?')
+        'parse' : function(response) returning the value (or the values for 'names'). Default helper.parseQueryReading
+        'every' : name of the axis after whose moves the reading is taken (default: every data point)
+        'samples' : readings averaged per value (default 1, see oversampling)
+        'uncertainty' : also store the standard error of the values in '<name>Err' columns (default False)
+    'limits' : list of {'reading': name, 'max': ..., 'min': ..., 'unit': ..., 'watch': seconds, 'message': ...}. Limits
+               with 'watch' (and 'max') are also checked by the safety watchdog every 'watch' seconds.
+    'interval' : seconds between data points (default 1)
+    'groupBy' : name of an axis. The data is keyed by its values (eg.: data['5.0'] for every electromagnet voltage) and
+                the readings taken when it moves are stored as single values in every group. Flat data otherwise.
+    'setup', 'shutdown', 'onPause' : lists of ('var', SCPI command or function(session)) run before the run, after the
+                run or any error, and when a background run is paused
+    'onPoint' : function(data, point) called after every data point (point: object with the values of the point)
+    'onFinish' : function(data) called once the run has completed
+    'liveGraphs' : function(data) returning graph objects for showLiveReadings(); 'draw' : function(data) drawing graphs
+    'order' : 'auto' (default) or 'fixed'
+    'parallelReads' : read different instruments in parallel (default True)
+
+See Also
+--------
++ compileSweep(*args)
++ ExecutionPlan
++ runSweep(*args)
++ checkBuiltInDescriptions(*args)
+
+"""
+import concurrent.futures
+import time
+
+import numpy as np
+from IPython.core.display import clear_output
+from pyvisa import VisaIOError
+
+from .background import startExperiment
+from .columnStore import ColumnStore
+from .helper import clearFileAndSaveData, parseQueryReading, showLiveReadings
+from .resilience import RecoveryLog, makeExpInstsResilient
+from .runCatalogue import catalogueRun
+from .safety import LockedSession, SafetyWatchdog
+from .scheduler import DeadlineScheduler
+
+
+def _invalidDescription(message):
+    print("\x1b[;41m Invalid sweep description \x1b[m")
+    print(message)
+    raise ValueError("Invalid sweep description: " + message)
+
+
+def _settleTime(settle):
+    if settle is None:
+        return 0.0
+    if isinstance(settle, dict):
+        return float(settle.get("min", 0.0))
+    return float(settle)
+
+
+def _normaliseAxis(axis):
+    if "name" not in axis:
+        _invalidDescription("Every axis needs a 'name'")
+    kinds = [key for key in ("values", "repeat", "duration") if key in axis]
+    if len(kinds) != 1:
+        _invalidDescription("Axis '" + str(axis["name"]) + "' needs exactly one of 'values', 'repeat' or 'duration'")
+    if "values" in axis and ("set" not in axis or "inst" not in axis):
+        _invalidDescription("Axis '" + str(axis["name"]) + "' needs 'inst' and 'set' to sweep its values")
+    normalised = {
+        "name": axis["name"],
+        "inst": axis.get("inst"),
+        "set": axis.get("set"),
+        "values": list(axis["values"]) if "values" in axis else None,
+        "repeat": int(axis["repeat"]) if "repeat" in axis else None,
+        "duration": float(axis["duration"]) if "duration" in axis else None,
+        "settle": axis.get("settle"),
+        "rest": axis.get("rest"),
+        "snake": bool(axis.get("snake", False)),
+    }
+    normalised["moveTime"] = float(axis.get("moveTime", _settleTime(normalised["settle"])))
+    normalised["hasColumn"] = normalised["values"] is not None
+    if normalised["values"] is not None and len(normalised["values"]) == 0:
+        _invalidDescription("Axis '" + str(axis["name"]) + "' has no values")
+    return normalised
+
+
+def _readSource(source, session):
+    value = source["parse"](session.query(source["query"]))
+    return float(value if source["index"] is None else value[source["index"]])
+
+
+class ExecutionPlan:
+    """Compiled sweep description (see compileSweep())
+
+    Attributes
+    ----------
+    axes : list of dict
+        Axes in loop order, outermost first
+    levels : list of list of dict
+        For every axis, the queries taken after it moves. Every query object has the keys 'inst', 'query', 'samples',
+        'targets' (the reading names it fills) and 'watched' (taken from the safety watchdog readings)
+    columns : list of str
+        Columns of the data store
+    pointCount : int
+        Expected number of data points
+    estimatedDuration : float
+        Expected length of the run in seconds
+    notes : list of str
+        Optimisations made when compiling
+    """
+
+    def __init__(self, description, axes, levels, limits, columns, groupColumns, notes):
+        self.description = description
+        self.expName = description.get("expName", "Sweep")
+        self.axes = axes
+        self.levels = levels
+        self.limits = limits
+        self.columns = columns
+        self.groupColumns = groupColumns
+        self.groupBy = description.get("groupBy")
+        self.interval = float(description.get("interval", 1))
+        self.notes = notes
+        self.watchedLimits = [limit for limit in limits if limit.get("watch") is not None and "max" in limit]
+
+        passes = 1
+        moves = 0
+        self.pointCount = 1
+        for axis in axes:
+            steps = self._axisLength(axis)
+            if axis["values"] is not None:
+                moves += passes * steps
+            passes *= steps
+            self.pointCount = passes
+        settleTime = 0.0
+        passes = 1
+        for axis in axes[:-1]:
+            passes *= self._axisLength(axis)
+            settleTime += passes * axis["moveTime"]
+        self.estimatedDuration = settleTime + self.pointCount * self.interval
+        self.moves = moves
+
+    def _axisLength(self, axis):
+        if axis["values"] is not None:
+            return len(axis["values"])
+        if axis["repeat"] is not None:
+            return axis["repeat"]
+        return max(int(np.ceil(axis["duration"] / self.interval)), 1)
+
+    def explain(self):
+        """Print the loop order, the queries of every loop level and the optimisations made"""
+        print("Execution plan for", self.expName)
+        for level, axis in enumerate(self.axes):
+            indent = "   " * (level + 1)
+            print(indent + "for " + axis["name"] + " (" + str(self._axisLength(axis)) + " steps"
+                  + (", settle " + str(_settleTime(axis["settle"])) + " s" if axis["settle"] is not None else "") + "):")
+            for query in self.levels[level]:
+                print(indent + "   read " + ", ".join(query["targets"]) + " <- " + query["inst"] + " '" + query["query"]
+                      + "'" + (" (x" + str(query["samples"]) + ")" if query["samples"] > 1 else "")
+                      + (" (watchdog)" if query["watched"] else ""))
+        for note in self.notes:
+            print(" - " + note)
+        print("Expected:", self.pointCount, "data points,", self.moves, "actuator moves, about",
+              str(np.round(self.estimatedDuration / 60, 1)) + " minutes")
+
+    def run(self, expInsts, dataFileName=None, retryPolicy=None, overrunPolicy="skip", broadcaster=None,
+            liveDisplay=True, runControl=None):
+        """Run the plan
+
+        Parameters
+        ----------
+        expInsts : object
+            Object returned by the experiment's setup() function (or getAndSetupExpInsts())
+        dataFileName : str, optional
+            Name of the file the data is saved to after every point (a '.p' extension is added). Completed runs are
+            also added to the run catalogue (see runCatalogue).
+        retryPolicy : resilience.RetryPolicy, optional
+            See hallEffect.doExperiment()
+        overrunPolicy : str, default='skip'
+            See scheduler.DeadlineScheduler
+        broadcaster : broadcast.LiveBroadcaster, optional
+            If provided, every data point is sent to its subscribers (stream 1, values in the order of 'columns')
+        liveDisplay : bool, default=True
+            Show the live readings (and graphs) after every data point
+        runControl : background.RunHandle, optional
+            Handle of a background run, checked before every data point (see background.startExperiment())
+
+        Returns
+        -------
+        dict
+            Collected data, keyed by the 'groupBy' axis values or flat, and 'runInfo'
+        """
+        description = self.description
+        usedVars = {axis["inst"] for axis in self.axes if axis["inst"] is not None}
+        usedVars |= {query["inst"] for level in self.levels for query in level}
+        usedVars |= {var for key in ("setup", "shutdown", "onPause") for var, action in description.get(key, [])}
+        missing = sorted(var for var in usedVars if var not in expInsts)
+        if len(missing) > 0:
+            print("\x1b[;43m Some instruments needed by the sweep are missing \x1b[m")
+            print("Missing instruments:", ", ".join(missing))
+            raise Exception("Instruments missing for the sweep: " + ", ".join(missing))
+
+        sessions = {var: expInsts[var]["res"] for var in expInsts.keys()}
+        recoveryLog = RecoveryLog()
+        if retryPolicy is not None:
+            sessions, recoveryLog = makeExpInstsResilient(expInsts, retryPolicy, recoveryLog)
+
+        def runActions(actions):
+            for var, action in actions:
+                if callable(action):
+                    action(sessions[var])
+                else:
+                    sessions[var].write(action)
+
+        def shutdown():
+            runActions(description.get("shutdown", []))
+
+        watchdog = None
+        pause = time.sleep
+        if len(self.watchedLimits) > 0:
+            for var in {limit["source"]["inst"] for limit in self.watchedLimits}:
+                sessions[var] = LockedSession(sessions[var])
+            checks = []
+            for limit in self.watchedLimits:
+                source = limit["source"]
+                checks.append({
+                    "name": limit["reading"],
+                    "read": lambda source=source: _readSource(source, sessions[source["inst"]]),
+                    "limit": limit["max"],
+                    "unit": limit.get("unit", ""),
+                })
+            watchdog = SafetyWatchdog(checks=checks, shutdown=shutdown,
+                                      interval=min(limit["watch"] for limit in self.watchedLimits))
+            pause = watchdog.sleep
+
+        store = ColumnStore(self.columns, capacity=self.pointCount + 2)
+        data = {}
+        groupAxis = self.axes[0] if self.groupBy is not None else None
+        if groupAxis is not None:
+            for value in groupAxis["values"]:
+                data[str(value)] = store.views(0, 0, columns=self.groupColumns)
+        else:
+            data.update(store.views())
+
+        innermost = len(self.axes) - 1
+        pointReads = self.levels[innermost]
+        parallelVars = sorted({query["inst"] for query in pointReads if not query["watched"]})
+        executor = None
+        if description.get("parallelReads", True) and len(parallelVars) > 1:
+            executor = concurrent.futures.ThreadPoolExecutor(max_workers=len(parallelVars),
+                                                             thread_name_prefix="HallPy_Teach reads")
+
+        def takeQuery(query):
+            session = sessions[query["inst"]]
+            responses = [session.query(query["query"]) for _ in range(query["samples"])]
+            values = {}
+            for name, parse, index in zip(query["targets"], query["parse"], query["index"]):
+                readings = np.array([parse(response) if index is None else parse(response)[index]
+                                     for response in responses], dtype=float)
+                values[name] = float(np.mean(readings))
+                values[name + "Err"] = float(np.std(readings, ddof=1) / np.sqrt(len(readings))) \
+                    if len(readings) > 1 else float("nan")
+            return values
+
+        def takeReadings(level, since):
+            values = {}
+            queries = self.levels[level]
+            for query in queries:
+                if query["watched"]:
+                    name = query["targets"][0]
+                    cached = watchdog.cache.waitForNewer(name, since, timeout=5 * watchdog.interval + 1)
+                    watchdog.raiseIfTripped()
+                    if cached is not None:
+                        values[name] = cached
+                        values[name + "Err"] = float("nan")
+                        continue
+                    values.update(takeQuery(query))
+            directQueries = [query for query in queries if not query["watched"]]
+            if executor is not None and level == innermost:
+                byInst = {}
+                for query in directQueries:
+                    byInst.setdefault(query["inst"], []).append(query)
+                futures = [executor.submit(lambda instQueries: [takeQuery(query) for query in instQueries], instQueries)
+                           for instQueries in byInst.values()]
+                for future in futures:
+                    for result in future.result():
+                        values.update(result)
+            else:
+                for query in directQueries:
+                    values.update(takeQuery(query))
+            return values
+
+        def findQuery(name):
+            for level in self.levels:
+                for query in level:
+                    if name in query["targets"]:
+                        return query
+            return None
+
+        settleStats = {"waits": 0, "timeouts": 0, "time": 0.0}
+
+        def settle(rule):
+            if rule is None:
+                return
+            settleStart = time.perf_counter()
+            if not isinstance(rule, dict):
+                pause(float(rule))
+            else:
+                pause(float(rule.get("min", 0.0)))
+                query = findQuery(rule["reading"])
+                timeout = float(rule.get("timeout", 5.0))
+                previous = takeQuery(query)[rule["reading"]]
+                while True:
+                    pause(float(rule.get("poll", 0.2)))
+                    current = takeQuery(query)[rule["reading"]]
+                    if abs(current - previous) <= rule["tol"]:
+                        break
+                    if time.perf_counter() - settleStart > timeout:
+                        settleStats["timeouts"] += 1
+                        break
+                    previous = current
+            settleStats["waits"] += 1
+            settleStats["time"] += time.perf_counter() - settleStart
+
+        def moveAxis(axis, value):
+            if callable(axis["set"]):
+                axis["set"](value, sessions[axis["inst"]])
+            else:
+                sessions[axis["inst"]].write(axis["set"].format(value=value))
+
+        def checkLimits(values):
+            for limit in self.limits:
+                value = values.get(limit["reading"])
+                if value is None:
+                    continue
+                tooHigh = "max" in limit and value > limit["max"]
+                tooLow = "min" in limit and value < limit["min"]
+                if tooHigh or tooLow:
+                    if limit.get("message"):
+                        print("\x1b[;41m " + limit["message"] + " \x1b[m")
+                    raise Warning(limit["reading"] + " was " + ("too high" if tooHigh else "too low") + ": "
+                                  + str(value) + " " + limit.get("unit", ""))
+
+        def axisValues(axis, passNumber):
+            if axis["values"] is not None:
+                values = axis["values"]
+                return values[::-1] if axis["snake"] and passNumber % 2 == 1 else values
+            if axis["repeat"] is not None:
+                return [None] * axis["repeat"]
+
+            def untilDuration():
+                while scheduler.slot * self.interval < axis["duration"]:
+                    yield None
+            return untilDuration()
+
+        scheduler = DeadlineScheduler(self.interval, overrunPolicy=overrunPolicy, sleep=pause)
+        state = {"points": 0, "passes": [0] * len(self.axes), "group": None, "groupStart": 0}
+        current = {}
+        runStartTime = time.time()
+
+        def onPause():
+            runActions(description.get("onPause", []))
+
+        def runLevel(level):
+            axis = self.axes[level]
+            if level == innermost:
+                scheduler.start()
+            for value in axisValues(axis, state["passes"][level]):
+                if level == innermost:
+                    if runControl is not None:
+                        scheduler.shift(runControl.checkpoint(
+                            data, state["points"] / max(self.pointCount, 1), onPause=onPause,
+                            whilePaused=watchdog.raiseIfTripped if watchdog is not None else None))
+                    nominalTime, actualTime = scheduler.tick()
+                moveStart = time.perf_counter()
+                if axis["values"] is not None:
+                    moveAxis(axis, value)
+                    current[axis["name"]] = value
+                settle(axis["settle"])
+                current.update(takeReadings(level, moveStart))
+
+                if level == 0 and groupAxis is not None:
+                    state["group"] = data[str(value)]
+                    state["groupStart"] = len(store)
+                    for query in self.levels[0]:
+                        for name in query["targets"]:
+                            state["group"][name] = current[name]
+
+                if level < innermost:
+                    checkLimits(current)
+                    runLevel(level + 1)
+                    continue
+
+                current["time"] = nominalTime
+                current["actualTime"] = actualTime
+                row = tuple(current.get(column, float("nan")) for column in self.columns)
+                store.appendRow(*row)
+                state["points"] += 1
+                if broadcaster is not None:
+                    broadcaster.publish(1, row)
+                if groupAxis is not None:
+                    state["group"].update(store.views(state["groupStart"], columns=self.groupColumns))
+                else:
+                    data.update(store.views())
+                if description.get("onPoint") is not None:
+                    description["onPoint"](data, dict(current))
+                if dataFileName is not None:
+                    clearFileAndSaveData(data, dataFileName)
+                checkLimits(current)
+                if watchdog is not None:
+                    watchdog.raiseIfTripped()
+
+                if liveDisplay:
+                    liveReadings = {column: np.round(current[column], 6) for column in self.columns
+                                    if column in current and not column.endswith("Err")}
+                    liveReadings["Points"] = str(state["points"]) + " / " + str(self.pointCount)
+                    clear_output(wait=True)
+                    if description.get("draw") is not None:
+                        description["draw"](data)
+                    graphs = description["liveGraphs"](data) if description.get("liveGraphs") is not None else ()
+                    showLiveReadings(liveReadings, *graphs)
+
+                scheduler.waitForNext()
+
+            if axis["rest"] is not None:
+                moveAxis(axis, axis["rest"])
+            state["passes"][level] += 1
+
+        if broadcaster is not None:
+            broadcaster.announce(1, self.columns, self.expName)
+
+        try:
+            runActions(description.get("setup", []))
+            if watchdog is not None:
+                watchdog.start()
+            runLevel(0)
+            if watchdog is not None:
+                watchdog.stop()
+            shutdown()
+        except VisaIOError:
+            if watchdog is not None:
+                watchdog.stop()
+            print("\x1b[43m IMMEDIATELY PUT ALL THE INSTRUMENTS IN A SAFE STATE \x1b[m")
+            print("Could not complete the full experiment")
+            if dataFileName is not None:
+                print("The data collected till now has been saved in", dataFileName + ".p")
+            raise
+        except:
+            if watchdog is not None:
+                watchdog.stop()
+                if watchdog.tripped.is_set():
+                    print("\x1b[;41m " + watchdog.tripReason + " \x1b[m")
+            shutdown()
+            print("\x1b[43m Could not complete the full experiment \x1b[m")
+            if dataFileName is not None:
+                print("The data collected till now has been saved in", dataFileName + ".p")
+            raise
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=False)
+
+        if description.get("onFinish") is not None:
+            description["onFinish"](data)
+        data["runInfo"] = {
+            "experiment": self.expName,
+            "parameters": dict(description.get("parameters", {})),
+            "instruments": {var: expInsts[var].get("idn", "") for var in expInsts.keys()},
+            "serials": {var: expInsts[var].get("serial", "") for var in expInsts.keys()},
+            "startTime": runStartTime,
+            "endTime": time.time(),
+            "timing": scheduler.report(),
+            "plan": {
+                "axes": [axis["name"] for axis in self.axes],
+                "notes": list(self.notes),
+                "moves": self.moves,
+                "settle": settleStats,
+            },
+        }
+        data["runInfo"].update(recoveryLog.summary())
+
+        print("Data collection completed.")
+        if dataFileName is not None:
+            clearFileAndSaveData(data, dataFileName)
+            catalogueRun(data, dataFileName + ".p")
+            print("The data collected till now has been saved in", dataFileName + ".p")
+        return data
+
+    def doExperiment(self, expInsts, **kwargs):
+        """Same as run(), so a plan can be used wherever an experiment module is expected (eg.: startExperiment())"""
+        return self.run(expInsts, **kwargs)
+
+    def start(self, expInsts, **kwargs):
+        """Run the plan on a worker thread (see background.startExperiment())
+
+        Returns
+        -------
+        background.RunHandle
+        """
+        return startExperiment(self, expInsts, **kwargs)
+
+
+def compileSweep(description):
+    """Compile a sweep description into an execution plan
+
+    Parameters
+    ----------
+    description : dict
+        Sweep description (see module description)
+
+    Returns
+    -------
+    ExecutionPlan
+
+    Example
+    -------
+    >>> plan = compileSweep(hallEffect.sweepDescription(emVolts=[5, 10], supVoltSweep=(0, 5), dataPointsPerSupSweep=20))
+    >>> plan.explain()
+    >>> data = plan.run(expInsts)
+    """
+    axesIn = description.get("axes", [])
+    readingsIn = description.get("readings", [])
+    if len(axesIn) == 0:
+        _invalidDescription("The description needs at least one axis")
+    if len(readingsIn) == 0:
+        _invalidDescription("The description needs at least one reading")
+
+    knownVars = None
+    if description.get("requiredEquipment") is not None:
+        knownVars = {inst["var"] for insts in description["requiredEquipment"].values() for inst in insts}
+
+    axes = [_normaliseAxis(axis) for axis in axesIn]
+    names = [axis["name"] for axis in axes]
+    if len(set(names)) != len(names):
+        _invalidDescription("Axis names must be unique")
+    notes = []
+
+    groupBy = description.get("groupBy")
+    if groupBy is not None and (groupBy not in names or axes[names.index(groupBy)]["values"] is None):
+        _invalidDescription("'groupBy' must be the name of an axis with 'values'")
+
+    if description.get("order", "auto") == "auto":
+        ordered = sorted(axes, key=lambda axis: (axis["name"] != groupBy, axis["duration"] is not None,
+                                                 -axis["moveTime"]))
+        if [axis["name"] for axis in ordered] != names:
+            notes.append("Axes reordered to " + " > ".join(axis["name"] for axis in ordered)
+                         + " so the slowest actuators move the least")
+        axes = ordered
+    for axis in axes[:-1]:
+        if axis["duration"] is not None:
+            _invalidDescription("Only the innermost axis can have a 'duration'")
+
+    axisNames = [axis["name"] for axis in axes]
+    limits = list(description.get("limits", []))
+    watchedNames = {limit["reading"] for limit in limits if limit.get("watch") is not None and "max" in limit}
+
+    levels = [[] for _ in axes]
+    watchSources = {}
+    readingNames = []
+    uncertaintyNames = []
+    for reading in readingsIn:
+        targetNames = list(reading["names"]) if "names" in reading else [reading.get("name")]
+        if None in targetNames or "inst" not in reading:
+            _invalidDescription("Every reading needs a 'name' (or 'names') and an 'inst'")
+        if knownVars is not None and reading["inst"] not in knownVars:
+            _invalidDescription("Reading '" + targetNames[0] + "' uses '" + reading["inst"]
+                                + "', which is not in requiredEquipment")
+        every = reading.get("every")
+        if every is not None and every not in axisNames:
+            _invalidDescription("Reading '" + targetNames[0] + "' is taken every '" + str(every)
+                                + "', which is not an axis")
+        level = axisNames.index(every) if every is not None else len(axes) - 1
+        if every is not None and level < len(axes) - 1:
+            notes.append(", ".join(targetNames) + " read once per " + every + " step instead of every point")
+        query = reading.get("query", "READ?")
+        samples = int(reading.get("samples", 1))
+        parse = reading.get("parse", parseQueryReading)
+        watched = len(targetNames) == 1 and targetNames[0] in watchedNames and samples == 1
+        for index, name in enumerate(targetNames):
+            if name in watchedNames:
+                watchSources[name] = {"inst": reading["inst"], "query": query, "parse": parse,
+                                      "index": index if "names" in reading else None}
+                if not watched:
+                    notes.append(name + " checked by the safety watchdog with single readings, the values stored are "
+                                 "queried directly")
+
+        shared = None
+        for existing in levels[level]:
+            if existing["inst"] == reading["inst"] and existing["query"] == query and existing["samples"] == samples \
+                    and not existing["watched"] and not watched:
+                shared = existing
+        if shared is None:
+            shared = {"inst": reading["inst"], "query": query, "samples": samples, "targets": [], "parse": [],
+                      "index": [], "watched": watched}
+            levels[level].append(shared)
+        elif len(shared["targets"]) > 0:
+            notes.append(", ".join(targetNames) + " share the '" + query + "' query of " + ", ".join(shared["targets"]))
+        for index, name in enumerate(targetNames):
+            shared["targets"].append(name)
+            shared["parse"].append(parse)
+            shared["index"].append(index if "names" in reading else None)
+        readingNames += targetNames
+        if reading.get("uncertainty", False):
+            uncertaintyNames += [name + "Err" for name in targetNames]
+        if watched:
+            notes.append(targetNames[0] + " taken from the safety watchdog readings")
+
+    if len(set(readingNames)) != len(readingNames) or set(readingNames) & set(axisNames):
+        _invalidDescription("Reading names must be unique and differ from the axis names")
+    for limit in limits:
+        if limit.get("reading") not in readingNames:
+            _invalidDescription("Limit on unknown reading '" + str(limit.get("reading")) + "'")
+    limits = [dict(limit, source=watchSources[limit["reading"]]) if limit["reading"] in watchedNames else limit
+              for limit in limits]
+    for axis in axes:
+        if isinstance(axis["settle"], dict) and axis["settle"].get("reading") not in readingNames:
+            _invalidDescription("Settle rule of axis '" + axis["name"] + "' uses an unknown reading")
+
+    pointVars = {query["inst"] for query in levels[-1] if not query["watched"]}
+    if description.get("parallelReads", True) and len(pointVars) > 1:
+        notes.append("Readings from " + ", ".join(sorted(pointVars)) + " taken in parallel")
+
+    axisColumns = [axis["name"] for axis in axes if axis["hasColumn"]]
+    columns = axisColumns + readingNames + ["time", "actualTime"] + uncertaintyNames
+    groupColumns = None
+    if groupBy is not None:
+        groupLevelNames = [name for query in levels[0] for name in query["targets"]]
+        groupColumns = [column for column in columns if column != groupBy and column not in groupLevelNames
+                        and column[:-3] not in groupLevelNames]
+
+    return ExecutionPlan(description, axes, levels, limits, columns, groupColumns, notes)
+
+
+def runSweep(description, expInsts, **kwargs):
+    """Compile a sweep description and run it (see ExecutionPlan.run() for the keyword arguments)"""
+    return compileSweep(description).run(expInsts, **kwargs)
+
+
+def checkBuiltInDescriptions(samplesPerPoint=(1, 3)):
+    """Compile the sweep descriptions of the built-in experiments with every option that changes the plan
+
+    Used before soak tests with the 'sweepPlan' engine (see soak), so a description which no longer compiles fails
+    straight away instead of after the instruments have been set up.
+
+    Parameters
+    ----------
+    samplesPerPoint : iterable of int, default=(1, 3)
+        Values of samplesPerPoint compiled
+
+    Returns
+    -------
+    list of ExecutionPlan
+        Compiled plans
+
+    Raises
+    ------
+    ValueError
+        If a description does not compile
+    """
+    from .experiments import curieWeiss, hallEffect
+
+    plans = []
+    for samples in samplesPerPoint:
+        plans.append(compileSweep(hallEffect.sweepDescription(emVolts=[5, 10], supVoltSweep=(0, 5),
+                                                              dataPointsPerSupSweep=20, samplesPerPoint=samples)))
+        plans.append(compileSweep(curieWeiss.sweepDescription(exptLength=1, samplesPerPoint=samples)))
+    return plans
@@ -0,0 +1,298 @@
+"""
+HallPy_Teach.trace: recording and replaying instrument traffic
+==============================================================
+
+Description
+-----------
+TraceRecorder logs every write, read and query sent to the instruments, with the response, the time it took and any
+VISA error, to a compact trace file (gzip compressed, one JSON array per line). Sessions are recorded by opening them
+through a RecordingResourceManager (eg.: `initInstruments(resourceManager=recorder.resourceManager())`) or by wrapping
+the instruments of an experiment with recordExpInsts().
+
+ReplayResourceManager serves the recorded responses back, with the recorded timing scaled by `timeScale` (0 replays
+without waiting), so a run can be executed again without instruments and the library's own overhead can be profiled.
+Responses are matched by resource, operation and command, in the order they were recorded, so commands sent from
+several threads (eg.: the safety watchdog) may interleave differently on replay.
+
+Trace file layout:
+    line 1 : {"format": "HallPy_Teach trace", "version": 1, "resources": [...]}
+    line n : [time, resource, operation, command, response, duration, error]
+
+See Also
+--------
++ TraceRecorder
++ RecordingSession
++ RecordingResourceManager
++ recordExpInsts(*args)
++ ReplayResourceManager
+
+"""
+import gzip
+import json
+import threading
+import time
+
+import pyvisa
+from pyvisa import VisaIOError
+
+traceFormat = "HallPy_Teach trace"
+
+
+class TraceRecorder:
+    """Thread safe log of instrument traffic
+
+    Parameters
+    ----------
+    fileName : str, optional
+        Name of the trace file written by save() (the '.trace.gz' extension is added if missing)
+
+    Example
+    -------
+    >>> recorder = TraceRecorder("bench3")
+    >>> instruments = hp.initInstruments(resourceManager=recorder.resourceManager())
+    >>> ...                                       # set up and run the experiment as usual
+    >>> recorder.save()
+    """
+
+    def __init__(self, fileName=None):
+        if fileName is not None and not fileName.endswith(".trace.gz"):
+            fileName = fileName + ".trace.gz"
+        self.fileName = fileName
+        self.resources = []
+        self.events = []
+        self._lock = threading.Lock()
+        self._startTime = time.perf_counter()
+
+    def resourceManager(self, resourceManager=None):
+        """RecordingResourceManager recording into this recorder (wraps a new pyvisa.ResourceManager by default)"""
+        return RecordingResourceManager(resourceManager, self)
+
+    def wrap(self, session, name):
+        """Wrap a PyVisa instrument object in a RecordingSession logging to this recorder"""
+        return RecordingSession(session, self, name)
+
+    def add(self, name, operation, command, response, duration, error=None):
+        event = [time.perf_counter() - self._startTime - duration, name, operation, command, response, duration, error]
+        with self._lock:
+            self.events.append(event)
+
+    def save(self, fileName=None):
+        """Write the trace file
+
+        Parameters
+        ----------
+        fileName : str, optional
+            Name of the trace file. Defaults to the name given to the recorder.
+
+        Returns
+        -------
+        str
+            Name of the written trace file
+        """
+        if fileName is None:
+            fileName = self.fileName
+        if fileName is None:
+            raise ValueError("No file name given for the trace file")
+        if not fileName.endswith(".trace.gz"):
+            fileName = fileName + ".trace.gz"
+        with self._lock:
+            events = list(self.events)
+        with gzip.open(fileName, "wt", encoding="utf-8") as traceFile:
+            traceFile.write(json.dumps({"format": traceFormat, "version": 1, "resources": self.resources}) + "\n")
+            for event in events:
+                traceFile.write(json.dumps(event, separators=(",", ":")) + "\n")
+        return fileName
+
+
+class RecordingSession:
+    """PyVisa instrument object wrapper which logs its traffic to a TraceRecorder
+
+    Parameters
+    ----------
+    session : object
+        PyVisa instrument object
+    recorder : TraceRecorder
+        Recorder to log to
+    name : str
+        Name of the instrument in the trace (the VISA resource name for sessions opened by RecordingResourceManager)
+    """
+
+    def __init__(self, session, recorder, name):
+        self.session = session
+        self.recorder = recorder
+        self.name = name
+
+    @property
+    def wrappedSession(self):
+        return self.session
+
+    def write(self, *args, **kwargs):
+        return self._call("write", args, kwargs)
+
+    def read(self, *args, **kwargs):
+        return self._call("read", args, kwargs)
+
+    def query(self, *args, **kwargs):
+        return self._call("query", args, kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.session, name)
+
+    def _call(self, operation, args, kwargs):
+        command = str(args[0]) if len(args) > 0 and operation != "read" else ""
+        callStart = time.perf_counter()
+        try:
+            response = getattr(self.session, operation)(*args, **kwargs)
+        except VisaIOError as err:
+            self.recorder.add(self.name, operation, command, None, time.perf_counter() - callStart, err.error_code)
+            raise
+        self.recorder.add(self.name, operation, command, response if operation != "write" else None,
+                          time.perf_counter() - callStart)
+        return response
+
+
+class RecordingResourceManager:
+    """Resource manager wrapper opening RecordingSessions
+
+    Parameters
+    ----------
+    resourceManager : pyvisa.ResourceManager, optional
+        Resource manager to wrap. A new one is created if not provided.
+    recorder : TraceRecorder
+        Recorder to log to
+    """
+
+    def __init__(self, resourceManager, recorder):
+        self.resourceManager = resourceManager if resourceManager is not None else pyvisa.ResourceManager()
+        self.recorder = recorder
+
+    def list_resources(self, *args, **kwargs):
+        resources = self.resourceManager.list_resources(*args, **kwargs)
+        for resName in resources:
+            if resName not in self.recorder.resources:
+                self.recorder.resources.append(resName)
+        return resources
+
+    def open_resource(self, resName, *args, **kwargs):
+        return RecordingSession(self.resourceManager.open_resource(resName, *args, **kwargs), self.recorder, resName)
+
+    def __getattr__(self, name):
+        return getattr(self.resourceManager, name)
+
+
+def recordExpInsts(expInsts, recorder):
+    """Record the traffic of the instruments of an experiment
+
+    Parameters
+    ----------
+    expInsts : object
+        Object returned by the experiment's setup() function. The 'res' of every instrument is replaced with a
+        RecordingSession named after its 'var' name.
+    recorder : TraceRecorder
+        Recorder to log to
+
+    Returns
+    -------
+    object
+        expInsts
+    """
+    for var in expInsts.keys():
+        if not isinstance(expInsts[var]["res"], RecordingSession):
+            expInsts[var]["res"] = recorder.wrap(expInsts[var]["res"], var)
+    return expInsts
+
+
+class ReplaySession:
+    """Instrument object serving recorded responses (see ReplayResourceManager)"""
+
+    def __init__(self, replay, name):
+        self.replay = replay
+        self.name = name
+        self.resource_name = name
+        self.timeout = 2000
+
+    def write(self, command, *args, **kwargs):
+        self.replay.serve(self.name, "write", str(command))
+        return len(str(command))
+
+    def read(self, *args, **kwargs):
+        return self.replay.serve(self.name, "read", "")
+
+    def query(self, command, *args, **kwargs):
+        return self.replay.serve(self.name, "query", str(command))
+
+    def close(self):
+        pass
+
+
+class ReplayResourceManager:
+    """Resource manager serving the responses of a trace file
+
+    Parameters
+    ----------
+    traceFileName : str
+        Name of a trace file written by TraceRecorder.save()
+    timeScale : float, default=1.0
+        Factor the recorded duration of every command is multiplied by (0 does not wait at all)
+
+    Example
+    -------
+    >>> rm = ReplayResourceManager("bench3.trace.gz", timeScale=0)
+    >>> instruments = hp.initInstruments(resourceManager=rm, lanDiscovery=False)
+    >>> ...                                       # run the experiment with the same arguments as the recorded run
+    >>> rm.unusedEvents()
+    """
+
+    def __init__(self, traceFileName, timeScale=1.0):
+        self.timeScale = timeScale
+        self._lock = threading.Lock()
+        self._queues = {}
+        with gzip.open(traceFileName, "rt", encoding="utf-8") as traceFile:
+            header = json.loads(traceFile.readline())
+            if header.get("format") != traceFormat:
+                raise ValueError("'" + traceFileName + "' is not a HallPy_Teach trace file")
+            self.resources = header["resources"]
+            for line in traceFile:
+                recordedTime, name, operation, command, response, duration, error = json.loads(line)
+                self._queues.setdefault((name, operation, command), []).append((response, duration, error))
+        self._positions = {key: 0 for key in self._queues.keys()}
+
+    def list_resources(self, *args, **kwargs):
+        return tuple(self.resources)
+
+    def open_resource(self, resName, *args, **kwargs):
+        if resName not in self.resources and not any(key[0] == resName for key in self._queues.keys()):
+            raise VisaIOError(pyvisa.constants.StatusCode.error_resource_not_found)
+        return ReplaySession(self, resName)
+
+    def close(self):
+        pass
+
+    def serve(self, name, operation, command):
+        """Next recorded response to a command
+
+        Raises
+        ------
+        ValueError
+            If the command was not recorded (as often) for the resource
+        VisaIOError
+            If the recorded command failed
+        """
+        key = (name, operation, command)
+        with self._lock:
+            position = self._positions.get(key, 0)
+            if key not in self._queues or position >= len(self._queues[key]):
+                raise ValueError("No recorded response left for " + operation + " '" + command + "' on " + name)
+            self._positions[key] = position + 1
+            response, duration, error = self._queues[key][position]
+        if self.timeScale:
+            time.sleep(duration * self.timeScale)
+        if error is not None:
+            raise VisaIOError(error)
+        return response
+
+    def unusedEvents(self):
+        """Number of recorded commands which were not replayed, per (resource, operation, command)"""
+        with self._lock:
+            return {key: len(queue) - self._positions[key] for key, queue in self._queues.items()
+                    if len(queue) > self._positions[key]}